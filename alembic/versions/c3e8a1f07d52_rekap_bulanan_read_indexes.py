@@ -0,0 +1,88 @@
+"""rekap_bulanan indexes for the read paths, optional partitioning by tahun
+
+Revision ID: c3e8a1f07d52
+Revises: d1f9a7c34b2e
+Create Date: 2026-10-19 00:00:00.000000
+
+Indexes:
+- ix_rekap_bulanan_periode_instansi (tahun, bulan, instansi_id, karyawan_id):
+  /rekap_kehadiran with bulan, in its ORDER BY instansi_id, karyawan_id; also
+  the per-partition refresh of rekap_rollup.
+- ix_rekap_bulanan_tahun_instansi (tahun, instansi_id, karyawan_id, bulan):
+  /rekap_kehadiran for a whole year, in the same order.
+- ix_rekap_bulanan_tahun_karyawan_tk (tahun, karyawan_id, bulan, tanpa_keterangan):
+  covers analisis_kehadiran (tahun = y AND bulan < m, SUM per karyawan).
+
+On MySQL, set REKAP_PARTITION_BY_TAHUN=1 to also partition rekap_bulanan by
+RANGE (tahun), one partition per year from REKAP_PARTITION_FROM (default
+2020) to next year plus a catch-all. The primary key contains tahun, so the
+table qualifies. Rebuilding a large table takes a while; run it in a
+maintenance window.
+"""
+
+import datetime
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8a1f07d52'
+down_revision = 'd1f9a7c34b2e'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'ix_rekap_bulanan_periode_instansi': ['tahun', 'bulan', 'instansi_id', 'karyawan_id'],
+    'ix_rekap_bulanan_tahun_instansi': ['tahun', 'instansi_id', 'karyawan_id', 'bulan'],
+    'ix_rekap_bulanan_tahun_karyawan_tk': ['tahun', 'karyawan_id', 'bulan', 'tanpa_keterangan'],
+}
+
+
+def _rekap_exists() -> bool:
+    # rekap_bulanan is created by init_db(); on a fresh database it gets the
+    # indexes from the model instead
+    return sa.inspect(op.get_bind()).has_table('rekap_bulanan')
+
+
+def _existing_indexes() -> set:
+    return {ix['name'] for ix in sa.inspect(op.get_bind()).get_indexes('rekap_bulanan')}
+
+
+def _partition_ddl() -> str:
+    first = int(os.getenv('REKAP_PARTITION_FROM', 2020))
+    last = datetime.date.today().year + 1
+    parts = [f"PARTITION p{year} VALUES LESS THAN ({year + 1})" for year in range(first, last + 1)]
+    parts.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return "ALTER TABLE rekap_bulanan PARTITION BY RANGE (tahun) (" + ", ".join(parts) + ")"
+
+
+def _is_partitioned() -> bool:
+    return bool(op.get_bind().execute(sa.text(
+        "SELECT COUNT(*) FROM information_schema.partitions "
+        "WHERE table_schema = DATABASE() AND table_name = 'rekap_bulanan' AND partition_name IS NOT NULL"
+    )).scalar())
+
+
+def upgrade() -> None:
+    if not _rekap_exists():
+        return
+    existing = _existing_indexes()
+    for name, columns in INDEXES.items():
+        if name not in existing:
+            op.create_index(name, 'rekap_bulanan', columns, unique=False)
+
+    partition = os.getenv('REKAP_PARTITION_BY_TAHUN', 'false').lower() in ('1', 'true', 'yes')
+    if partition and op.get_bind().dialect.name == 'mysql' and not _is_partitioned():
+        op.execute(_partition_ddl())
+
+
+def downgrade() -> None:
+    if not _rekap_exists():
+        return
+    if op.get_bind().dialect.name == 'mysql' and _is_partitioned():
+        op.execute("ALTER TABLE rekap_bulanan REMOVE PARTITIONING")
+    existing = _existing_indexes()
+    for name in INDEXES:
+        if name in existing:
+            op.drop_index(name, table_name='rekap_bulanan')
@@ -0,0 +1,36 @@
+"""rekap_tk_kumulatif_tahun coverage marker, backfill of rekap_tk_kumulatif
+
+Revision ID: f2a6d8c41b93
+Revises: c3e8a1f07d52
+Create Date: 2026-10-19 00:00:00.000000
+
+/analisis_kehadiran answers from rekap_tk_kumulatif only for the years listed
+in rekap_tk_kumulatif_tahun. This revision creates both tables when missing
+and backfills the running totals of every year already in rekap_bulanan
+(app/kumulatif.py: rebuild_tk_kumulatif), which lists those years.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'f2a6d8c41b93'
+down_revision = 'c3e8a1f07d52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    from app import models
+    from app.kumulatif import rebuild_tk_kumulatif
+
+    bind = op.get_bind()
+    models.RekapTkKumulatifModel.__table__.create(bind, checkfirst=True)
+    models.RekapTkKumulatifTahunModel.__table__.create(bind, checkfirst=True)
+    if sa.inspect(bind).has_table('rekap_bulanan'):
+        rebuild_tk_kumulatif(bind)
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('rekap_tk_kumulatif_tahun'):
+        op.drop_table('rekap_tk_kumulatif_tahun')
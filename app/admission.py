@@ -0,0 +1,106 @@
+"""Admission control for the heavy pipeline endpoints.
+
+`/rekap`, `/rekap_tahunan` and `/data_local_db_engine` run long, blocking
+pipelines (remote DB, SSH tunnels, pandas). Left alone, a handful of them
+fill FastAPI's shared threadpool and the whole API stops answering.
+
+An `AdmissionLane` caps how many heavy calls run at once, keeps a bounded
+wait queue in front of them and runs the admitted work on its own executor,
+so the default threadpool and the event loop (which serve the cheap read
+endpoints) are never taken by heavy work. When the queue is full, callers
+get a fast 429; when they waited too long in the queue, a 503. Both carry a
+`Retry-After` header.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable
+
+from fastapi import HTTPException
+
+
+class AdmissionLane:
+    """Concurrency limiter with a bounded wait queue and a dedicated executor."""
+
+    def __init__(self, name: str, max_concurrent: int = 2, max_queue: int = 4, queue_timeout: float = 30.0, retry_after: int = 30):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be >= 1")
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix=f"{name}-lane")
+
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str) -> "AdmissionLane":
+        """Build a lane from `{prefix}_MAX_CONCURRENT`, `_MAX_QUEUE`, `_QUEUE_TIMEOUT` and `_RETRY_AFTER`."""
+        return cls(
+            name,
+            max_concurrent=int(os.getenv(f"{prefix}_MAX_CONCURRENT", 2)),
+            max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", 4)),
+            queue_timeout=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT", 30)),
+            retry_after=int(os.getenv(f"{prefix}_RETRY_AFTER", 30)),
+        )
+
+    def _reject(self, status_code: int, detail: str) -> HTTPException:
+        return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(self.retry_after)})
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one execution slot; raise 429 (queue full) or 503 (queue timeout)."""
+        if self.active + self.waiting >= self.max_concurrent + self.max_queue:
+            self.rejected += 1
+            raise self._reject(429, f"Server sibuk: antrian {self.name} penuh, coba lagi nanti.")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise self._reject(503, f"Server sibuk: waktu tunggu antrian {self.name} habis, coba lagi nanti.")
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking callable on this lane's executor (call inside `slot()`)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+__all__ = ["AdmissionLane"]
@@ -3,8 +3,12 @@ from typing import List, Dict, Optional
 
 import pandas as pd
 import pymysql
-from sqlalchemy import text
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
 from .analytics import get_engine
+from .kumulatif import has_tk_kumulatif_select, tk_kumulatif_select
 
 def analisis_kehadiran(year: int, month: int, minimum_tk: int = 3) -> List[Dict]:
     """
@@ -19,6 +23,19 @@ def analisis_kehadiran(year: int, month: int, minimum_tk: int = 3) -> List[Dict]
         db=os.getenv('DB_NAME_LOCAL', 'bkd_presensi')
     )
 
+    # materialized running totals when they cover the year (app/kumulatif.py)
+    with local_db_connection.cursor() as cursor:
+        try:
+            cursor.execute("SELECT 1 FROM bkd_presensi.rekap_tk_kumulatif_tahun WHERE tahun = %s", [year])
+            materialized = cursor.fetchone() is not None
+        except pymysql.err.ProgrammingError:
+            # the coverage table does not exist yet (migration not run)
+            materialized = False
+    if materialized:
+        df = pd.read_sql("SELECT a.karyawan_id, a1.nip, a1.name as nama_pegawai, a.tahun, a.tk_kumulatif as TK FROM bkd_presensi.rekap_tk_kumulatif a LEFT JOIN bkd_presensi.presensi_karyawan a1 ON a.karyawan_id = a1.id WHERE a.tahun = %s AND a.bulan = %s AND a.tk_kumulatif > %s ORDER BY a.karyawan_id", local_db_connection, params=[year, month - 1, minimum_tk])
+        local_db_connection.close()
+        return df.to_dict(orient="records")
+
     df = pd.read_sql("SELECT a.karyawan_id, a1.nip, a1.name as nama_pegawai, a.tahun, sum(a.tanpa_keterangan) as TK FROM bkd_presensi.rekap_bulanan a LEFT JOIN bkd_presensi.presensi_karyawan a1 ON a.karyawan_id = a1.id WHERE 1 AND a.tahun = %s AND a.bulan < %s GROUP BY a.karyawan_id, a.tahun HAVING TK > %s", local_db_connection, params=[year, month, minimum_tk])
     # try:
     #     df = pd.read_sql(sql, local_db_connection, params={"year": year, "month": month})
@@ -30,4 +47,45 @@ def analisis_kehadiran(year: int, month: int, minimum_tk: int = 3) -> List[Dict]
     #         return rows
 
     # convert dataframe to list of dict
-    return df.to_dict(orient="records")
\ No newline at end of file
+    return df.to_dict(orient="records")
+
+
+def analisis_kehadiran_select(year: int, month: int, minimum_tk: int = 3):
+    """Core version of the `analisis_kehadiran` query (portable, no schema prefix)."""
+    rekap = models.RekapKehadiranModel.__table__
+    karyawan = models.PresensIKaryawanModel.__table__
+    tk = func.sum(rekap.c.tanpa_keterangan)
+    return (
+        select(
+            rekap.c.karyawan_id,
+            karyawan.c.nip,
+            karyawan.c.name.label("nama_pegawai"),
+            rekap.c.tahun,
+            tk.label("TK"),
+        )
+        .select_from(rekap.outerjoin(karyawan, rekap.c.karyawan_id == karyawan.c.id))
+        .where(rekap.c.tahun == year, rekap.c.bulan < month)
+        .group_by(rekap.c.karyawan_id, rekap.c.tahun, karyawan.c.nip, karyawan.c.name)
+        .having(tk > minimum_tk)
+        .order_by(rekap.c.karyawan_id)
+    )
+
+
+async def analisis_kehadiran_async(db: AsyncSession, year: int, month: int, minimum_tk: int = 3) -> List[Dict]:
+    """Async variant of `analisis_kehadiran` for the API, using the async session.
+
+    Reads from the app database (DATABASE_URL), the same one
+    `/rekap_kehadiran` reads from: `rekap_tk_kumulatif` when
+    `rekap_tk_kumulatif_tahun` lists the year as covered, `rekap_bulanan`
+    otherwise.
+    """
+    # one indexed range lookup on the running totals when they cover the year,
+    # the GROUP BY over rekap_bulanan otherwise (e.g. before a backfill)
+    materialized = (await db.execute(has_tk_kumulatif_select(year))).first() is not None
+    stmt = tk_kumulatif_select(year, month, minimum_tk) if materialized else analisis_kehadiran_select(year, month, minimum_tk)
+    result = await db.execute(stmt)
+    rows = [dict(r._mapping) for r in result]
+    for row in rows:
+        # MySQL returns SUM() as Decimal
+        row["TK"] = int(row["TK"])
+    return rows
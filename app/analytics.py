@@ -9,13 +9,28 @@ and a few small helpers for the example `items` and `users` models in this repo.
 """
 from __future__ import annotations
 
+import gzip
 import os
+import time
 from typing import Optional
 
 import pandas as pd
 from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
 
+from .readers import get_reader
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
 def get_engine(database_url: Optional[str] = None, **engine_kwargs) -> Engine:
     """Create and return a SQLAlchemy engine.
 
@@ -34,16 +49,19 @@ def get_engine(database_url: Optional[str] = None, **engine_kwargs) -> Engine:
     return engine
 
 
-def query_to_df(sql: str, engine: Optional[Engine] = None, database_url: Optional[str] = None, **pd_read_sql_kwargs) -> pd.DataFrame:
+def query_to_df(sql: str, engine: Optional[Engine] = None, database_url: Optional[str] = None, reader: Optional[str] = None,
+                **pd_read_sql_kwargs) -> pd.DataFrame:
     """Execute a SQL string and return a pandas DataFrame.
 
     Either `engine` or `database_url` (or env `DATABASE_URL`) will be used.
-    Any kwargs are forwarded to `pandas.read_sql_query`.
+    `reader` picks the reader backend (default env `READER_BACKEND`, see
+    `app/readers.py`). Any kwargs are forwarded to the reader; the pandas
+    backend passes them to `pandas.read_sql_query`.
     """
     if engine is None:
         engine = get_engine(database_url)
     with engine.connect() as conn:
-        df = pd.read_sql_query(sql, conn, **pd_read_sql_kwargs)
+        df = get_reader(reader).read(sql, conn, **pd_read_sql_kwargs)
     return df
 
 
@@ -82,37 +100,141 @@ def items_summary(engine: Optional[Engine] = None) -> pd.DataFrame:
     return result
 
 
-def query_to_df_chunks(sql: str, engine: Optional[Engine] = None, database_url: Optional[str] = None, chunksize: int = 10000, **pd_read_sql_kwargs):
+def query_to_df_chunks(sql: str, engine: Optional[Engine] = None, database_url: Optional[str] = None, chunksize: int = 10000,
+                       reader: Optional[str] = None, **pd_read_sql_kwargs):
     """Yield DataFrame chunks from a SQL query.
 
     Use this for tables that are too large to fit in memory. This returns an
     iterator of pandas DataFrame objects; each chunk will contain up to
-    `chunksize` rows.
+    `chunksize` rows. `reader` picks the reader backend as in `query_to_df`.
     """
     if engine is None:
         engine = get_engine(database_url)
 
     conn = engine.connect()
     try:
-        iterator = pd.read_sql_query(sql, conn, chunksize=chunksize, **pd_read_sql_kwargs)
+        iterator = get_reader(reader).read(sql, conn, chunksize=chunksize, **pd_read_sql_kwargs)
         for chunk in iterator:
             yield chunk
     finally:
         conn.close()
 
 
-def to_csv_chunked(sql: str, csv_path: str, engine: Optional[Engine] = None, database_url: Optional[str] = None, chunksize: int = 10000, **pd_read_sql_kwargs):
+def _csv_compression(csv_path: str, compression: Optional[str]) -> Optional[str]:
+    if compression != "infer":
+        if compression not in (None, "gzip", "zstd"):
+            raise ValueError("compression must be None, 'infer', 'gzip' or 'zstd'")
+        return compression
+    suffix = os.path.splitext(str(csv_path))[1].lower()
+    return {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}.get(suffix)
+
+
+def _open_csv_output(path: str, compression: Optional[str], compresslevel: Optional[int]):
+    """Binary write handle for `path`, compressing with gzip or zstd if asked."""
+    if compression == "gzip":
+        return gzip.open(path, "wb", compresslevel=6 if compresslevel is None else compresslevel)
+    if compression == "zstd":
+        if zstandard is not None:
+            raw = open(path, "wb")
+            return zstandard.ZstdCompressor(level=3 if compresslevel is None else compresslevel).stream_writer(raw, closefd=True)
+        if pa is not None:
+            # pyarrow's codec (default level) when `zstandard` is not installed
+            return pa.CompressedOutputStream(path, "zstd")
+        raise RuntimeError("zstd output needs the `zstandard` or `pyarrow` package")
+    return open(path, "wb")
+
+
+def export_csv_chunked(sql: str, csv_path: str, engine: Optional[Engine] = None, database_url: Optional[str] = None,
+                       chunksize: int = 10000, compression: Optional[str] = "infer", compresslevel: Optional[int] = None,
+                       max_in_flight: int = 2, **pd_read_sql_kwargs) -> dict:
+    """Stream a query into one (optionally compressed) CSV file and return export stats.
+
+    Chunks are fetched on one thread and formatted to CSV bytes on another
+    while the calling thread compresses and writes the previous chunk to a
+    single open handle (`etl.run_pipeline`). `compression="infer"` picks gzip
+    for `.gz` and zstd for `.zst` paths. The file is written next to
+    `csv_path` under a temporary name and moved into place when complete, so
+    a failed export never leaves a truncated file behind.
+
+    Returns rows, chunks, bytes of CSV text (`bytes_raw`), bytes on disk
+    (`bytes_written`), the compression used, wall seconds and per-stage
+    counters.
+    """
+    from .etl import run_pipeline
+
+    compression = _csv_compression(csv_path, compression)
+    header = [True]
+
+    def format_chunk(chunk: pd.DataFrame):
+        data = chunk.to_csv(index=False, header=header[0]).encode("utf-8")
+        header[0] = False
+        return len(chunk), data
+
+    totals = {"rows": 0, "chunks": 0, "bytes_raw": 0}
+    directory, name = os.path.split(os.path.abspath(csv_path))
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    started = time.perf_counter()
+    try:
+        with _open_csv_output(tmp_path, compression, compresslevel) as out:
+            def write_chunk(item) -> int:
+                rows, data = item
+                out.write(data)
+                totals["rows"] += rows
+                totals["chunks"] += 1
+                totals["bytes_raw"] += len(data)
+                return rows
+
+            chunks = query_to_df_chunks(sql, engine=engine, database_url=database_url, chunksize=chunksize, **pd_read_sql_kwargs)
+            stages = run_pipeline(chunks, format_chunk, write_chunk, max_in_flight=max_in_flight)
+        os.replace(tmp_path, csv_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return {
+        "path": csv_path,
+        **totals,
+        "bytes_written": os.path.getsize(csv_path),
+        "compression": compression,
+        "seconds": round(time.perf_counter() - started, 3),
+        "stages": stages,
+    }
+
+
+def to_csv_chunked(sql: str, csv_path: str, engine: Optional[Engine] = None, database_url: Optional[str] = None, chunksize: int = 10000, **kwargs):
     """Execute a query and write results to CSV in chunks.
 
-    This writes the first chunk with header and then appends subsequent chunks
-    without header; useful to export very large tables without loading them
-    fully into memory.
+    The first chunk carries the header; later chunks are appended to the same
+    open file, so very large tables export without being loaded fully into
+    memory. `.gz`/`.zst` paths are compressed (see `export_csv_chunked`,
+    which also reports bytes and rows written).
     """
-    first = True
-    for chunk in query_to_df_chunks(sql, engine=engine, database_url=database_url, chunksize=chunksize, **pd_read_sql_kwargs):
-        if first:
-            chunk.to_csv(csv_path, index=False, mode="w")
-            first = False
-        else:
-            chunk.to_csv(csv_path, index=False, mode="a", header=False)
+    export_csv_chunked(sql, csv_path, engine=engine, database_url=database_url, chunksize=chunksize, **kwargs)
     return csv_path
+
+
+def read_parquet_lake(root: str, dataset: str, *, instansi_id=None, tahun=None, bulan=None, columns=None, filters=None) -> pd.DataFrame:
+    """Load a partitioned Parquet dataset written by `app.lake` into a DataFrame.
+
+    `instansi_id`, `tahun` and `bulan` take a value or a list of values and
+    select partition directories by path, so other partitions are never
+    opened. `columns` limits the columns read. `filters` is a pyarrow
+    expression (e.g. `pyarrow.dataset.field("karyawan_id") == 5`) that is
+    pushed down to row-group statistics.
+    """
+    import glob
+
+    import pyarrow.dataset as ds
+
+    base = os.path.join(root, dataset)
+    patterns = [base]
+    for name, wanted in (("instansi_id", instansi_id), ("tahun", tahun), ("bulan", bulan)):
+        values = ["*"] if wanted is None else [str(v) for v in (wanted if isinstance(wanted, (list, tuple, set)) else [wanted])]
+        patterns = [os.path.join(p, f"{name}={v}") for p in patterns for v in values]
+    files = sorted({f for p in patterns for f in glob.glob(os.path.join(p, "part-*.parquet"))})
+    if not files:
+        return pd.DataFrame(columns=list(columns) if columns else None)
+
+    dataset_ = ds.dataset(files, format="parquet", partitioning="hive", partition_base_dir=base)
+    return dataset_.to_table(columns=columns, filter=filters).to_pandas()
@@ -0,0 +1,231 @@
+"""Vectorized scan of check-ins and the daily laporan for suspicious patterns.
+
+Three rules, each a handful of sort/group operations over whole columns (no
+per-row Python), so a year of check-ins for every instansi is scanned in
+minutes:
+
+- `kirim_kembar`: the same `tanggal_kirim` timestamp sent by more than one
+  karyawan of an instansi. The check-ins are sorted by (instansi, timestamp,
+  karyawan), and runs of one timestamp that span two or more karyawan are
+  flagged. `nilai` is the number of karyawan sharing the timestamp.
+- `lokasi_mustahil`: two consecutive check-ins of one karyawan that are
+  further apart than `min_jarak_km` and would need more than `max_kecepatan_kmh`
+  to travel (haversine over `lat`/`long`). The later check-in is flagged;
+  `nilai` is the distance in km.
+- `selalu_tepat_waktu`: karyawan whose check-in lands in the last
+  `toleransi_detik` seconds before `jadwal_masuk` on at least `min_rasio` of
+  at least `min_hari` working days. One row per karyawan; `nilai` is the ratio.
+
+`scan_anomali` returns one DataFrame of flagged rows (`ANOMALI_COLUMNS`).
+`simpan_anomali` replaces the flags of the scanned period in the local
+`presensi_anomali` table. `scripts/scan_anomali.py` runs the nightly scan of
+the check-in rules over the ETL'd local `presensi_kehadiran`, and
+`run_rekap(..., scan_anomali=True)` runs every rule on the check-ins and
+laporan of one rekap run.
+"""
+from __future__ import annotations
+
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete
+from sqlalchemy.engine import Connection
+
+from . import models
+from .bulkload import get_loader
+
+ANOMALI_COLUMNS = ["jenis_anomali", "karyawan_id", "instansi_id", "tanggal", "waktu", "nilai", "keterangan"]
+EARTH_RADIUS_KM = 6371.0088
+# rules that need only check-ins (no laporan)
+CHECKIN_RULES = ("kirim_kembar", "lokasi_mustahil")
+
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame(columns=ANOMALI_COLUMNS)
+
+
+def _ns(values: pd.Series) -> np.ndarray:
+    """Timestamps as int64 nanoseconds (NaT stays the int64 minimum)."""
+    return pd.to_datetime(values, errors="coerce").astype("datetime64[ns]").to_numpy().view(np.int64)
+
+
+def _flags(jenis: str, karyawan, instansi, waktu, nilai, keterangan) -> pd.DataFrame:
+    waktu = pd.to_datetime(pd.Series(waktu), errors="coerce")
+    return pd.DataFrame({
+        "jenis_anomali": jenis,
+        "karyawan_id": np.asarray(karyawan, dtype=np.int64),
+        "instansi_id": np.asarray(instansi, dtype=np.int64),
+        "tanggal": waktu.dt.date.to_numpy(),
+        "waktu": waktu.to_numpy(),
+        "nilai": np.asarray(nilai, dtype=np.float64),
+        "keterangan": keterangan,
+    }, columns=ANOMALI_COLUMNS)
+
+
+def checkins_from_laporan(df_laporan: pd.DataFrame) -> pd.DataFrame:
+    """Check-in events (`jam_masuk`, `jam_pulang`) of a daily laporan, without coordinates."""
+    parts = [
+        df_laporan[["karyawan_id", "instansi_id", col]].rename(columns={col: "tanggal_kirim"})
+        for col in ("jam_masuk", "jam_pulang") if col in df_laporan.columns
+    ]
+    if not parts:
+        return pd.DataFrame(columns=["karyawan_id", "instansi_id", "tanggal_kirim"])
+    events = pd.concat(parts, ignore_index=True)
+    return events[events["tanggal_kirim"].notna()]
+
+
+def kirim_kembar(checkins: pd.DataFrame, per_instansi: bool = True) -> pd.DataFrame:
+    """Check-ins whose `tanggal_kirim` is shared with at least one other karyawan.
+
+    With `per_instansi` (default) only karyawan of the same instansi count as
+    sharing a timestamp; a province-wide scan at one-second resolution would
+    otherwise flag every busy minute.
+    """
+    ts = _ns(checkins["tanggal_kirim"])
+    valid = ts != np.iinfo(np.int64).min
+    ts = ts[valid]
+    karyawan = checkins["karyawan_id"].to_numpy(dtype=np.int64)[valid]
+    instansi = checkins["instansi_id"].to_numpy(dtype=np.int64)[valid]
+    if not len(ts):
+        return _empty()
+
+    scope = instansi if per_instansi else np.zeros_like(instansi)
+    order = np.lexsort((karyawan, ts, scope))
+    s_s, t_s, k_s = scope[order], ts[order], karyawan[order]
+    # runs of equal (scope, timestamp); within a run, count distinct karyawan
+    new_group = np.r_[True, (s_s[1:] != s_s[:-1]) | (t_s[1:] != t_s[:-1])]
+    new_pair = new_group | np.r_[True, k_s[1:] != k_s[:-1]]
+    group = np.cumsum(new_group) - 1
+    n_karyawan = np.bincount(group[new_pair])[group]
+    hit = order[n_karyawan > 1]
+    if not len(hit):
+        return _empty()
+    counts = n_karyawan[n_karyawan > 1]
+    return _flags("kirim_kembar", karyawan[hit], instansi[hit], ts[hit].view("datetime64[ns]"), counts,
+                  pd.Series(counts).astype(str).add(" karyawan dengan tanggal_kirim yang sama").to_numpy())
+
+
+def _haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def lokasi_mustahil(checkins: pd.DataFrame, max_kecepatan_kmh: float = 120.0, min_jarak_km: float = 1.0) -> pd.DataFrame:
+    """Consecutive check-ins of one karyawan too far apart for the time between them."""
+    if not {"lat", "long"} <= set(checkins.columns) or checkins.empty:
+        return _empty()
+    ts = _ns(checkins["tanggal_kirim"])
+    lat = pd.to_numeric(checkins["lat"], errors="coerce").to_numpy(dtype=np.float64)
+    lon = pd.to_numeric(checkins["long"], errors="coerce").to_numpy(dtype=np.float64)
+    keep = (ts != np.iinfo(np.int64).min) & ~np.isnan(lat) & ~np.isnan(lon)
+    if keep.sum() < 2:
+        return _empty()
+    kar = checkins["karyawan_id"].to_numpy(dtype=np.int64)[keep]
+    instansi = checkins["instansi_id"].to_numpy(dtype=np.int64)[keep]
+    ts, lat, lon = ts[keep], lat[keep], lon[keep]
+    order = np.lexsort((ts, kar))
+    kar, instansi, ts, lat, lon = kar[order], instansi[order], ts[order], lat[order], lon[order]
+
+    same = kar[1:] == kar[:-1]
+    jarak = _haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    jam = (ts[1:] - ts[:-1]) / 3.6e12
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kecepatan = np.where(jam > 0, jarak / jam, np.inf)
+    hit = np.flatnonzero(same & (jarak > min_jarak_km) & (kecepatan > max_kecepatan_kmh)) + 1
+    if not len(hit):
+        return _empty()
+    detik = (ts[hit] - ts[hit - 1]) // 10**9
+    return _flags("lokasi_mustahil", kar[hit], instansi[hit], ts[hit].view("datetime64[ns]"), jarak[hit - 1],
+                  [f"{d:.1f} km dalam {s} detik" for d, s in zip(jarak[hit - 1], detik)])
+
+
+def selalu_tepat_waktu(df_laporan: pd.DataFrame, toleransi_detik: int = 60, min_hari: int = 10, min_rasio: float = 0.9) -> pd.DataFrame:
+    """Karyawan whose check-in is nearly always within seconds before `jadwal_masuk`."""
+    if df_laporan.empty or not {"jam_masuk", "jadwal_masuk"} <= set(df_laporan.columns):
+        return _empty()
+    masuk = pd.to_datetime(df_laporan["jam_masuk"], errors="coerce")
+    jadwal = pd.to_datetime(df_laporan["jadwal_masuk"], errors="coerce")
+    valid = masuk.notna() & jadwal.notna()
+    selisih = (jadwal - masuk).dt.total_seconds()
+    df = pd.DataFrame({
+        "karyawan_id": df_laporan["karyawan_id"],
+        "instansi_id": df_laporan["instansi_id"],
+        "waktu": masuk,
+        "tepat": (selisih >= 0) & (selisih <= toleransi_detik),
+    })[valid]
+    if df.empty:
+        return _empty()
+    per = df.groupby("karyawan_id", sort=True).agg(
+        instansi_id=("instansi_id", "last"), hari=("tepat", "size"), tepat=("tepat", "sum"), waktu=("waktu", "max"))
+    per["rasio"] = per["tepat"] / per["hari"]
+    per = per[(per["hari"] >= min_hari) & (per["rasio"] >= min_rasio)]
+    if per.empty:
+        return _empty()
+    return _flags("selalu_tepat_waktu", per.index, per["instansi_id"], per["waktu"], per["rasio"],
+                  [f"{int(t)} dari {int(h)} hari masuk <= {toleransi_detik} detik sebelum jadwal" for t, h in zip(per["tepat"], per["hari"])])
+
+
+def scan_anomali(df_laporan: Optional[pd.DataFrame] = None, df_presensi: Optional[pd.DataFrame] = None, *,
+                 max_kecepatan_kmh: float = 120.0, min_jarak_km: float = 1.0,
+                 toleransi_detik: int = 60, min_hari: int = 10, min_rasio: float = 0.9) -> pd.DataFrame:
+    """Run every rule and return the flagged rows (`ANOMALI_COLUMNS`).
+
+    `df_presensi` are raw `presensi_kehadiran` check-ins (`tanggal_kirim`,
+    `lat`, `long`). Without it, the check-in rules use the laporan's
+    `jam_masuk`/`jam_pulang`, and the location rule is skipped.
+    `df_laporan` (as from `generate_presensi_laporan`) feeds the
+    on-time rule.
+    """
+    if df_presensi is not None:
+        checkins = df_presensi
+    elif df_laporan is not None:
+        checkins = checkins_from_laporan(df_laporan)
+    else:
+        checkins = pd.DataFrame(columns=["karyawan_id", "instansi_id", "tanggal_kirim"])
+
+    found = [kirim_kembar(checkins), lokasi_mustahil(checkins, max_kecepatan_kmh, min_jarak_km)]
+    if df_laporan is not None:
+        found.append(selalu_tepat_waktu(df_laporan, toleransi_detik, min_hari, min_rasio))
+    found = [f for f in found if not f.empty]
+    if not found:
+        return _empty()
+    out = pd.concat(found, ignore_index=True)
+    return out.sort_values(["jenis_anomali", "karyawan_id", "waktu"], kind="stable", ignore_index=True)
+
+
+def simpan_anomali(conn: Connection, flags: pd.DataFrame, tanggal_awal, tanggal_akhir, instansi_id: Optional[int] = None,
+                   jenis: Optional[Sequence[str]] = None) -> int:
+    """Replace the flags of [tanggal_awal, tanggal_akhir] with `flags`; return rows written.
+
+    `instansi_id` and `jenis` narrow what is replaced to one instansi and to
+    the rules that were run, so the flags of other scans are kept.
+    """
+    table = models.PresensiAnomaliModel.__table__
+    awal, akhir = pd.Timestamp(tanggal_awal).date(), pd.Timestamp(tanggal_akhir).date()
+    stmt = delete(table).where(table.c.tanggal.between(awal, akhir))
+    if instansi_id is not None:
+        stmt = stmt.where(table.c.instansi_id == instansi_id)
+    if jenis is not None:
+        stmt = stmt.where(table.c.jenis_anomali.in_(list(jenis)))
+    conn.execute(stmt)
+    if flags.empty:
+        return 0
+    rows = flags[ANOMALI_COLUMNS].assign(
+        waktu=pd.to_datetime(flags["waktu"]),
+        created_at=pd.Timestamp.now(tz="UTC").tz_localize(None),
+    )
+    return get_loader(conn.dialect.name).load(conn, table.name, rows, if_exists="append")
+
+
+__all__ = [
+    "ANOMALI_COLUMNS",
+    "CHECKIN_RULES",
+    "checkins_from_laporan",
+    "kirim_kembar",
+    "lokasi_mustahil",
+    "selalu_tepat_waktu",
+    "scan_anomali",
+    "simpan_anomali",
+]
@@ -0,0 +1,216 @@
+"""Dialect-specific bulk loaders used by `etl.append_chunks_to_table`.
+
+`DataFrame.to_sql(method="multi")` renders one INSERT with a bind parameter
+per value. Big chunks then hit SQLite's host-parameter limit and MySQL's
+`max_allowed_packet`, and building the statement is slow. The loaders here
+create the table from the chunk's schema as before (`to_sql` on an empty
+frame) and move the rows with a cheaper path per dialect:
+
+- MySQL: `LOAD DATA LOCAL INFILE` from a temporary tab-separated file. This
+  needs `local_infile` on the server and the client (e.g. `?local_infile=1`
+  in the pymysql URL); when the server refuses it, the loader falls back to
+  batched `executemany`.
+- SQLite: `executemany` of one prepared INSERT inside the caller's
+  transaction, with cache/temp-store pragmas (see `tune_sqlite_engine`).
+- Anything else: batched `executemany`.
+
+Batches hold at most `BULK_MAX_VALUES` values, so wide tables get fewer rows
+per batch than narrow ones.
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+from typing import Iterator, List, Optional, Sequence
+
+import pandas as pd
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+# values (rows x columns) per executemany batch
+BULK_MAX_VALUES = int(os.getenv("ETL_BULK_MAX_VALUES", 200000))
+BULK_MAX_ROWS = 50000
+# how long a SQLite writer waits for another connection's write transaction
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 60000))
+
+_DATETIME_TEXT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def batch_rows_for(n_columns: int, max_values: int = BULK_MAX_VALUES, max_rows: int = BULK_MAX_ROWS) -> int:
+    """Rows per batch for a table with `n_columns` columns."""
+    return max(1, min(max_rows, max_values // max(1, n_columns)))
+
+
+def _column_values(series: pd.Series, datetime_as_text: bool) -> list:
+    """Driver-friendly Python values for one column (None for NULL)."""
+    missing = series.isna()
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.dt.strftime(_DATETIME_TEXT) if datetime_as_text else pd.Series(series.dt.to_pydatetime(), index=series.index, dtype=object)
+    elif pd.api.types.is_timedelta64_dtype(series):
+        # same representation as to_sql: integer nanoseconds
+        values = pd.Series([None if pd.isna(v) else v.value for v in series], index=series.index, dtype=object)
+    else:
+        values = series.astype(object)
+    return values.where(~missing, None).tolist()
+
+
+def _rows(df: pd.DataFrame, datetime_as_text: bool = False) -> List[tuple]:
+    return list(zip(*(_column_values(df[col], datetime_as_text) for col in df.columns)))
+
+
+def driver_rows(conn: Connection, df: pd.DataFrame) -> List[tuple]:
+    """Row tuples of `df` as the loader for `conn`'s dialect would bind them."""
+    return _rows(df, get_loader(conn.dialect.name).datetime_as_text)
+
+
+def quote(conn: Connection, name: str) -> str:
+    """Quote a table/column name for `conn`'s dialect."""
+    return conn.dialect.identifier_preparer.quote(name)
+
+
+def placeholders(conn: Connection, n: int) -> str:
+    """`n` positional bind markers in the DB-API paramstyle of `conn`."""
+    paramstyle = conn.dialect.paramstyle
+    if paramstyle == "qmark":
+        return ", ".join("?" * n)
+    if paramstyle == "numeric":
+        return ", ".join(f":{i + 1}" for i in range(n))
+    # format / pyformat drivers (pymysql, mysqlclient, psycopg2) accept %s
+    return ", ".join(["%s"] * n)
+
+
+def _create_table(conn: Connection, table: str, df: pd.DataFrame, if_exists: str) -> None:
+    # table DDL (and replace semantics) exactly as pandas would do it
+    df.head(0).to_sql(table, conn, if_exists=if_exists, index=False)
+
+
+class BulkLoader:
+    """Generic loader: batched `executemany` of a prepared INSERT."""
+
+    datetime_as_text = False
+
+    def load(self, conn: Connection, table: str, df: pd.DataFrame, if_exists: str = "append") -> int:
+        """Write `df` into `table` on `conn` (inside the caller's transaction); return rows written."""
+        if df.empty:
+            return 0
+        _create_table(conn, table, df, if_exists)
+        return self.insert_rows(conn, table, df)
+
+    def insert_rows(self, conn: Connection, table: str, df: pd.DataFrame) -> int:
+        columns = ", ".join(quote(conn, str(col)) for col in df.columns)
+        sql = f"INSERT INTO {quote(conn, table)} ({columns}) VALUES ({placeholders(conn, len(df.columns))})"
+        step = batch_rows_for(len(df.columns))
+        for start in range(0, len(df), step):
+            conn.exec_driver_sql(sql, _rows(df.iloc[start:start + step], self.datetime_as_text))
+        return len(df)
+
+
+class SqliteLoader(BulkLoader):
+    """`executemany` in one transaction; datetimes as text like SQLAlchemy stores them."""
+
+    datetime_as_text = True
+
+
+class MySQLLoader(BulkLoader):
+    """`LOAD DATA LOCAL INFILE` from a temporary TSV, `executemany` when refused."""
+
+    def insert_rows(self, conn: Connection, table: str, df: pd.DataFrame) -> int:
+        fd, path = tempfile.mkstemp(prefix="etl-load-", suffix=".tsv")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as fh:
+                for block in _iter_tsv(df, batch_rows_for(len(df.columns))):
+                    fh.write(block)
+            columns = ", ".join(quote(conn, str(col)) for col in df.columns)
+            sql = (
+                f"LOAD DATA LOCAL INFILE '{path.replace(chr(92), '/')}' INTO TABLE {quote(conn, table)} CHARACTER SET utf8mb4 "
+                "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+                f"({columns})"
+            )
+            try:
+                conn.exec_driver_sql(sql)
+            except DBAPIError:
+                # local_infile disabled on the server or client
+                return super().insert_rows(conn, table, df)
+        finally:
+            os.remove(path)
+        return len(df)
+
+
+def _tsv_column(series: pd.Series) -> pd.Series:
+    missing = series.isna()
+    if pd.api.types.is_datetime64_any_dtype(series):
+        text = series.dt.strftime(_DATETIME_TEXT)
+    elif pd.api.types.is_timedelta64_dtype(series):
+        text = pd.Series([None if pd.isna(v) else str(v.value) for v in series], index=series.index, dtype=object)
+    elif pd.api.types.is_bool_dtype(series):
+        text = series.map({True: "1", False: "0"})
+    else:
+        text = series.astype(str)
+        if not pd.api.types.is_numeric_dtype(series):
+            text = (text.str.replace("\\", "\\\\", regex=False)
+                        .str.replace("\t", "\\t", regex=False)
+                        .str.replace("\n", "\\n", regex=False)
+                        .str.replace("\r", "\\r", regex=False))
+    return text.astype(object).where(~missing, "\\N")
+
+
+def _iter_tsv(df: pd.DataFrame, step: int) -> Iterator[str]:
+    """Tab-separated lines in MySQL's LOAD DATA escaping (`\\N` for NULL)."""
+    for start in range(0, len(df), step):
+        part = df.iloc[start:start + step]
+        columns = [_tsv_column(part[col]) for col in part.columns]
+        lines = columns[0].str.cat(columns[1:], sep="\t") if len(columns) > 1 else columns[0]
+        yield "\n".join(lines.tolist()) + "\n"
+
+
+_LOADERS = {"mysql": MySQLLoader, "mariadb": MySQLLoader, "sqlite": SqliteLoader}
+
+
+def get_loader(dialect_name: str) -> BulkLoader:
+    """Loader for a SQLAlchemy dialect name; the generic loader for unknown dialects."""
+    return _LOADERS.get(dialect_name, BulkLoader)()
+
+
+def tune_sqlite_engine(engine: Engine, cache_kib: int = 65536) -> Engine:
+    """Bulk-load pragmas on every new connection of a SQLite engine.
+
+    `synchronous=NORMAL` cannot be changed inside a transaction, so it is
+    set when the connection opens: commits skip an fsync. In WAL mode that
+    can lose the last commits on power loss but never corrupts the file. In
+    the default rollback-journal mode a power loss during a commit can
+    corrupt the database. Local DBs whose durability matters should be
+    switched to WAL once (`PRAGMA journal_mode=WAL`, which persists) or
+    loaded without this hook. A crash of the process alone is safe in both modes.
+    `busy_timeout` (`SQLITE_BUSY_TIMEOUT_MS`, default 60 s) lets a writer wait
+    for another process's write transaction instead of failing after 5 s.
+    """
+    if engine.dialect.name != "sqlite" or getattr(engine, "_etl_tuned", False):
+        return engine
+
+    @event.listens_for(engine, "connect")
+    def _pragmas(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute(f"PRAGMA cache_size=-{int(cache_kib)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.close()
+
+    engine._etl_tuned = True
+    return engine
+
+
+__all__ = [
+    "BULK_MAX_VALUES",
+    "SQLITE_BUSY_TIMEOUT_MS",
+    "batch_rows_for",
+    "BulkLoader",
+    "SqliteLoader",
+    "MySQLLoader",
+    "get_loader",
+    "driver_rows",
+    "placeholders",
+    "quote",
+    "tune_sqlite_engine",
+]
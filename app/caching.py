@@ -0,0 +1,127 @@
+"""HTTP conditional caching for the rekap read endpoints.
+
+Rows of `rekap_bulanan` for a closed month practically never change, so the
+read endpoints answer with an ETag derived from the `rekap_versi` counters of
+the (tahun, bulan, instansi_id) partitions a request covers. The counters are
+bumped on every write (`simpan_rekap_bulanan`, `bump_rekap_versi`), which
+lets `If-None-Match` be answered with a 304 after a lookup in that small
+table only, without reading any row data.
+"""
+from __future__ import annotations
+
+import datetime
+import hashlib
+import os
+from email.utils import format_datetime
+from typing import Iterable, Optional, Sequence, Tuple
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import Select
+
+from . import models
+
+# max-age for responses that only cover closed months; months that are still
+# running are always revalidated.
+CLOSED_MONTH_MAX_AGE = int(os.getenv("REKAP_CACHE_MAX_AGE", 3600))
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def rekap_versi_select(tahun: int, bulan: Optional[int] = None, instansi_id: Optional[int] = None) -> Select:
+    """Select the version rows of the partitions a `/rekap_kehadiran` request covers."""
+    table = models.RekapVersiModel.__table__
+    stmt = select(table.c.tahun, table.c.bulan, table.c.instansi_id, table.c.versi, table.c.updated_at).where(table.c.tahun == tahun)
+    if bulan is not None:
+        stmt = stmt.where(table.c.bulan == bulan)
+    if instansi_id is not None:
+        stmt = stmt.where(table.c.instansi_id == instansi_id)
+    return stmt.order_by(table.c.tahun, table.c.bulan, table.c.instansi_id)
+
+
+def compute_etag(versions: Sequence[Sequence], *key_parts) -> Tuple[Optional[str], Optional[datetime.datetime]]:
+    """Return a weak ETag and the Last-Modified datetime for the version rows.
+
+    `key_parts` are the request parameters (filters, response format) so that
+    different views of the same partitions get different tags. The tag is
+    weak because the body may be served gzip-compressed or not.
+
+    Without version rows (partitions written by tools that do not bump
+    `rekap_versi`, or nothing written yet) there is nothing that changes with
+    the data, so no tag is returned and the response must not be cached.
+    """
+    if not versions:
+        return None, None
+    digest = hashlib.sha1(repr(key_parts).encode("utf-8"))
+    last_modified = None
+    for tahun, bulan, instansi_id, versi, updated_at in versions:
+        digest.update(f"|{tahun}-{bulan}-{instansi_id}:{versi}".encode("utf-8"))
+        if updated_at is not None and (last_modified is None or updated_at > last_modified):
+            last_modified = updated_at
+    return f'W/"{digest.hexdigest()[:32]}"', last_modified
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """True when an `If-None-Match` header value matches `etag` (weak comparison)."""
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def cache_control_for(tahun: int, bulan: Optional[int] = None, now: Optional[datetime.datetime] = None) -> str:
+    """Cache-Control value: cacheable for closed months, revalidate otherwise."""
+    now = now or datetime.datetime.now()
+    closed = tahun < now.year or (tahun == now.year and bulan is not None and bulan < now.month)
+    if closed:
+        return f"public, max-age={CLOSED_MONTH_MAX_AGE}"
+    return "no-cache"
+
+
+def cache_headers(etag: Optional[str], last_modified: Optional[datetime.datetime], cache_control: str) -> dict:
+    if etag is None:
+        # unversioned data: always revalidate, nothing to validate against
+        return {"Cache-Control": "no-cache", "Vary": "Accept"}
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=datetime.timezone.utc), usegmt=True)
+    return headers
+
+
+def bump_rekap_versi(conn: Connection, partitions: Iterable[Tuple[int, int, int]]) -> None:
+    """Increment the version of each (tahun, bulan, instansi_id) partition.
+
+    Call inside the transaction that writes the rekap rows. Dialect-neutral
+    counterpart of the MySQL upsert used by `simpan_rekap_bulanan`.
+    """
+    table = models.RekapVersiModel.__table__
+    now = _utcnow()
+    for tahun, bulan, instansi_id in set(partitions):
+        result = conn.execute(
+            update(table)
+            .where(table.c.tahun == tahun, table.c.bulan == bulan, table.c.instansi_id == instansi_id)
+            .values(versi=table.c.versi + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            conn.execute(insert(table).values(tahun=tahun, bulan=bulan, instansi_id=instansi_id, versi=1, updated_at=now))
+
+
+__all__ = [
+    "CLOSED_MONTH_MAX_AGE",
+    "rekap_versi_select",
+    "compute_etag",
+    "etag_matches",
+    "cache_control_for",
+    "cache_headers",
+    "bump_rekap_versi",
+]
@@ -0,0 +1,239 @@
+"""Changed-row detection (diff sync) for mutable source tables.
+
+`presensi_karyawan` and `presensi_absen` rows are edited in place upstream
+(approvals, corrections) and carry no reliable `updated_at`, so neither a
+watermark nor a plain append can pick up the edits. Diff sync keeps a 64-bit
+content hash per row in the local `etl_row_hash` table, keyed by the row's
+key columns. Every incoming chunk is hashed and compared with it:
+
+- unknown key: the row is inserted,
+- known key with a different hash: the local row is replaced,
+- same hash: nothing is written.
+
+With `delete_missing=True`, local rows whose key did not show up in the run
+are deleted at the end. Only use this when the run reads the whole table.
+The source is still read in full, but local writes scale with the number of
+changed rows.
+
+Key columns should be integer or text columns. Their values are stored as a
+JSON list in `etl_row_hash.row_key`. The local table gets an index on the
+key columns, which the replace and delete statements look rows up by (on
+MySQL, where DDL would commit the sync transaction, it must be created
+beforehand; a warning is logged when it is missing).
+
+Rows of a local table that are not in `etl_row_hash` (e.g. a table loaded
+before diff sync was used) are adopted once: their keys are read in one
+query, and such a row is replaced when its key arrives (or deleted by
+`delete_missing`). Hashes are taken over a canonical form of each column
+(integers as `Int64`, datetimes as ISO text, text as plain objects). The
+same values therefore hash the same whatever dtype the reader gave them.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_float_dtype, is_integer_dtype
+from sqlalchemy import delete, func, insert, inspect, select, table as sa_table, column as sa_column
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+
+from . import models
+from .bulkload import BulkLoader, batch_rows_for, driver_rows, get_loader, placeholders, quote
+
+logger = logging.getLogger(__name__)
+
+
+def _canonical(values: pd.Series) -> pd.Series:
+    if is_bool_dtype(values) or is_integer_dtype(values):
+        return values.astype("Int64")
+    if is_float_dtype(values):
+        finite = values.dropna()
+        # integer columns read as float because of NULLs
+        if (finite == np.floor(finite)).all() and (finite.abs() < 2 ** 53).all():
+            return values.astype("Int64")
+        return values.astype("float64")
+    if is_datetime64_any_dtype(values):
+        text = values.dt.strftime("%Y-%m-%d %H:%M:%S.%f").str.removesuffix(".000000")
+        return text.astype(object).where(values.notna(), None)
+    # text and anything else: plain Python objects, every missing value as None
+    out = values.astype(object)
+    return out.where(out.notna(), None)
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """Signed 64-bit content hash per row (fits a BIGINT column), independent of the columns' dtypes."""
+    canonical = pd.DataFrame({col: _canonical(df[col]) for col in df.columns}, index=df.index)
+    return pd.util.hash_pandas_object(canonical, index=False).to_numpy(dtype=np.uint64).view(np.int64)
+
+
+def _row_keys(conn: Connection, df: pd.DataFrame) -> List[str]:
+    return [json.dumps(list(values), default=str) for values in driver_rows(conn, df)]
+
+
+class DiffSync:
+    """Apply chunks of one source table to the local copy, writing only changed rows.
+
+    Use inside one local transaction: `apply()` every chunk, then `finish()`.
+    """
+
+    def __init__(self, conn: Connection, table: str, key_columns: Sequence[str], *, delete_missing: bool = False,
+                 loader: Optional[BulkLoader] = None):
+        if not key_columns:
+            raise ValueError("diff sync needs at least one key column")
+        self.conn = conn
+        self.table = table
+        self.key_columns = list(key_columns)
+        self.delete_missing = delete_missing
+        self.loader = loader or get_loader(conn.dialect.name)
+        self._journal = models.EtlRowHashModel.__table__
+        self._journal.create(conn, checkfirst=True)
+        self._known: Dict[str, int] = self._load_known()
+        self._seen: set = set()
+        # local rows without a stored hash, adopted once (see the module docstring)
+        self._untracked: set = set()
+        self._indexed = False
+        if self._table_exists():
+            self._ensure_key_index()
+            self._untracked = self._load_untracked()
+
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deleted = 0
+
+    def _load_known(self) -> Dict[str, int]:
+        rows = self.conn.execute(select(self._journal.c.row_key, self._journal.c.row_hash).where(self._journal.c.table_name == self.table))
+        return {row_key: row_hash for row_key, row_hash in rows}
+
+    def _table_exists(self) -> bool:
+        return inspect(self.conn).has_table(self.table)
+
+    def _load_untracked(self) -> set:
+        local = sa_table(self.table, *(sa_column(col) for col in self.key_columns))
+        count = self.conn.execute(select(func.count()).select_from(local)).scalar()
+        if count == len(self._known):
+            return set()
+        keys = {json.dumps(list(row), default=str) for row in self.conn.execute(select(*local.columns))}
+        return keys.difference(self._known)
+
+    def _ensure_key_index(self) -> None:
+        """Index the key columns of the local table, unless an index or the primary key covers them."""
+        if self._indexed:
+            return
+        self._indexed = True
+        inspector = inspect(self.conn)
+        covered = [inspector.get_pk_constraint(self.table).get("constrained_columns") or []]
+        covered += [index["column_names"] for index in inspector.get_indexes(self.table)]
+        if any(cols[:len(self.key_columns)] == self.key_columns for cols in covered):
+            return
+        name = f"ix_{self.table}_{'_'.join(self.key_columns)}"[:64]
+        if self.conn.dialect.name == "mysql":
+            # MySQL DDL would commit the sync transaction: the index has to exist beforehand
+            logger.warning("Tabel %s belum punya indeks pada kolom kunci %s; buat indeks %s agar diff sync tidak memindai tabel",
+                           self.table, self.key_columns, name)
+            return
+        columns = ", ".join(quote(self.conn, col) for col in self.key_columns)
+        try:
+            with self.conn.begin_nested():
+                self.conn.exec_driver_sql(f"CREATE INDEX {quote(self.conn, name)} ON {quote(self.conn, self.table)} ({columns})")
+        except DBAPIError:
+            logger.warning("Indeks kunci %s untuk %s tidak dapat dibuat", self.key_columns, self.table)
+
+    def _delete_keys(self, key_rows: List[tuple]) -> None:
+        """Delete the local rows with these key values (one executemany per batch)."""
+        if not key_rows or not self._table_exists():
+            return
+        markers = placeholders(self.conn, len(self.key_columns)).split(", ")
+        condition = " AND ".join(f"{quote(self.conn, col)} = {marker}" for col, marker in zip(self.key_columns, markers))
+        sql = f"DELETE FROM {quote(self.conn, self.table)} WHERE {condition}"
+        step = batch_rows_for(len(self.key_columns))
+        for start in range(0, len(key_rows), step):
+            self.conn.exec_driver_sql(sql, key_rows[start:start + step])
+
+    def _forget(self, keys: List[str]) -> None:
+        journal = self._journal
+        step = batch_rows_for(1)
+        for start in range(0, len(keys), step):
+            self.conn.execute(delete(journal).where(journal.c.table_name == self.table, journal.c.row_key.in_(keys[start:start + step])))
+
+    def apply(self, df: pd.DataFrame) -> int:
+        """Insert new and replace changed rows of `df`; return rows written."""
+        if df.empty:
+            return 0
+        # the last version of a key within the chunk wins
+        df = df.drop_duplicates(subset=self.key_columns, keep="last")
+        keys = _row_keys(self.conn, df[self.key_columns])
+        hashes = row_hashes(df)
+        self._seen.update(keys)
+
+        present = np.fromiter((key in self._known for key in keys), dtype=bool, count=len(keys))
+        old = np.fromiter((self._known.get(key, 0) for key in keys), dtype=np.int64, count=len(keys))
+        changed = present & (old != hashes)
+        new = ~present
+        write = changed | new
+        self.unchanged += int((~write).sum())
+        if not write.any():
+            return 0
+
+        out = df[write]
+        # replaced rows: changed keys, and new keys of rows loaded before diff sync tracked them
+        adopted = np.fromiter((key in self._untracked for key in keys), dtype=bool, count=len(keys)) if self._untracked else False
+        replace = changed | (new & adopted)
+        if replace.any():
+            self._delete_keys(driver_rows(self.conn, df.loc[replace, self.key_columns]))
+            self._untracked.difference_update(key for key, flag in zip(keys, replace) if flag)
+        self.loader.load(self.conn, self.table, out, if_exists="append")
+        self._ensure_key_index()
+
+        write_keys = [key for key, flag in zip(keys, write) if flag]
+        write_hashes = hashes[write]
+        self._forget([key for key, flag in zip(keys, changed) if flag])
+        self.conn.execute(insert(self._journal), [
+            {"table_name": self.table, "row_key": key, "row_hash": int(row_hash)}
+            for key, row_hash in zip(write_keys, write_hashes)
+        ])
+        self._known.update(zip(write_keys, (int(h) for h in write_hashes)))
+
+        self.inserted += int(new.sum())
+        self.updated += int(changed.sum())
+        return len(out)
+
+    def finish(self) -> None:
+        """Delete local rows not seen in this run (with `delete_missing`)."""
+        if not self.delete_missing:
+            return
+        missing = [key for key in self._known if key not in self._seen]
+        untracked = [key for key in self._untracked if key not in self._seen]
+        if not missing and not untracked:
+            return
+        self._delete_keys([tuple(json.loads(key)) for key in missing + untracked])
+        self._forget(missing)
+        for key in missing:
+            del self._known[key]
+        self._untracked.clear()
+        self.deleted += len(missing) + len(untracked)
+
+    def stats(self) -> dict:
+        return {"inserted": self.inserted, "updated": self.updated, "unchanged": self.unchanged, "deleted": self.deleted}
+
+
+def clear_row_hashes(conn: Connection, table: str) -> None:
+    """Forget the stored hashes of `table`; the next diff sync rewrites every row."""
+    journal = models.EtlRowHashModel.__table__
+    journal.create(conn, checkfirst=True)
+    conn.execute(delete(journal).where(journal.c.table_name == table))
+
+
+def diff_sync_frame(conn: Connection, table: str, df: pd.DataFrame, key_columns: Sequence[str], *, delete_missing: bool = False) -> dict:
+    """Diff-sync one complete DataFrame into `table`; return the counters."""
+    sync = DiffSync(conn, table, key_columns, delete_missing=delete_missing)
+    sync.apply(df)
+    sync.finish()
+    return sync.stats()
+
+
+__all__ = ["DiffSync", "row_hashes", "clear_row_hashes", "diff_sync_frame"]
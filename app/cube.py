@@ -0,0 +1,290 @@
+"""In-process attendance cube over `rekap_bulanan` for ad-hoc analytics.
+
+One cube holds one year of rekap as a dense NumPy array
+`values[karyawan, month, metric]` (int32, months 0-11, metrics as in
+`rollup.MEASURES`), stored metric-major so every metric/month is one
+contiguous vector. A boolean `present[karyawan, month]` tells written months
+from empty ones. The employee axis is dictionary-encoded as the sorted
+`karyawan_ids` (lookup by binary search). Each karyawan also carries an
+`instansi_code` into the sorted `instansi_ids`, so filtering an instansi is
+one integer comparison over the axis.
+
+Queries (`top_n`, `threshold`, `trend`, `month_over_month`, `spikes`,
+`percentile`) are a few vectorised NumPy operations on that array and never
+touch the database. A cube of 50,000 karyawan takes about 40 MB.
+
+`get_cube(tahun)` loads a year once per process. `simpan_rekap_bulanan`
+passes every written frame to `refresh_cubes`, which patches the cubes that
+are already loaded, so they follow the writes made by this process. Writes
+made by other processes are only seen after `clear_cubes()` or a reload.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+from . import models
+from .analytics import get_engine
+from .rollup import MEASURES
+
+METRICS = MEASURES
+_METRIC_INDEX = {name: i for i, name in enumerate(METRICS)}
+_REKAP_COLUMNS = ["karyawan_id", "instansi_id", "bulan", *METRICS]
+
+
+class _Arrays(NamedTuple):
+    karyawan_ids: np.ndarray   # (K,) sorted
+    instansi_ids: np.ndarray   # (I,) sorted
+    instansi_code: np.ndarray  # (K,) index into instansi_ids
+    data: np.ndarray           # (metric, month, K): one contiguous vector per metric and month
+    present: np.ndarray        # (month, K)
+    any_present: np.ndarray    # (K,) karyawan with at least one month
+    totals: Dict[int, np.ndarray]  # metric -> year total per karyawan, filled on first use
+
+
+def _empty_arrays() -> _Arrays:
+    return _Arrays(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32),
+                   np.zeros((len(METRICS), 12, 0), dtype=np.int32), np.zeros((12, 0), dtype=bool),
+                   np.zeros(0, dtype=bool), {})
+
+
+class AttendanceCube:
+    """Dense [karyawan, month, metric] array of one year of rekap_bulanan.
+
+    The array is stored metric-major, so one metric of one month is a
+    contiguous vector over the karyawan axis. `values` and `present` are
+    [karyawan, month(, metric)] views of it.
+    """
+
+    def __init__(self, tahun: int):
+        self.tahun = tahun
+        self._arrays = _empty_arrays()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, tahun: int) -> "AttendanceCube":
+        cube = cls(tahun)
+        cube.apply(df)
+        return cube
+
+    @classmethod
+    def load(cls, tahun: int, engine: Optional[Engine] = None) -> "AttendanceCube":
+        """Build the cube of `tahun` from the database (`DATABASE_URL` by default)."""
+        engine = engine or get_engine(None)
+        table = models.RekapKehadiranModel.__table__
+        stmt = select(*[table.c[c] for c in _REKAP_COLUMNS]).where(table.c.tahun == tahun)
+        with engine.connect() as conn:
+            df = pd.DataFrame(conn.execute(stmt).all(), columns=_REKAP_COLUMNS)
+        return cls.from_frame(df, tahun)
+
+    @property
+    def karyawan_ids(self) -> np.ndarray:
+        return self._arrays.karyawan_ids
+
+    @property
+    def instansi_ids(self) -> np.ndarray:
+        return self._arrays.instansi_ids
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._arrays.data.transpose(2, 1, 0)
+
+    @property
+    def present(self) -> np.ndarray:
+        return self._arrays.present.T
+
+    # -- writes ---------------------------------------------------------------
+
+    def apply(self, df: pd.DataFrame) -> int:
+        """Write rekap rows of this year into the cube (new karyawan grow the axis); return rows applied."""
+        if "tahun" in df.columns:
+            df = df[df["tahun"].astype("int64") == self.tahun]
+        if df.empty:
+            return 0
+        ids = df["karyawan_id"].to_numpy(dtype=np.int64)
+        months = df["bulan"].to_numpy(dtype=np.int64) - 1
+        data = df[list(METRICS)].to_numpy(dtype=np.int32)
+        instansi = df["instansi_id"].to_numpy(dtype=np.int64)
+
+        with self._lock:
+            old = self._arrays
+            karyawan_ids = np.union1d(old.karyawan_ids, ids)
+            # write into copies and swap them in at once, so readers never see a half-applied write
+            values = np.zeros((len(METRICS), 12, len(karyawan_ids)), dtype=np.int32)
+            present = np.zeros((12, len(karyawan_ids)), dtype=bool)
+            owner = np.full(len(karyawan_ids), -1, dtype=np.int64)
+            moved = np.searchsorted(karyawan_ids, old.karyawan_ids)
+            values[:, :, moved] = old.data
+            present[:, moved] = old.present
+            owner[moved] = old.instansi_ids[old.instansi_code]
+
+            rows = np.searchsorted(karyawan_ids, ids)
+            values[:, months, rows] = data.T
+            present[months, rows] = True
+            owner[rows] = instansi
+            instansi_ids, instansi_code = np.unique(owner, return_inverse=True)
+            self._arrays = _Arrays(karyawan_ids, instansi_ids, instansi_code.astype(np.int32), values, present,
+                                   present.any(axis=0), {})
+        return len(df)
+
+    # -- selection helpers ----------------------------------------------------
+
+    @staticmethod
+    def _metric(metric: str) -> int:
+        try:
+            return _METRIC_INDEX[metric]
+        except KeyError:
+            raise ValueError(f"Metrik tidak dikenal: {metric}") from None
+
+    @staticmethod
+    def _bulan(bulan: int) -> int:
+        """Index of `bulan` (1-12) on the month axis."""
+        if not 1 <= bulan <= 12:
+            raise ValueError("Bulan harus antara 1 dan 12.")
+        return bulan - 1
+
+    @staticmethod
+    def _rows(arrays: _Arrays, instansi_id: Optional[int]) -> Optional[np.ndarray]:
+        """Mask of the karyawan of `instansi_id`; None selects everyone."""
+        if instansi_id is None:
+            return None
+        code = np.searchsorted(arrays.instansi_ids, instansi_id)
+        if code == len(arrays.instansi_ids) or arrays.instansi_ids[code] != instansi_id:
+            return np.zeros(len(arrays.karyawan_ids), dtype=bool)
+        return arrays.instansi_code == code
+
+    def _series(self, metric: str, bulan: Optional[int], instansi_id: Optional[int]):
+        """(karyawan_ids, values) of one month, or of the year total with `bulan=None`."""
+        arrays = self._arrays
+        m = self._metric(metric)
+        if bulan is None:
+            mask = arrays.any_present
+            values = arrays.totals.get(m)
+            if values is None:
+                values = arrays.totals[m] = arrays.data[m].sum(axis=0, dtype=np.int64)
+        else:
+            month = self._bulan(bulan)
+            mask = arrays.present[month]
+            values = arrays.data[m, month]
+        rows = self._rows(arrays, instansi_id)
+        if rows is not None:
+            mask = mask & rows
+        return arrays.karyawan_ids[mask], values[mask]
+
+    @staticmethod
+    def _records(ids: np.ndarray, values: np.ndarray, name: str = "nilai") -> List[Dict]:
+        return [{"karyawan_id": k, name: v} for k, v in zip(ids.tolist(), values.tolist())]
+
+    # -- queries --------------------------------------------------------------
+
+    def value(self, karyawan_id: int, bulan: int, metric: str) -> Optional[int]:
+        """One cell, or None when the karyawan has no rekap in that month."""
+        arrays = self._arrays
+        m, month = self._metric(metric), self._bulan(bulan)
+        row = np.searchsorted(arrays.karyawan_ids, karyawan_id)
+        if row == len(arrays.karyawan_ids) or arrays.karyawan_ids[row] != karyawan_id or not arrays.present[month, row]:
+            return None
+        return int(arrays.data[m, month, row])
+
+    def top_n(self, metric: str, n: int = 10, bulan: Optional[int] = None, instansi_id: Optional[int] = None) -> List[Dict]:
+        """The `n` karyawan with the highest value (ties by karyawan_id)."""
+        if n < 1:
+            raise ValueError("n harus minimal 1.")
+        ids, values = self._series(metric, bulan, instansi_id)
+        if n < len(values):
+            # only the n largest (and whatever ties the n-th) need sorting
+            cutoff = np.partition(values, len(values) - n)[len(values) - n]
+            keep = values >= cutoff
+            ids, values = ids[keep], values[keep]
+        order = np.lexsort((ids, -values.astype(np.int64)))[:n]
+        return self._records(ids[order], values[order])
+
+    def threshold(self, metric: str, minimum: int, bulan: Optional[int] = None, instansi_id: Optional[int] = None) -> List[Dict]:
+        """Karyawan whose value is greater than `minimum` (e.g. TK > k), by karyawan_id."""
+        ids, values = self._series(metric, bulan, instansi_id)
+        keep = values > minimum
+        return self._records(ids[keep], values[keep])
+
+    def trend(self, metric: str, karyawan_id: Optional[int] = None, instansi_id: Optional[int] = None) -> List[int]:
+        """Monthly totals (January-December) of one karyawan, one instansi or everyone."""
+        arrays = self._arrays
+        column = arrays.data[self._metric(metric)]
+        if karyawan_id is not None:
+            rows = arrays.karyawan_ids == karyawan_id
+        else:
+            rows = self._rows(arrays, instansi_id)
+        if rows is not None:
+            column = column[:, rows]
+        return column.sum(axis=1, dtype=np.int64).tolist()
+
+    def month_over_month(self, metric: str, bulan: int, instansi_id: Optional[int] = None) -> List[Dict]:
+        """Change from `bulan - 1` to `bulan` per karyawan with a rekap in both months."""
+        if not 2 <= bulan <= 12:
+            raise ValueError("Bulan harus antara 2 dan 12.")
+        arrays = self._arrays
+        column = arrays.data[self._metric(metric)]
+        mask = arrays.present[bulan - 2] & arrays.present[bulan - 1]
+        rows = self._rows(arrays, instansi_id)
+        if rows is not None:
+            mask &= rows
+        change = column[bulan - 1, mask].astype(np.int64) - column[bulan - 2, mask]
+        return self._records(arrays.karyawan_ids[mask], change, "perubahan")
+
+    def spikes(self, metric: str, bulan: int, min_increase: int = 1, instansi_id: Optional[int] = None) -> List[Dict]:
+        """Karyawan whose value rose by at least `min_increase` from the previous month (e.g. t4 spikes)."""
+        return [r for r in self.month_over_month(metric, bulan, instansi_id) if r["perubahan"] >= min_increase]
+
+    def percentile(self, metric: str, q, bulan: Optional[int] = None, instansi_id: Optional[int] = None):
+        """Percentile(s) `q` (0-100) of the values; None when nothing matches."""
+        _, values = self._series(metric, bulan, instansi_id)
+        if not len(values):
+            return None
+        result = np.percentile(values, q)
+        return result.tolist() if np.ndim(result) else float(result)
+
+    def stats(self) -> dict:
+        arrays = self._arrays
+        return {
+            "tahun": self.tahun,
+            "karyawan": len(arrays.karyawan_ids),
+            "instansi": len(arrays.instansi_ids),
+            "rows": int(arrays.present.sum()),
+            "bytes": int(arrays.data.nbytes + arrays.present.nbytes),
+        }
+
+
+_CUBES: Dict[int, AttendanceCube] = {}
+_CUBES_LOCK = threading.Lock()
+
+
+def get_cube(tahun: int, engine: Optional[Engine] = None) -> AttendanceCube:
+    """The cube of `tahun`, loaded from the database on first use."""
+    with _CUBES_LOCK:
+        cube = _CUBES.get(tahun)
+        if cube is None:
+            cube = _CUBES[tahun] = AttendanceCube.load(tahun, engine)
+        return cube
+
+
+def refresh_cubes(df_rekap: pd.DataFrame) -> None:
+    """Apply written rekap rows to the cubes already loaded in this process."""
+    if df_rekap.empty:
+        return
+    with _CUBES_LOCK:
+        loaded = [cube for tahun, cube in _CUBES.items() if (df_rekap["tahun"] == tahun).any()]
+    for cube in loaded:
+        cube.apply(df_rekap)
+
+
+def clear_cubes() -> None:
+    """Drop every loaded cube; the next `get_cube` reloads from the database."""
+    with _CUBES_LOCK:
+        _CUBES.clear()
+
+
+__all__ = ["METRICS", "AttendanceCube", "get_cube", "refresh_cubes", "clear_cubes"]
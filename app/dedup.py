@@ -0,0 +1,163 @@
+"""Cross-chunk row deduplication for the ETL.
+
+`default_transform` only drops duplicates inside one chunk. Re-sent
+check-ins in `presensi_kehadiran` usually arrive in different chunks, so the
+ETL can pass every transformed chunk through a `RowDeduplicator` as well:
+each row (or a configured key subset) is reduced to a 64-bit digest with
+`pd.util.hash_pandas_object`, and rows whose digest was already seen in this
+run are dropped.
+
+Seen digests live in a sorted NumPy `uint64` array (8 bytes per distinct
+row, membership by binary search). With `max_memory_hashes` set, the array
+is merged into a sorted run on disk (`numpy.memmap`) whenever it grows past
+that size, so very large tables need only a bounded amount of RAM.
+
+Digests are 64-bit, so two different rows collide with a probability of
+about n^2 / 2^65 (roughly 3e-8 for 1e6 rows).
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+_EMPTY = np.empty(0, dtype=np.uint64)
+# digests read from the on-disk run per step while spilling
+_MERGE_BLOCK = 1 << 20
+
+
+class RowDeduplicator:
+    """Drop rows already seen in earlier chunks of the same run.
+
+    `columns` limits the digest to a key subset (e.g. `karyawan_id`,
+    `tanggal`, `jam`); by default the whole row is hashed. Column order in
+    the chunks must be stable, which it is for chunks of one table.
+    """
+
+    def __init__(self, columns: Optional[Sequence[str]] = None, *, max_memory_hashes: Optional[int] = None, spill_dir: Optional[str] = None):
+        self.columns = list(columns) if columns else None
+        self.max_memory_hashes = max_memory_hashes
+        self.spill_dir = spill_dir
+        self._memory = _EMPTY
+        self._disk: Optional[np.memmap] = None
+        self._disk_path: Optional[str] = None
+        self._lock = threading.Lock()
+
+        self.rows_in = 0
+        self.duplicates = 0
+        self.spills = 0
+
+    def hash_rows(self, df: pd.DataFrame) -> np.ndarray:
+        """64-bit digest per row of `df` (over `columns` if configured)."""
+        frame = df[self.columns] if self.columns else df
+        return pd.util.hash_pandas_object(frame, index=False).to_numpy(dtype=np.uint64)
+
+    def _seen(self, digests: np.ndarray) -> np.ndarray:
+        mask = _contains(self._memory, digests)
+        if self._disk is not None:
+            mask |= _contains(self._disk, digests)
+        return mask
+
+    def filter(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Return `df` without rows seen before (in this chunk or earlier ones)."""
+        if df.empty:
+            return df
+        digests = self.hash_rows(df)
+        with self._lock:
+            # first occurrence within the chunk, then drop what earlier chunks had
+            unique, first = np.unique(digests, return_index=True)
+            fresh = ~self._seen(unique)
+            keep = np.zeros(len(df), dtype=bool)
+            keep[first[fresh]] = True
+            self._add(unique[fresh])
+
+            self.rows_in += len(df)
+            self.duplicates += int(len(df) - keep.sum())
+        if keep.all():
+            return df
+        return df[keep]
+
+    def _add(self, new: np.ndarray) -> None:
+        # `new` is sorted and disjoint from what is stored
+        if not len(new):
+            return
+        self._memory = np.insert(self._memory, np.searchsorted(self._memory, new), new)
+        if self.max_memory_hashes and len(self._memory) > self.max_memory_hashes:
+            self._spill()
+
+    def _spill(self) -> None:
+        """Merge the in-memory digests into the sorted on-disk run."""
+        old = self._disk if self._disk is not None else _EMPTY
+        merged_len = len(old) + len(self._memory)
+        fd, path = tempfile.mkstemp(prefix="etl-dedup-", suffix=".u64", dir=self.spill_dir)
+        os.close(fd)
+        merged = np.memmap(path, dtype=np.uint64, mode="w+", shape=(merged_len,))
+        if not len(old):
+            merged[:] = self._memory
+        # stream the old run in blocks so only one block is in RAM at a time
+        out, mem_start = 0, 0
+        for start in range(0, len(old), _MERGE_BLOCK):
+            block = np.asarray(old[start:start + _MERGE_BLOCK])
+            last = start + _MERGE_BLOCK >= len(old)
+            mem_end = len(self._memory) if last else int(np.searchsorted(self._memory, block[-1]))
+            part = np.concatenate([block, self._memory[mem_start:mem_end]])
+            part.sort()
+            merged[out:out + len(part)] = part
+            out += len(part)
+            mem_start = mem_end
+        merged.flush()
+
+        self._release_disk()
+        self._disk, self._disk_path = merged, path
+        self._memory = _EMPTY
+        self.spills += 1
+
+    def _release_disk(self) -> None:
+        if self._disk is not None:
+            del self._disk
+            self._disk = None
+        if self._disk_path is not None:
+            try:
+                os.remove(self._disk_path)
+            except OSError:
+                pass
+            self._disk_path = None
+
+    def close(self) -> None:
+        """Drop the digests and remove the spill file."""
+        with self._lock:
+            self._memory = _EMPTY
+            self._release_disk()
+
+    def __enter__(self) -> "RowDeduplicator":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def stats(self) -> dict:
+        stored_memory = len(self._memory)
+        stored_disk = len(self._disk) if self._disk is not None else 0
+        return {
+            "rows_in": self.rows_in,
+            "duplicates_dropped": self.duplicates,
+            "unique_rows": stored_memory + stored_disk,
+            "memory_bytes": stored_memory * 8,
+            "disk_bytes": stored_disk * 8,
+            "spills": self.spills,
+        }
+
+
+def _contains(sorted_digests: np.ndarray, digests: np.ndarray) -> np.ndarray:
+    if not len(sorted_digests):
+        return np.zeros(len(digests), dtype=bool)
+    positions = np.searchsorted(sorted_digests, digests)
+    positions[positions == len(sorted_digests)] = 0
+    return np.asarray(sorted_digests[positions]) == digests
+
+
+__all__ = ["RowDeduplicator"]
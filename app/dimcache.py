@@ -0,0 +1,161 @@
+"""In-process cache of the slowly changing dimension tables of a rekap.
+
+`presensi_shift` (a few dozen rows, all instansi) and the `presensi_karyawan`
+rows of an instansi rarely change between two `run_rekap` calls, yet both
+used to be downloaded in full every time. `DimensionCache` keeps them in
+memory, keyed by (source, table, instansi_id). Each entry carries a version:
+the `COUNT(*)` and `MAX(updated_at)` of the rows it was loaded from. A
+request first runs that probe (one aggregate, answered from an index or the
+table header) and only reloads the rows when the version changed. Inserts
+and edits move `MAX(updated_at)`, and hard deletes change `COUNT(*)`.
+
+Entries are evicted least-recently-used once more than `DIMCACHE_MAX_ENTRIES`
+(default 256) are held, so one process serving many instansi keeps the
+active ones. When a table has no `updated_at` column the probe fails and the
+rows are loaded without caching.
+
+`warm_from_env()` preloads the shift table and the karyawan of the instansi
+in `DIMCACHE_WARM_INSTANSI` (comma-separated) from `REMOTE_DATABASE_URL`. The
+API runs it in the background at startup.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from .tabletypes import read_sql_typed
+
+logger = logging.getLogger(__name__)
+
+DIMCACHE_MAX_ENTRIES = int(os.getenv("DIMCACHE_MAX_ENTRIES", 256))
+# tables served through the cache -> whether rows are scoped by instansi_id
+DIMENSIONS = {"presensi_shift": False, "presensi_karyawan": True}
+
+
+class _Entry(NamedTuple):
+    version: Tuple
+    frame: pd.DataFrame
+
+
+class DimensionCache:
+    """Versioned LRU cache of DataFrames, revalidated by a cheap probe on every `get`."""
+
+    def __init__(self, max_entries: int = DIMCACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, probe: Callable[[], Tuple], load: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """Return the frame of `key`, calling `load` only when `probe()` differs from the cached version.
+
+        A probe that raises disables caching for this call: `load` runs and
+        nothing is stored. Callers get a copy and may modify it.
+        """
+        try:
+            version = probe()
+        except Exception:
+            return load()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.frame.copy()
+            self.misses += 1
+
+        frame = load()
+        with self._lock:
+            self._entries[key] = _Entry(version, frame.copy())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return frame
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Drop one entry, or every entry with `key=None`."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+dimension_cache = DimensionCache()
+
+
+def _version(row) -> Tuple:
+    count, updated = row
+    return int(count), None if pd.isna(updated) else str(updated)
+
+
+def fetch_dimension(conn, source: str, table: str, instansi_id: Optional[int] = None,
+                    cache: Optional[DimensionCache] = None) -> pd.DataFrame:
+    """`SELECT * FROM table [WHERE instansi_id = ...]` through the dimension cache.
+
+    `conn` is anything `pd.read_sql` accepts (a SQLAlchemy connection or a
+    pymysql connection). `source` names the database it points at, so the
+    same table of two databases is cached separately.
+    """
+    if table not in DIMENSIONS:
+        raise ValueError(f"Tabel {table} bukan tabel dimensi: {', '.join(DIMENSIONS)}")
+    scoped = DIMENSIONS[table] and instansi_id is not None
+    where = f" WHERE instansi_id = {int(instansi_id)}" if scoped else ""
+
+    def probe() -> Tuple:
+        return _version(pd.read_sql(f"SELECT COUNT(*), MAX(updated_at) FROM {table}{where}", conn).iloc[0])
+
+    def load() -> pd.DataFrame:
+        return read_sql_typed(f"SELECT * FROM {table}{where}", conn, table)
+
+    return (cache or dimension_cache).get((source, table, instansi_id if scoped else None), probe, load)
+
+
+def engine_source(engine) -> str:
+    """Cache source name of a SQLAlchemy engine (its URL without the password)."""
+    return engine.url.render_as_string(hide_password=True)
+
+
+def warm_from_env() -> dict:
+    """Preload `presensi_shift` and the karyawan of `DIMCACHE_WARM_INSTANSI` from `REMOTE_DATABASE_URL`."""
+    remote_url = os.getenv("REMOTE_DATABASE_URL")
+    if not remote_url:
+        return dimension_cache.stats()
+    instansi = [int(i) for i in os.getenv("DIMCACHE_WARM_INSTANSI", "").split(",") if i.strip()]
+    from .analytics import get_engine
+
+    engine = get_engine(remote_url)
+    source = engine_source(engine)
+    try:
+        with engine.connect() as conn:
+            fetch_dimension(conn, source, "presensi_shift")
+            for instansi_id in instansi:
+                fetch_dimension(conn, source, "presensi_karyawan", instansi_id)
+    except Exception:
+        logger.exception("Pemanasan cache dimensi gagal")
+    finally:
+        engine.dispose()
+    return dimension_cache.stats()
+
+
+__all__ = [
+    "DIMCACHE_MAX_ENTRIES",
+    "DIMENSIONS",
+    "DimensionCache",
+    "dimension_cache",
+    "fetch_dimension",
+    "engine_source",
+    "warm_from_env",
+]
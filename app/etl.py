@@ -6,115 +6,936 @@ small and designed to be adapted to the actual notebook transformation logic.
 """
 from __future__ import annotations
 
+import datetime
+import functools
 import os
-from typing import Callable, Iterator, Optional
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Union
 
 import pandas as pd
-from sqlalchemy.engine import Engine
+from sqlalchemy import bindparam, delete, insert, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import sqltypes
 
+from . import models
 from .analytics import get_engine, query_to_df_chunks
+from .bulkload import BulkLoader, get_loader, tune_sqlite_engine
+from .cdc import DiffSync, clear_row_hashes
+from .dedup import RowDeduplicator
+from .lake import ParquetSink
+from .readers import get_reader
+from .tabletypes import TableSchema, table_schema
 
 
-def fetch_table_chunks(table: str, where: Optional[str] = None, chunksize: int = 10000, *, engine: Optional[Engine] = None, database_url: Optional[str] = None) -> Iterator[pd.DataFrame]:
+def fetch_table_chunks(table: str, where: Optional[str] = None, chunksize: int = 10000, *, engine: Optional[Engine] = None, database_url: Optional[str] = None, params: Optional[dict] = None,
+                       key_column: Optional[str] = None, start_after: Any = None) -> Iterator[pd.DataFrame]:
     """Yield DataFrame chunks for `SELECT * FROM {table}` from the source DB.
 
     Provide either an `engine` or a `database_url` (or rely on env var). `where`
-    can be used to filter rows (e.g. "timestamp >= '2025-01-01'").
+    can be used to filter rows (e.g. "timestamp >= '2025-01-01'"). When
+    `params` is given, `where` may reference them as `:name` bind parameters.
+
+    With `key_column` (a unique, indexed column such as the primary key) the
+    table is read by keyset pagination instead: every chunk is its own short
+    `WHERE key > :last ORDER BY key LIMIT n` query on a fresh connection, so
+    no long-running query is held open. `start_after` resumes after that key.
+
+    Tables in `app.tabletypes.TABLE_SCHEMAS` are typed while they are read:
+    datetime columns through `parse_dates`, ids as nullable `Int64`.
     """
-    sql = f"SELECT * FROM {table}"
-    if where:
-        sql = f"{sql} WHERE {where}"
-    # query_to_df_chunks supports engine/database_url
-    yield from query_to_df_chunks(sql, engine=engine, database_url=database_url, chunksize=chunksize)
+    schema = table_schema(table)
+    if key_column:
+        chunks = _fetch_keyset_chunks(table, key_column, where, chunksize, engine=engine, database_url=database_url, params=params,
+                                      start_after=start_after, schema=schema)
+    else:
+        sql = f"SELECT * FROM {table}"
+        if where:
+            sql = f"{sql} WHERE {where}"
+        read_options = {"parse_dates": schema.parse_dates()} if schema else {}
+        # query_to_df_chunks supports engine/database_url
+        if params:
+            chunks = query_to_df_chunks(text(sql), engine=engine, database_url=database_url, chunksize=chunksize, params=params, **read_options)
+        else:
+            chunks = query_to_df_chunks(sql, engine=engine, database_url=database_url, chunksize=chunksize, **read_options)
+    for chunk in chunks:
+        yield schema.cast(chunk) if schema else chunk
+
+
+def _fetch_keyset_chunks(table: str, key_column: str, where: Optional[str], chunksize: int, *, engine: Optional[Engine] = None, database_url: Optional[str] = None,
+                         params: Optional[dict] = None, start_after: Any = None, schema: Optional[TableSchema] = None) -> Iterator[pd.DataFrame]:
+    if engine is None:
+        engine = get_engine(database_url)
+
+    last = start_after
+    while True:
+        conditions = [f"({where})"] if where else []
+        query_params = dict(params or {}, _limit=chunksize)
+        if last is not None:
+            conditions.append(f"{key_column} > :_last_key")
+            query_params["_last_key"] = last
+        sql = f"SELECT * FROM {table}"
+        if conditions:
+            sql = f"{sql} WHERE {' AND '.join(conditions)}"
+        sql = f"{sql} ORDER BY {key_column} LIMIT :_limit"
+
+        with engine.connect() as conn:
+            chunk = get_reader().read(text(sql), conn, params=query_params, parse_dates=schema.parse_dates() if schema else None)
+        if chunk.empty:
+            return
+        yield chunk
+        if len(chunk) < chunksize:
+            return
+        last = chunk[key_column].iloc[-1]
+        last = last.item() if hasattr(last, "item") else last
+
+
+_TIMESTAMP_RE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$")
+
+
+def _parse_watermark(value: Optional[str]) -> Any:
+    # ids are stored as their decimal string, timestamps as ISO text; both
+    # come back with their type so they compare with the next chunk's max()
+    if value is None:
+        return None
+    if value.lstrip("-").isdigit():
+        return int(value)
+    if _TIMESTAMP_RE.match(value):
+        return pd.Timestamp(value)
+    return value
+
+
+def _bind_value(value: Any) -> Any:
+    # DB-API drivers understand datetime, not pandas Timestamp
+    return value.to_pydatetime() if isinstance(value, pd.Timestamp) else value
+
+
+def get_watermark(conn: Connection, table: str) -> Optional[Any]:
+    """Return the persisted high-water mark for `table` (None if never loaded)."""
+    state = models.EtlStateModel.__table__
+    row = conn.execute(select(state.c.watermark_value).where(state.c.table_name == table)).first()
+    return _parse_watermark(row[0]) if row else None
+
+
+def save_watermark(conn: Connection, table: str, column: str, value: Any) -> None:
+    """Insert or advance the high-water mark row for `table`."""
+    state = models.EtlStateModel.__table__
+    values = {
+        "watermark_column": column,
+        "watermark_value": None if value is None else str(value),
+        "updated_at": datetime.datetime.now(),
+    }
+    result = conn.execute(update(state).where(state.c.table_name == table).values(**values))
+    if result.rowcount == 0:
+        conn.execute(insert(state).values(table_name=table, **values))
+
+
+def reset_watermark(conn: Connection, table: str) -> None:
+    """Forget the high-water mark for `table` so the next run copies everything."""
+    state = models.EtlStateModel.__table__
+    conn.execute(delete(state).where(state.c.table_name == table))
+
+
+def get_checkpoint(conn: Connection, table: str) -> Optional[dict]:
+    """Return the resume checkpoint of an interrupted keyset run for `table`, if any."""
+    journal = models.EtlCheckpointModel.__table__
+    row = conn.execute(select(journal).where(journal.c.table_name == table)).mappings().first()
+    if row is None:
+        return None
+    checkpoint = dict(row)
+    checkpoint["first_key"] = _parse_watermark(checkpoint["first_key"])
+    checkpoint["last_key"] = _parse_watermark(checkpoint["last_key"])
+    return checkpoint
+
+
+def save_checkpoint(conn: Connection, table: str, key_column: str, last_key: Any, rows_loaded: int, watermark_value: Any = None, first_key: Any = None,
+                    keys: Sequence[Any] = ()) -> None:
+    """Record the last committed chunk; call in the same transaction as the chunk load.
+
+    `first_key` is the first key loaded by the run. `keys` are the keys of the
+    rows the chunk loaded; they are journaled so that the rows of a discarded
+    run can be removed again (see `discard_checkpoint`).
+    """
+    journal = models.EtlCheckpointModel.__table__
+    values = {
+        "key_column": key_column,
+        "first_key": None if first_key is None else str(first_key),
+        "last_key": str(last_key),
+        "rows_loaded": int(rows_loaded),
+        "watermark_value": None if watermark_value is None else str(watermark_value),
+        "updated_at": datetime.datetime.now(),
+    }
+    result = conn.execute(update(journal).where(journal.c.table_name == table).values(**values))
+    if result.rowcount == 0:
+        conn.execute(insert(journal).values(table_name=table, **values))
+    if len(keys):
+        loaded = models.EtlCheckpointKeyModel.__table__
+        conn.execute(insert(loaded), [{"table_name": table, "key_value": str(_key_value(k))} for k in keys])
+
+
+def clear_checkpoint(conn: Connection, table: str) -> None:
+    journal = models.EtlCheckpointModel.__table__
+    conn.execute(delete(journal).where(journal.c.table_name == table))
+    loaded = models.EtlCheckpointKeyModel.__table__
+    if inspect(conn).has_table(loaded.name):
+        conn.execute(delete(loaded).where(loaded.c.table_name == table))
+
+
+def discard_checkpoint(conn: Connection, table: str, checkpoint: dict, batch_size: int = 500) -> None:
+    """Drop an interrupted run: delete the rows it committed and its checkpoint.
+
+    Only the keys journaled by the run (`save_checkpoint(keys=...)`) are
+    deleted, so rows that earlier runs loaded into the same key range stay.
+    """
+    loaded = models.EtlCheckpointKeyModel.__table__
+    if inspect(conn).has_table(table) and inspect(conn).has_table(loaded.name):
+        key = checkpoint["key_column"]
+        keys = conn.execute(select(loaded.c.key_value).where(loaded.c.table_name == table)).scalars().all()
+        stmt = text(f"DELETE FROM {table} WHERE {key} IN :keys").bindparams(bindparam("keys", expanding=True))
+        for start in range(0, len(keys), batch_size):
+            batch = [_bind_value(_parse_watermark(k)) for k in keys[start:start + batch_size]]
+            conn.execute(stmt, {"keys": batch})
+    clear_checkpoint(conn, table)
+
+
+def _key_value(value: Any) -> Any:
+    # numpy scalars -> Python values, so they are journaled as plain text
+    return value.item() if hasattr(value, "item") else value
+
 
+def _normalize_column(name: Any) -> str:
+    return str(name).strip().lower().replace(" ", "_")
 
-def default_transform(df: pd.DataFrame) -> pd.DataFrame:
+
+DATETIME_UNIT = "us"
+
+
+def _converter_for(column_type) -> Optional[tuple]:
+    # order matters: DateTime/Date/Time and BigInteger/SmallInteger are
+    # checked through their generic SQLAlchemy base types
+    if isinstance(column_type, sqltypes.DateTime):
+        return ("datetime", "ISO8601")
+    if isinstance(column_type, sqltypes.Date):
+        return ("datetime", "%Y-%m-%d")
+    if isinstance(column_type, sqltypes.Time):
+        return ("timedelta", None)
+    if isinstance(column_type, sqltypes.Boolean):
+        return ("astype", "boolean")
+    if isinstance(column_type, sqltypes.Integer):
+        # nullable integer, so chunks with and without NULLs agree on dtype
+        return ("astype", "Int64")
+    if isinstance(column_type, (sqltypes.Float, sqltypes.Numeric)):
+        return ("numeric", "float64")
+    return None
+
+
+class ConverterPlan:
+    """Typed per-column converters for one source table.
+
+    Built once from the reflected source schema (`ConverterPlan.reflect`) and
+    applied to every chunk: temporal columns are parsed with an explicit
+    format into `datetime64[us]` (DATE and DATETIME alike), integers become nullable `Int64`, decimals `float64`, booleans
+    `boolean`. Text columns are left untouched, whatever their name.
+    """
+
+    def __init__(self, table: str, converters: Dict[str, tuple]):
+        self.table = table
+        self.converters = converters
+
+    @classmethod
+    def reflect(cls, engine: Engine, table: str) -> "ConverterPlan":
+        converters = {}
+        for column in inspect(engine).get_columns(table):
+            converter = _converter_for(column["type"])
+            if converter is not None:
+                converters[_normalize_column(column["name"])] = converter
+        return cls(table, converters)
+
+    def excluding(self, columns: Sequence[str]) -> "ConverterPlan":
+        """The plan without `columns`, e.g. those already typed at read time."""
+        skip = set(columns)
+        return ConverterPlan(self.table, {c: conv for c, conv in self.converters.items() if c not in skip})
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        for col, (kind, arg) in self.converters.items():
+            if col not in df.columns:
+                continue
+            if kind == "datetime":
+                # DATE values (datetime.date) parse to [s], DATETIME to [us]: keep one unit
+                df[col] = pd.to_datetime(df[col], format=arg, errors="coerce").dt.as_unit(DATETIME_UNIT)
+            elif kind == "timedelta":
+                df[col] = pd.to_timedelta(df[col], errors="coerce")
+            elif kind == "numeric":
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype(arg)
+            else:
+                df[col] = df[col].astype(arg)
+        return df
+
+
+_PLAN_CACHE: Dict[tuple, ConverterPlan] = {}
+_PLAN_CACHE_LOCK = threading.Lock()
+
+
+def get_converter_plan(engine: Engine, table: str) -> ConverterPlan:
+    """Return the cached `ConverterPlan` of `table` on `engine`'s database, reflecting it on first use."""
+    key = (engine.url.render_as_string(hide_password=True), table)
+    with _PLAN_CACHE_LOCK:
+        plan = _PLAN_CACHE.get(key)
+    if plan is None:
+        plan = ConverterPlan.reflect(engine, table)
+        with _PLAN_CACHE_LOCK:
+            _PLAN_CACHE[key] = plan
+    return plan
+
+
+def clear_converter_plans() -> None:
+    """Forget cached plans, e.g. after a source schema change."""
+    with _PLAN_CACHE_LOCK:
+        _PLAN_CACHE.clear()
+
+
+def default_transform(df: pd.DataFrame, plan: Optional[ConverterPlan] = None) -> pd.DataFrame:
     """A small, safe default transform to apply to each chunk.
 
     - Normalize column names to snake_case-ish (lowercase, replace spaces)
+    - Convert columns with the typed `plan` of the source table, if given
     - Drop exact-duplicate rows
-    - Attempt to parse any column with 'time' or 'date' in the name as datetime
     Users should replace this with notebook-specific transforms.
     """
     if df.empty:
         return df
 
     # normalize columns
-    df = df.rename(columns=lambda c: str(c).strip().lower().replace(" ", "_") )
+    df = df.rename(columns=_normalize_column)
 
-    # parse datetime-like columns heuristically
-    for col in df.columns:
-        if any(k in col for k in ("time", "date", "at", "timestamp")):
-            try:
-                df[col] = pd.to_datetime(df[col], errors="coerce")
-            except Exception:
-                # if parsing fails, leave as-is
-                pass
+    if plan is not None:
+        df = plan.apply(df)
 
     # drop exact duplicates
     df = df.drop_duplicates()
     return df
 
 
-def append_chunks_to_table(chunks: Iterator[pd.DataFrame], table: str, local_engine: Optional[Engine] = None, local_database_url: Optional[str] = None, if_exists: str = "append") -> int:
-    """Write chunk iterator into local DB table using pandas.to_sql.
+def schema_transform(plan: ConverterPlan) -> Callable[[pd.DataFrame], pd.DataFrame]:
+    """`default_transform` bound to a table's converter plan."""
+    return functools.partial(default_transform, plan=plan)
+
 
+def append_chunks_to_table(chunks: Iterator[pd.DataFrame], table: str, local_engine: Optional[Union[Engine, Connection]] = None, local_database_url: Optional[str] = None, if_exists: str = "append",
+                           loader: Optional[BulkLoader] = None) -> int:
+    """Write chunk iterator into local DB table with the dialect's bulk loader.
+
+    `local_engine` may also be a Connection, in which case all chunks are
+    written inside the caller's transaction; with an Engine they are written
+    in one transaction of their own. `loader` defaults to
+    `bulkload.get_loader` for the target dialect.
     Returns total number of rows written.
     """
-    written = 0
     # if local_engine is None, get_engine will use env DATABASE_URL
     engine = local_engine or get_engine(local_database_url)
+    if isinstance(engine, Engine):
+        with engine.begin() as conn:
+            return append_chunks_to_table(chunks, table, local_engine=conn, if_exists=if_exists, loader=loader)
 
+    loader = loader or get_loader(engine.dialect.name)
+    written = 0
     first = True
     for chunk in chunks:
         if chunk.empty:
             continue
         # use if_exists='replace' only for the first chunk when requested
         mode = if_exists if first else "append"
-        chunk.to_sql(table, engine, if_exists=mode, index=False, method="multi")
-        written += len(chunk)
+        written += loader.load(engine, table, chunk, if_exists=mode)
         first = False
 
     return written
 
 
+class StageCounter:
+    """Throughput counters for one pipeline stage (fetch, transform or load)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.chunks = 0
+        self.rows = 0
+        self.busy_seconds = 0.0
+
+    def add(self, rows: int, seconds: float) -> None:
+        self.chunks += 1
+        self.rows += rows
+        self.busy_seconds += seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "chunks": self.chunks,
+            "rows": self.rows,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "rows_per_sec": round(self.rows / self.busy_seconds, 1) if self.busy_seconds else None,
+        }
+
+
+class ChunkBudget:
+    """Global cap on the chunks held in memory by concurrently running pipelines.
+
+    A pipeline takes one unit before fetching a chunk and gives it back once
+    that chunk is loaded, so all tables of a parallel run together keep at
+    most `max_chunks` chunks between their fetch and load stages.
+    """
+
+    def __init__(self, max_chunks: int):
+        if max_chunks < 1:
+            raise ValueError("max_chunks must be >= 1")
+        self.max_chunks = max_chunks
+        self._semaphore = threading.Semaphore(max_chunks)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak = 0
+
+    def acquire(self, stop: Optional[threading.Event] = None) -> bool:
+        """Take one unit; wait while the budget is exhausted, give up once `stop` is set."""
+        while not self._semaphore.acquire(timeout=0.1):
+            if stop is not None and stop.is_set():
+                return False
+        with self._lock:
+            self.in_use += 1
+            self.peak = max(self.peak, self.in_use)
+        return True
+
+    def release(self, units: int = 1) -> None:
+        for _ in range(units):
+            with self._lock:
+                self.in_use -= 1
+            self._semaphore.release()
+
+
+_DONE = object()
+_JOURNAL_DDL_LOCK = threading.Lock()
+_SQLITE_WRITERS: Dict[str, threading.Lock] = {}
+
+
+@contextmanager
+def _local_writer(engine: Engine) -> Iterator[None]:
+    """Hold the write lock of a SQLite database for the local phase of one table.
+
+    SQLite lets one transaction write at a time, and the single-transaction
+    and diff modes hold theirs for the whole table. Tables of a parallel run
+    (`etl_tables`) writing to the same SQLite file therefore run their local
+    phase one after the other instead of failing with "database is locked".
+    The lock is taken before the table's pipeline starts, so a waiting table
+    holds no `ChunkBudget` units. Other dialects are not serialized.
+    """
+    if engine.dialect.name != "sqlite":
+        yield
+        return
+    with _JOURNAL_DDL_LOCK:
+        database = engine.url.database or ":memory:"
+        if database != ":memory:":
+            database = os.path.abspath(database)
+        lock = _SQLITE_WRITERS.setdefault(database, threading.Lock())
+    with lock:
+        yield
+
+
+def run_pipeline(source: Iterator[Any], transform: Callable[[Any], Any], load: Callable[[Any], int], *,
+                 max_in_flight: int = 2, rows_of: Callable[[Any], int] = len,
+                 budget: Optional[ChunkBudget] = None) -> Dict[str, dict]:
+    """Run fetch -> transform -> load as overlapping stages.
+
+    `source` is iterated on a fetch thread and `transform` runs on a transform
+    thread; `load` runs on the calling thread, so local DB connections and
+    transactions stay where the caller opened them. Stages are connected by
+    bounded queues of `max_in_flight` chunks each: a slow stage blocks the one
+    before it (backpressure), which caps memory at roughly
+    `2 * max_in_flight + 3` chunks. `max_in_flight=0` runs the stages
+    sequentially on the calling thread. With a shared `budget` every chunk
+    also holds one unit of it from fetch until it is loaded.
+
+    Returns per-stage counters (chunks, rows, busy seconds, rows/sec) plus
+    the pipeline wall time. The first error raised by any stage is re-raised.
+    """
+    counters = {name: StageCounter(name) for name in ("fetch", "transform", "load")}
+    started = time.perf_counter()
+    # budget units taken by this pipeline and not yet given back
+    held = [0]
+    held_lock = threading.Lock()
+
+    def give_back(units: int) -> None:
+        if budget is not None and units:
+            with held_lock:
+                held[0] -= units
+            budget.release(units)
+
+    def timed_next(iterator, stop: Optional[threading.Event] = None):
+        if budget is not None:
+            if not budget.acquire(stop):
+                return _DONE
+            with held_lock:
+                held[0] += 1
+        t0 = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            give_back(1)
+            return _DONE
+        except BaseException:
+            give_back(1)
+            raise
+        counters["fetch"].add(rows_of(item), time.perf_counter() - t0)
+        return item
+
+    def timed_transform(item):
+        t0 = time.perf_counter()
+        out = transform(item)
+        counters["transform"].add(rows_of(item), time.perf_counter() - t0)
+        return out
+
+    def timed_load(item):
+        t0 = time.perf_counter()
+        try:
+            rows = load(item)
+        finally:
+            give_back(1)
+        counters["load"].add(rows, time.perf_counter() - t0)
+
+    try:
+        _drive_pipeline(source, timed_next, timed_transform, timed_load, max_in_flight)
+    finally:
+        # chunks dropped after an error still hold their budget units
+        give_back(held[0])
+
+    stats = {name: counter.as_dict() for name, counter in counters.items()}
+    stats["wall_seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def _drive_pipeline(source: Iterator[Any], timed_next: Callable, timed_transform: Callable, timed_load: Callable, max_in_flight: int) -> None:
+    if max_in_flight <= 0:
+        iterator = iter(source)
+        while (item := timed_next(iterator)) is not _DONE:
+            timed_load(timed_transform(item))
+    else:
+        fetched: queue.Queue = queue.Queue(maxsize=max_in_flight)
+        transformed: queue.Queue = queue.Queue(maxsize=max_in_flight)
+        stop = threading.Event()
+        errors: list = []
+
+        def put(q: queue.Queue, item) -> bool:
+            # block while the next stage is full, but give up once stopped
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q: queue.Queue):
+            # block while the previous stage is busy, but give up once stopped
+            while True:
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    if stop.is_set():
+                        return _DONE
+
+        def fail(exc: BaseException) -> None:
+            errors.append(exc)
+            stop.set()
+
+        def fetch_worker():
+            iterator = iter(source)
+            try:
+                while not stop.is_set():
+                    item = timed_next(iterator, stop)
+                    if item is _DONE or not put(fetched, item):
+                        break
+                put(fetched, _DONE)
+            except BaseException as exc:
+                fail(exc)
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+
+        def transform_worker():
+            try:
+                while not stop.is_set():
+                    item = get(fetched)
+                    if item is _DONE:
+                        put(transformed, _DONE)
+                        break
+                    if not put(transformed, timed_transform(item)):
+                        break
+            except BaseException as exc:
+                fail(exc)
+
+        workers = [
+            threading.Thread(target=fetch_worker, name="etl-fetch", daemon=True),
+            threading.Thread(target=transform_worker, name="etl-transform", daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            while not stop.is_set():
+                item = get(transformed)
+                if item is _DONE:
+                    break
+                timed_load(item)
+        except BaseException as exc:
+            fail(exc)
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+        if errors:
+            raise errors[0]
+
+
 def etl_table(table: str, transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None, *,
               remote_database_url_env: str = "REMOTE_DATABASE_URL", local_database_url_env: str = "DATABASE_URL",
               remote_database_url: Optional[str] = None, local_database_url: Optional[str] = None,
-              chunksize: int = 10000, where: Optional[str] = None) -> int:
+              chunksize: int = 10000, where: Optional[str] = None,
+              watermark_column: Optional[str] = None, full: bool = False,
+              key_column: Optional[str] = None, resume: bool = True,
+              max_in_flight: int = 2, stats: Optional[dict] = None, budget: Optional[ChunkBudget] = None,
+              dedup: Optional[RowDeduplicator] = None, diff_keys: Optional[Sequence[str]] = None,
+              delete_missing: bool = False, parquet_sink: Optional[ParquetSink] = None) -> int:
     """Perform ETL for a single table: fetch -> transform -> load.
 
     - `transform` is applied to each chunk. If not provided, `default_transform`
-      is used.
+      is used with the table's cached `ConverterPlan`.
     - `remote_database_url` overrides env var `REMOTE_DATABASE_URL`.
     - `local_database_url` overrides env var `DATABASE_URL`.
-    Returns number of rows written to local DB.
+    - `watermark_column` enables incremental ETL: only rows with
+      `watermark_column` greater than the mark stored in the local `etl_state`
+      table are fetched, and the mark advances to the largest value loaded
+      once the load has committed. Use a monotonic id or timestamp.
+    - `full=True` resets the mark and replaces the local table.
+    - `key_column` switches to keyset-paginated fetching (see
+      `fetch_table_chunks`). Each chunk then commits together with a
+      checkpoint in the local `etl_checkpoint` journal, and a run that was
+      interrupted resumes after the last committed chunk (`resume=False`
+      discards the checkpoint and starts over).
+    Without `key_column` the whole load is a single local transaction.
+    - The stages overlap (see `run_pipeline`): the next chunk downloads while
+      the previous one is transformed and written. `max_in_flight` bounds the
+      chunks queued between stages (0 = sequential). Pass a dict as `stats`
+      to receive the per-stage throughput counters. `budget` is a
+      `ChunkBudget` shared with other tables loading at the same time.
+    - `dedup` (a `RowDeduplicator`) drops rows already seen in earlier chunks
+      of this run; its counters are added to `stats` under "dedup".
+    - `diff_keys` switches to diff sync for tables edited in place (see
+      `app/cdc.py`): the whole table is read, and only new or changed rows
+      (by content hash, per key) are written. `delete_missing=True` also
+      deletes local rows whose key is gone. Counters go to `stats["diff"]`.
+      Returns the number of rows written.
+    - `parquet_sink` (an `app.lake.ParquetSink`) also writes every loaded
+      chunk to the partitioned Parquet lake. Files are published only after
+      the local transaction that loaded them has committed; a keyset run
+      compacts the per-chunk files of each partition when it completes. Counters go to
+      `stats["parquet"]`. Not available with `diff_keys`.
+    Returns number of rows written to local DB (including rows committed by
+    an interrupted run that was resumed).
     """
-    transform = transform or default_transform
-
     remote_url = remote_database_url or os.getenv(remote_database_url_env)
     local_url = local_database_url or os.getenv(local_database_url_env)
 
-    # yield chunks from remote
-    chunk_iter = fetch_table_chunks(table, where=where, chunksize=chunksize, database_url=remote_url)
+    if transform is None:
+        # types come from the source schema, reflected once per table
+        remote_engine = get_engine(remote_url)
+        try:
+            plan = get_converter_plan(remote_engine, table)
+            schema = table_schema(table)
+            if schema is not None:
+                # registered columns are typed while they are read (fetch_table_chunks)
+                plan = plan.excluding(schema.columns)
+            transform = schema_transform(plan)
+        finally:
+            remote_engine.dispose()
+    if dedup is not None:
+        transform = _deduplicating(transform, dedup)
 
-    # apply transform and write chunk-by-chunk to avoid large memory usage
-    def transformed_chunks() -> Iterator[pd.DataFrame]:
-        for chunk in chunk_iter:
-            try:
-                out = transform(chunk)
-            except Exception:
-                # if transform fails for a chunk, skip or re-raise depending on needs
-                raise
-            yield out
+    local_engine = tune_sqlite_engine(get_engine(local_url))
+    # a SQLite target has one writer: parallel tables take turns there
+    with _local_writer(local_engine):
+        # tables loading in parallel (`etl_tables`) share these journal tables
+        with _JOURNAL_DDL_LOCK:
+            if watermark_column:
+                models.EtlStateModel.__table__.create(local_engine, checkfirst=True)
+            if key_column:
+                models.EtlCheckpointModel.__table__.create(local_engine, checkfirst=True)
+                models.EtlCheckpointKeyModel.__table__.create(local_engine, checkfirst=True)
 
-    written = append_chunks_to_table(transformed_chunks(), table, local_database_url=local_url, if_exists="append")
-    return written
+        if diff_keys:
+            if parquet_sink is not None:
+                raise ValueError("the Parquet sink only receives appended rows; it cannot be combined with diff_keys")
+            if watermark_column:
+                raise ValueError("diff sync compares whole tables; it cannot be combined with watermark_column")
+            if delete_missing and where:
+                raise ValueError("delete_missing needs the whole table; it cannot be combined with where")
+            return _etl_diff(table, transform, local_engine, remote_url, chunksize, where, key_column=key_column,
+                             diff_keys=diff_keys, delete_missing=delete_missing, full=full,
+                             max_in_flight=max_in_flight, stats=stats, budget=budget)
+
+        with local_engine.begin() as local_conn:
+            checkpoint = None
+            if key_column:
+                checkpoint = get_checkpoint(local_conn, table)
+                if checkpoint is not None and (full or not resume):
+                    # start over: a full copy replaces the table anyway, otherwise
+                    # remove what the interrupted run already committed
+                    if full:
+                        clear_checkpoint(local_conn, table)
+                    else:
+                        discard_checkpoint(local_conn, table, checkpoint)
+                    checkpoint = None
+
+            mark = None
+            if watermark_column:
+                if full:
+                    reset_watermark(local_conn, table)
+                else:
+                    mark = get_watermark(local_conn, table)
+
+        fetch_where, params = where, None
+        if mark is not None:
+            fetch_where = f"{watermark_column} > :watermark" + (f" AND ({where})" if where else "")
+            params = {"watermark": _bind_value(mark)}
+
+        if key_column:
+            written = _etl_keyset(table, transform, local_engine, remote_url, chunksize, fetch_where, params,
+                                  key_column=key_column, watermark_column=watermark_column, full=full, checkpoint=checkpoint,
+                                  max_in_flight=max_in_flight, stats=stats, budget=budget, parquet_sink=parquet_sink)
+            if stats is not None and dedup is not None:
+                stats["dedup"] = dedup.stats()
+            return written
+
+        # everything below commits together: the loaded rows and the new mark
+        try:
+            written, run_stats = _etl_single_transaction(table, transform, local_engine, remote_url, chunksize, fetch_where, params,
+                                                         watermark_column=watermark_column, full=full, max_in_flight=max_in_flight,
+                                                         budget=budget, parquet_sink=parquet_sink)
+        except BaseException:
+            if parquet_sink is not None:
+                parquet_sink.abort()
+            raise
+        if parquet_sink is not None:
+            parquet_sink.commit()
+
+        if stats is not None:
+            stats.update(run_stats)
+            if dedup is not None:
+                stats["dedup"] = dedup.stats()
+            if parquet_sink is not None:
+                stats["parquet"] = parquet_sink.stats()
+        return written
+
+
+def _etl_single_transaction(table: str, transform: Callable[[pd.DataFrame], pd.DataFrame], local_engine: Engine, remote_url: Optional[str],
+                            chunksize: int, fetch_where: Optional[str], params: Optional[dict], *, watermark_column: Optional[str], full: bool,
+                            max_in_flight: int, budget: Optional[ChunkBudget], parquet_sink: Optional[ParquetSink]):
+    """Streaming ETL loop: all chunks and the new mark in one local transaction."""
+    with local_engine.begin() as local_conn:
+        # yield chunks from remote
+        chunk_iter = fetch_table_chunks(table, where=fetch_where, chunksize=chunksize, database_url=remote_url, params=params)
+
+        # rows fetched are all past `mark`, so the new mark is the max loaded
+        state = {"high": None, "written": 0, "if_exists": "replace" if full else "append"}
+
+        def transform_stage(chunk: pd.DataFrame) -> pd.DataFrame:
+            if watermark_column and not chunk.empty:
+                state["high"] = _max_value(state["high"], chunk[watermark_column].max())
+            return transform(chunk)
+
+        def load_stage(out: pd.DataFrame) -> int:
+            rows = append_chunks_to_table(iter([out]), table, local_engine=local_conn, if_exists=state["if_exists"])
+            if rows:
+                # use if_exists='replace' only for the first written chunk
+                state["if_exists"] = "append"
+            if parquet_sink is not None:
+                parquet_sink.write(out)
+            state["written"] += rows
+            return rows
+
+        run_stats = run_pipeline(chunk_iter, transform_stage, load_stage, max_in_flight=max_in_flight, budget=budget)
+
+        if watermark_column and state["high"] is not None:
+            save_watermark(local_conn, table, watermark_column, state["high"])
+
+    return state["written"], run_stats
+
+
+def _etl_diff(table: str, transform: Callable[[pd.DataFrame], pd.DataFrame], local_engine: Engine, remote_url: Optional[str], chunksize: int,
+              where: Optional[str], *, key_column: Optional[str], diff_keys: Sequence[str], delete_missing: bool, full: bool,
+              max_in_flight: int = 2, stats: Optional[dict] = None, budget: Optional[ChunkBudget] = None) -> int:
+    """Diff-sync loop: one local transaction, only changed rows written."""
+    with local_engine.begin() as local_conn:
+        if full:
+            clear_row_hashes(local_conn, table)
+        sync = DiffSync(local_conn, table, diff_keys, delete_missing=delete_missing)
+        # keyset pages without checkpoints: a diff run is one transaction
+        chunks = fetch_table_chunks(table, where=where, chunksize=chunksize, database_url=remote_url, key_column=key_column)
+        run_stats = run_pipeline(chunks, transform, sync.apply, max_in_flight=max_in_flight, budget=budget)
+        sync.finish()
+
+    if stats is not None:
+        stats.update(run_stats)
+        stats["diff"] = sync.stats()
+    return sync.inserted + sync.updated
+
+
+def _deduplicating(transform: Callable[[pd.DataFrame], pd.DataFrame], dedup: RowDeduplicator) -> Callable[[pd.DataFrame], pd.DataFrame]:
+    def transform_and_dedup(chunk: pd.DataFrame) -> pd.DataFrame:
+        return dedup.filter(transform(chunk))
+    return transform_and_dedup
+
+
+def _max_value(current: Any, candidate: Any) -> Any:
+    if current is None:
+        return candidate
+    if candidate is None:
+        return current
+    # a restored timestamp mark vs. a chunk read as text (or the reverse)
+    if isinstance(current, (pd.Timestamp, datetime.datetime)) or isinstance(candidate, (pd.Timestamp, datetime.datetime)):
+        current, candidate = pd.Timestamp(current), pd.Timestamp(candidate)
+    return candidate if candidate > current else current
+
+
+def _etl_keyset(table: str, transform: Callable[[pd.DataFrame], pd.DataFrame], local_engine: Engine, remote_url: Optional[str], chunksize: int,
+                where: Optional[str], params: Optional[dict], *, key_column: str, watermark_column: Optional[str], full: bool, checkpoint: Optional[dict],
+                max_in_flight: int = 2, stats: Optional[dict] = None, budget: Optional[ChunkBudget] = None,
+                parquet_sink: Optional[ParquetSink] = None) -> int:
+    """Keyset ETL loop: one short source query and one local commit per chunk."""
+    start_after = checkpoint["last_key"] if checkpoint else None
+    state = {
+        "written": int(checkpoint["rows_loaded"]) if checkpoint else 0,
+        "high": _parse_watermark(checkpoint["watermark_value"]) if checkpoint else None,
+        "first_key": checkpoint["first_key"] if checkpoint else None,
+        # a resumed run already replaced the table before it was interrupted
+        "if_exists": "replace" if full and checkpoint is None else "append",
+    }
+
+    def transform_stage(chunk: pd.DataFrame):
+        first_key, last_key = chunk[key_column].iloc[0], chunk[key_column].iloc[-1]
+        chunk_high = chunk[watermark_column].max() if watermark_column else None
+        out = transform(chunk)
+        # keys of the rows actually loaded (the transform may drop some)
+        keys = (out[key_column] if key_column in out.columns else chunk[key_column]).tolist()
+        return out, first_key, last_key, chunk_high, keys
+
+    def load_stage(item) -> int:
+        out, first_key, last_key, chunk_high, keys = item
+        high = _max_value(state["high"], chunk_high) if chunk_high is not None else state["high"]
+        if state["first_key"] is None:
+            state["first_key"] = first_key
+        try:
+            with local_engine.begin() as local_conn:
+                rows = append_chunks_to_table(iter([out]), table, local_engine=local_conn, if_exists=state["if_exists"])
+                save_checkpoint(local_conn, table, key_column, last_key, state["written"] + rows, high, first_key=state["first_key"],
+                                keys=keys if rows else ())
+                if parquet_sink is not None:
+                    parquet_sink.write(out)
+        except BaseException:
+            if parquet_sink is not None:
+                parquet_sink.abort()
+            raise
+        if parquet_sink is not None:
+            parquet_sink.commit()
+        state["written"] += rows
+        state["high"] = high
+        if rows:
+            state["if_exists"] = "append"
+        return rows
+
+    chunks = fetch_table_chunks(table, where=where, chunksize=chunksize, database_url=remote_url, params=params,
+                                key_column=key_column, start_after=start_after)
+    run_stats = run_pipeline(chunks, transform_stage, load_stage, max_in_flight=max_in_flight,
+                             rows_of=lambda item: len(item[0]) if isinstance(item, tuple) else len(item), budget=budget)
+
+    with local_engine.begin() as local_conn:
+        if watermark_column and state["high"] is not None:
+            save_watermark(local_conn, table, watermark_column, state["high"])
+        clear_checkpoint(local_conn, table)
+    if parquet_sink is not None:
+        # one file per partition per chunk so far: merge them now the run is complete
+        parquet_sink.compact()
+
+    if stats is not None:
+        stats.update(run_stats)
+        if parquet_sink is not None:
+            stats["parquet"] = parquet_sink.stats()
+    return state["written"]
+
+
+def etl_tables(tables: Sequence[str], *, jobs: int = 1, chunk_budget: Optional[int] = None, dedup_options: Optional[dict] = None,
+               parquet_options: Optional[dict] = None, **etl_kwargs) -> List[dict]:
+    """Run `etl_table` for several independent tables, `jobs` at a time.
+
+    Every table runs on its own worker thread with its own source and target
+    engines. On a SQLite target the tables' local phases take turns (see
+    `_local_writer`). `chunk_budget` caps the chunks held in memory by all running
+    tables together (see `ChunkBudget`). A failing table does not stop the
+    others; its error is reported in the summary instead. With
+    `dedup_options` every table gets its own `RowDeduplicator(**dedup_options)`,
+    and with `parquet_options` its own `ParquetSink(dataset=table, **parquet_options)`.
+
+    Returns one summary dict per table, in the order given: `table`, `rows`,
+    `seconds`, `rows_per_sec`, `error` (None on success) and `stats` (the
+    per-stage counters).
+    """
+    budget = ChunkBudget(chunk_budget) if chunk_budget else None
+
+    def run_one(table: str) -> dict:
+        stats: dict = {}
+        started = time.perf_counter()
+        rows, error = 0, None
+        dedup = RowDeduplicator(**dedup_options) if dedup_options is not None else None
+        try:
+            sink = ParquetSink(dataset=table, **parquet_options) if parquet_options is not None else None
+            rows = etl_table(table, stats=stats, budget=budget, dedup=dedup, parquet_sink=sink, **etl_kwargs)
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        finally:
+            if dedup is not None:
+                dedup.close()
+        seconds = time.perf_counter() - started
+        return {
+            "table": table,
+            "rows": rows,
+            "seconds": round(seconds, 3),
+            "rows_per_sec": round(rows / seconds, 1) if rows and seconds else None,
+            "error": error,
+            "stats": stats,
+        }
+
+    if jobs <= 1:
+        return [run_one(table) for table in tables]
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="etl-table") as pool:
+        return list(pool.map(run_one, tables))
 
 
 __all__ = [
     "fetch_table_chunks",
     "default_transform",
+    "schema_transform",
+    "ConverterPlan",
+    "get_converter_plan",
+    "clear_converter_plans",
     "append_chunks_to_table",
     "etl_table",
+    "etl_tables",
+    "run_pipeline",
+    "StageCounter",
+    "ChunkBudget",
+    "get_watermark",
+    "save_watermark",
+    "reset_watermark",
+    "get_checkpoint",
+    "save_checkpoint",
+    "clear_checkpoint",
+    "discard_checkpoint",
 ]
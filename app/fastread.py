@@ -0,0 +1,208 @@
+"""Lean read path for the list endpoints in `app/main.py`.
+
+The ORM path hydrates a model object per row, re-validates it through the
+Pydantic response schema and then lets FastAPI serialize the result again.
+The helpers here run a Core `select()` on exactly the response columns,
+fetch plain row tuples and encode the `{"count": ..., "data": [...]}` body
+in one go. The JSON produced is the same as serializing
+`RekapKehadiranListResponse` / `PresensiKaryawanListResponse`.
+
+Bulk consumers can ask for Apache Arrow IPC (stream or file) or Parquet instead via
+the `Accept` header; record batches are then built straight from the DB
+cursor and no JSON is produced at all. This needs `pyarrow`.
+"""
+from __future__ import annotations
+
+import datetime
+import io
+import json
+from typing import Any, Iterator, Optional, Sequence
+
+from sqlalchemy import BigInteger, Date, DateTime, Integer, Table, select
+from sqlalchemy.engine import Result
+from sqlalchemy.sql import Select
+
+from . import models, schemas
+
+
+def _default(value: Any):
+    # pandas Timestamp (a datetime subclass) and numpy scalars from DataFrame records
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+try:
+    # orjson is considerably faster and natively understands date/datetime.
+    import orjson
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default)
+except ImportError:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+JSON_MEDIA_TYPE = "application/json"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+ARROW_FILE_MEDIA_TYPE = "application/vnd.apache.arrow.file"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+# media types accepted in the Accept header -> output format
+_ACCEPT_FORMATS = {
+    JSON_MEDIA_TYPE: "json",
+    "application/*": "json",
+    "*/*": "json",
+    ARROW_STREAM_MEDIA_TYPE: "arrow",
+    ARROW_FILE_MEDIA_TYPE: "arrow_file",
+    PARQUET_MEDIA_TYPE: "parquet",
+    "application/x-parquet": "parquet",
+}
+MEDIA_TYPES = {"json": JSON_MEDIA_TYPE, "arrow": ARROW_STREAM_MEDIA_TYPE, "arrow_file": ARROW_FILE_MEDIA_TYPE, "parquet": PARQUET_MEDIA_TYPE}
+
+# rows per record batch / parquet row group
+ARROW_BATCH_SIZE = 10000
+
+
+# Column order follows the response schemas so the JSON keys come out in the
+# same order as the Pydantic-serialized responses.
+REKAP_COLUMNS = tuple(schemas.RekapKehadiranResponse.model_fields)
+KARYAWAN_COLUMNS = tuple(schemas.PresensiKaryawanResponse.model_fields)
+
+
+def rekap_kehadiran_select(tahun: int, bulan: Optional[int] = None, karyawan_id: Optional[int] = None, instansi_id: Optional[int] = None) -> Select:
+    """Build the `/rekap_kehadiran` query over the response columns only."""
+    table = models.RekapKehadiranModel.__table__
+    stmt = select(*[table.c[name] for name in REKAP_COLUMNS]).where(table.c.tahun == tahun)
+    if bulan is not None:
+        stmt = stmt.where(table.c.bulan == bulan)
+    if karyawan_id is not None:
+        stmt = stmt.where(table.c.karyawan_id == karyawan_id)
+    if instansi_id is not None:
+        stmt = stmt.where(table.c.instansi_id == instansi_id)
+    # ordered by instansi_id karyawan_id, tahun, bulan (same as the ORM query)
+    return stmt.order_by(table.c.instansi_id, table.c.karyawan_id, table.c.tahun, table.c.bulan)
+
+
+def karyawan_select(karyawan_id: Optional[int] = None, instansi_id: Optional[int] = None, limit: int = 100) -> Select:
+    """Build the `/data_karyawan` query over the response columns only."""
+    table = models.PresensIKaryawanModel.__table__
+    stmt = select(*[table.c[name] for name in KARYAWAN_COLUMNS])
+    if karyawan_id is not None:
+        stmt = stmt.where(table.c.id == karyawan_id)
+    if instansi_id is not None:
+        stmt = stmt.where(table.c.instansi_id == instansi_id)
+    return stmt.limit(limit)
+
+
+def encode_list_response(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> bytes:
+    """Encode row tuples as a `{"count": n, "data": [...]}` JSON body."""
+    data = [dict(zip(columns, row)) for row in rows]
+    return dumps({"count": len(data), "data": data})
+
+
+def encode_records_response(df) -> bytes:
+    """Encode a DataFrame as a `{"count": n, "data": [...]}` JSON body."""
+    data = df.to_dict(orient="records") if not df.empty else []
+    return dumps({"count": len(data), "data": data})
+
+
+def _quality(params: str) -> float:
+    for param in params.split(";"):
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """Return "json", "arrow", "arrow_file" or "parquet" for an `Accept` header value.
+
+    The known media type with the highest q-value wins; on equal q the one
+    listed first wins. `*/*` and `application/*` count as JSON, types with
+    `q=0` are never chosen, and a missing header or no known type keeps the
+    default JSON response.
+    """
+    if not accept:
+        return "json"
+    best, best_q = "json", 0.0
+    for part in accept.split(","):
+        media_type, _, params = part.partition(";")
+        fmt = _ACCEPT_FORMATS.get(media_type.strip().lower())
+        if fmt is None:
+            continue
+        q = _quality(params)
+        if q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def _arrow_type(column):
+    if isinstance(column.type, BigInteger):
+        return pa.int64()
+    if isinstance(column.type, Integer):
+        return pa.int32()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column.type, Date):
+        return pa.date32()
+    return pa.string()
+
+
+def arrow_schema(table: Table, columns: Sequence[str]):
+    """Arrow schema for `columns` of `table`, mapped from the SQLAlchemy types."""
+    return pa.schema([pa.field(name, _arrow_type(table.c[name]), nullable=table.c[name].nullable) for name in columns])
+
+
+def iter_record_batches(result: Result, schema, batch_size: int = ARROW_BATCH_SIZE) -> Iterator:
+    """Yield Arrow record batches built directly from the cursor's row tuples."""
+    for rows in result.partitions(batch_size):
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def encode_columnar(fmt: str, result: Result, table: Table, columns: Sequence[str], batch_size: int = ARROW_BATCH_SIZE) -> bytes:
+    """Encode a query result as Arrow IPC stream (`fmt="arrow"`), Arrow IPC file (`"arrow_file"`) or Parquet."""
+    if pa is None:
+        raise RuntimeError("pyarrow is required for Arrow/Parquet responses")
+    schema = arrow_schema(table, columns)
+    sink = io.BytesIO()
+    if fmt in ("arrow", "arrow_file"):
+        new_writer = pa.ipc.new_stream if fmt == "arrow" else pa.ipc.new_file
+        with new_writer(sink, schema) as writer:
+            for batch in iter_record_batches(result, schema, batch_size):
+                writer.write_batch(batch)
+    elif fmt == "parquet":
+        with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+            for batch in iter_record_batches(result, schema, batch_size):
+                writer.write_batch(batch, row_group_size=batch_size)
+    else:
+        raise ValueError(f"Unsupported columnar format: {fmt}")
+    return sink.getvalue()
+
+
+__all__ = [
+    "REKAP_COLUMNS",
+    "KARYAWAN_COLUMNS",
+    "rekap_kehadiran_select",
+    "karyawan_select",
+    "encode_list_response",
+    "encode_records_response",
+    "negotiate_format",
+    "arrow_schema",
+    "iter_record_batches",
+    "encode_columnar",
+    "MEDIA_TYPES",
+    "dumps",
+]
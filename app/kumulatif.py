@@ -0,0 +1,172 @@
+"""Materialized running total of `tanpa_keterangan` (TK) per karyawan and year.
+
+`/analisis_kehadiran` asks "which karyawan have more than N unexplained
+absences in the months before M". Against `rekap_bulanan` that is a
+`GROUP BY karyawan_id, tahun` over every row of the year. The
+`rekap_tk_kumulatif` table stores the answer ahead of time: for every
+karyawan and year it has one row per month, from the first month with a
+rekap up to December, holding the TK of that month and the TK summed over
+all months up to and including it. Months without a rekap carry the previous
+total forward. The question then becomes one range scan on the
+(tahun, bulan, tk_kumulatif) index:
+
+    WHERE tahun = :tahun AND bulan = :month - 1 AND tk_kumulatif > :minimum_tk
+
+The rows of a karyawan-year are rebuilt from `rekap_bulanan` whenever one of
+its months is written (`simpan_rekap_bulanan`, `refresh_tk_kumulatif`), so
+the cost of an update is bounded by 12 rows per touched karyawan.
+
+Readers may only use the table for a year listed in
+`rekap_tk_kumulatif_tahun`. A year is listed once every karyawan with
+`rekap_bulanan` rows in it also has running totals. `rebuild_tk_kumulatif`
+(run by the migration that adds the marker table) lists every year it
+backfills. The refreshes list a year when their write completes it, e.g. the
+first rekap of a new year. Until then, readers fall back to `rekap_bulanan`.
+"""
+from __future__ import annotations
+
+import datetime
+from typing import Iterable, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import delete, func, insert, select, tuple_
+from sqlalchemy.engine import Connection
+
+from . import models
+from .bulkload import batch_rows_for
+
+KUMULATIF_COLUMNS = ["karyawan_id", "tahun", "bulan", "instansi_id", "tanpa_keterangan", "tk_kumulatif"]
+
+
+def kumulatif_frame(df_rekap: pd.DataFrame) -> pd.DataFrame:
+    """Dense cumulative TK rows for the karyawan-years in `df_rekap`.
+
+    `df_rekap` needs `karyawan_id`, `tahun`, `bulan`, `instansi_id` and
+    `tanpa_keterangan`, and must hold every month written so far for each
+    karyawan-year it contains.
+    """
+    if df_rekap.empty:
+        return pd.DataFrame(columns=KUMULATIF_COLUMNS)
+    df = df_rekap[["karyawan_id", "tahun", "bulan", "instansi_id", "tanpa_keterangan"]].copy()
+    df = df.astype({"karyawan_id": "int64", "tahun": "int64", "bulan": "int64", "instansi_id": "int64", "tanpa_keterangan": "int64"})
+    df = df.drop_duplicates(["karyawan_id", "tahun", "bulan"], keep="last")
+
+    # one row per month from the first rekap month up to December
+    first = df.groupby(["karyawan_id", "tahun"], sort=False)["bulan"].min().rename("first").reset_index()
+    dense = first.loc[first.index.repeat(13 - first["first"])]
+    dense = dense.assign(bulan=dense["first"] + dense.groupby(level=0).cumcount()).drop(columns="first")
+
+    out = dense.merge(df, on=["karyawan_id", "tahun", "bulan"], how="left")
+    out = out.sort_values(["karyawan_id", "tahun", "bulan"], kind="stable", ignore_index=True)
+    out["tanpa_keterangan"] = out["tanpa_keterangan"].fillna(0).astype("int64")
+    out["instansi_id"] = out.groupby(["karyawan_id", "tahun"], sort=False)["instansi_id"].ffill().astype("int64")
+    out["tk_kumulatif"] = out.groupby(["karyawan_id", "tahun"], sort=False)["tanpa_keterangan"].cumsum()
+    return out[KUMULATIF_COLUMNS]
+
+
+def refresh_tk_kumulatif(conn: Connection, keys: Iterable[Tuple[int, int]]) -> int:
+    """Rebuild the cumulative rows of each (karyawan_id, tahun) from `rekap_bulanan`.
+
+    Call inside the transaction that writes the rekap rows. Dialect-neutral
+    counterpart of the refresh done by `simpan_rekap_bulanan`. Returns the
+    number of cumulative rows written.
+    """
+    rekap = models.RekapKehadiranModel.__table__
+    table = models.RekapTkKumulatifModel.__table__
+    keys = sorted({(int(k), int(t)) for k, t in keys})
+    written = 0
+    step = batch_rows_for(2, max_values=2000)
+    for start in range(0, len(keys), step):
+        batch = keys[start:start + step]
+        rows = conn.execute(
+            select(rekap.c.karyawan_id, rekap.c.tahun, rekap.c.bulan, rekap.c.instansi_id, rekap.c.tanpa_keterangan)
+            .where(tuple_(rekap.c.karyawan_id, rekap.c.tahun).in_(batch))
+        ).all()
+        frame = kumulatif_frame(pd.DataFrame(rows, columns=["karyawan_id", "tahun", "bulan", "instansi_id", "tanpa_keterangan"]))
+        conn.execute(delete(table).where(tuple_(table.c.karyawan_id, table.c.tahun).in_(batch)))
+        if not frame.empty:
+            conn.execute(insert(table), frame.to_dict(orient="records"))
+        written += len(frame)
+    mark_tk_kumulatif_coverage(conn, {tahun for _, tahun in keys})
+    return written
+
+
+def mark_tk_kumulatif_coverage(conn: Connection, years: Iterable[int]) -> List[int]:
+    """List the `years` whose running totals now cover every karyawan of `rekap_bulanan`; return them.
+
+    Years already listed are skipped with one primary-key lookup each.
+    """
+    rekap = models.RekapKehadiranModel.__table__
+    table = models.RekapTkKumulatifModel.__table__
+    marker = models.RekapTkKumulatifTahunModel.__table__
+    marked = []
+    for tahun in sorted({int(t) for t in years}):
+        if conn.execute(select(marker.c.tahun).where(marker.c.tahun == tahun)).first() is not None:
+            continue
+        in_rekap = conn.execute(select(func.count(rekap.c.karyawan_id.distinct())).where(rekap.c.tahun == tahun)).scalar()
+        in_totals = conn.execute(select(func.count(table.c.karyawan_id.distinct())).where(table.c.tahun == tahun)).scalar()
+        if in_rekap == in_totals:
+            conn.execute(insert(marker).values(tahun=tahun, covered_at=datetime.datetime.now()))
+            marked.append(tahun)
+    return marked
+
+
+def mark_tk_kumulatif_coverage_cursor(cursor, years: Iterable[int]) -> List[int]:
+    """`mark_tk_kumulatif_coverage` on a DB-API cursor with `%s` parameters (pymysql)."""
+    marked = []
+    for tahun in sorted({int(t) for t in years}):
+        cursor.execute("SELECT tahun FROM rekap_tk_kumulatif_tahun WHERE tahun = %s", [tahun])
+        if cursor.fetchone() is not None:
+            continue
+        cursor.execute("SELECT COUNT(DISTINCT karyawan_id) FROM rekap_bulanan WHERE tahun = %s", [tahun])
+        in_rekap = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(DISTINCT karyawan_id) FROM rekap_tk_kumulatif WHERE tahun = %s", [tahun])
+        if cursor.fetchone()[0] == in_rekap:
+            cursor.execute("INSERT INTO rekap_tk_kumulatif_tahun (tahun, covered_at) VALUES (%s, %s)", [tahun, datetime.datetime.now()])
+            marked.append(tahun)
+    return marked
+
+
+def rebuild_tk_kumulatif(conn: Connection, tahun: Optional[int] = None) -> int:
+    """Backfill the table for every karyawan with rekap rows (optionally one year only) and list the years as covered."""
+    rekap = models.RekapKehadiranModel.__table__
+    stmt = select(rekap.c.karyawan_id, rekap.c.tahun).distinct()
+    if tahun is not None:
+        stmt = stmt.where(rekap.c.tahun == tahun)
+    return refresh_tk_kumulatif(conn, conn.execute(stmt).all())
+
+
+def tk_kumulatif_select(year: int, month: int, minimum_tk: int = 3):
+    """`analisis_kehadiran` rows (TK summed over months before `month`) from the materialized table."""
+    table = models.RekapTkKumulatifModel.__table__
+    karyawan = models.PresensIKaryawanModel.__table__
+    return (
+        select(
+            table.c.karyawan_id,
+            karyawan.c.nip,
+            karyawan.c.name.label("nama_pegawai"),
+            table.c.tahun,
+            table.c.tk_kumulatif.label("TK"),
+        )
+        .select_from(table.outerjoin(karyawan, table.c.karyawan_id == karyawan.c.id))
+        .where(table.c.tahun == year, table.c.bulan == month - 1, table.c.tk_kumulatif > minimum_tk)
+        .order_by(table.c.karyawan_id)
+    )
+
+
+def has_tk_kumulatif_select(year: int):
+    """Cheap probe: is `year` listed as covered in `rekap_tk_kumulatif_tahun`?"""
+    marker = models.RekapTkKumulatifTahunModel.__table__
+    return select(marker.c.tahun).where(marker.c.tahun == year)
+
+
+__all__ = [
+    "KUMULATIF_COLUMNS",
+    "kumulatif_frame",
+    "refresh_tk_kumulatif",
+    "rebuild_tk_kumulatif",
+    "mark_tk_kumulatif_coverage",
+    "mark_tk_kumulatif_coverage_cursor",
+    "tk_kumulatif_select",
+    "has_tk_kumulatif_select",
+]
@@ -0,0 +1,227 @@
+"""Partitioned Parquet sink ("lake") for ETL and rekap outputs.
+
+Analysts scan the raw presensi tables and `rekap_bulanan` as Parquet files
+laid out Hive-style:
+
+    <root>/<dataset>/instansi_id=<id>/tahun=<yyyy>/bulan=<m>/part-<uuid>.parquet
+
+Partition columns live in the directory names only, so a reader that filters
+on instansi/tahun/bulan opens just those directories
+(`analytics.read_parquet_lake`). Inside a partition, rows are sorted by
+`sort_by` (default `karyawan_id`) and written in row groups of
+`PARQUET_ROW_GROUP_SIZE` rows with column statistics. Row-group min/max
+values then stay narrow, and filters on those columns skip whole row groups.
+
+Writes are staged and committed in two steps. `ParquetSink.write` appends
+each chunk to one open, hidden `.part-*.tmp` file per partition (readers
+ignore names starting with "."), one or more row groups per chunk. `commit`
+closes those files and renames them into place with `os.replace`, which is
+atomic per file, once the caller's database transaction has committed.
+`abort` deletes them. With `mode="overwrite"` the files that already existed
+in a touched partition are removed after the new ones are in place.
+
+A run that commits per chunk (keyset ETL) still publishes one file per
+partition per chunk. `compact` merges a partition's files of the run into
+files of up to `PARQUET_TARGET_FILE_ROWS` rows, re-sorted, when the run
+ends. The merged file is renamed into place before the small ones are
+deleted, so a reader listing the partition in between can see both.
+"""
+from __future__ import annotations
+
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+PARTITION_COLUMNS = ("instansi_id", "tahun", "bulan")
+# rows per row group: small enough for min/max pruning, large enough for scan speed
+PARQUET_ROW_GROUP_SIZE = int(os.getenv("PARQUET_ROW_GROUP_SIZE", 65536))
+# rows per file when `ParquetSink.compact` merges the small files of a run
+PARQUET_TARGET_FILE_ROWS = int(os.getenv("PARQUET_TARGET_FILE_ROWS", 1000000))
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def _partition_value(value) -> str:
+    if value is None or pd.isna(value):
+        return NULL_PARTITION
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def partition_path(root: str, dataset: str, keys: Sequence[Tuple[str, object]]) -> Path:
+    """Directory of one partition, e.g. `<root>/<dataset>/instansi_id=5/tahun=2025/bulan=1`."""
+    path = Path(root) / dataset
+    for name, value in keys:
+        path = path / f"{name}={_partition_value(value)}"
+    return path
+
+
+class ParquetSink:
+    """Stage DataFrame chunks as partitioned Parquet files and publish them on `commit()`.
+
+    `partition_cols` present in a chunk are used in the given order. When the
+    chunk has no `tahun`/`bulan` columns but has `date_column`, they are
+    derived from that column. `mode="append"` adds files to a partition;
+    `mode="overwrite"` replaces the partitions written in this run.
+    """
+
+    def __init__(self, root: str, dataset: str, *, partition_cols: Sequence[str] = PARTITION_COLUMNS,
+                 date_column: Optional[str] = None, sort_by: Optional[Sequence[str]] = ("karyawan_id",),
+                 row_group_size: int = PARQUET_ROW_GROUP_SIZE, mode: str = "append", compression: str = "zstd",
+                 target_file_rows: int = PARQUET_TARGET_FILE_ROWS):
+        if pq is None:
+            raise RuntimeError("pyarrow is required for the Parquet sink")
+        if mode not in ("append", "overwrite"):
+            raise ValueError("mode must be 'append' or 'overwrite'")
+        self.root = root
+        self.dataset = dataset
+        self.partition_cols = list(partition_cols)
+        self.date_column = date_column
+        self.sort_by = list(sort_by or ())
+        self.row_group_size = row_group_size
+        self.mode = mode
+        self.compression = compression
+        self.target_file_rows = target_file_rows
+
+        self._staged: List[Tuple[Path, Path]] = []
+        # partition -> (open writer, its staged file) until the next commit/abort
+        self._writers: Dict[Path, Tuple["pq.ParquetWriter", Path]] = {}
+        # partition -> files this run has published there
+        self._published: Dict[Path, List[Path]] = {}
+        # partitions touched in this run -> files that existed before it
+        self._replaced: Dict[Path, List[Path]] = {}
+        self.files_written = 0
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.files_compacted = 0
+
+    def _with_partitions(self, df: pd.DataFrame) -> pd.DataFrame:
+        if self.date_column and self.date_column in df.columns:
+            dates = pd.to_datetime(df[self.date_column], errors="coerce")
+            if "tahun" in self.partition_cols and "tahun" not in df.columns:
+                df = df.assign(tahun=dates.dt.year.astype("Int64"))
+            if "bulan" in self.partition_cols and "bulan" not in df.columns:
+                df = df.assign(bulan=dates.dt.month.astype("Int64"))
+        return df
+
+    def write(self, df: pd.DataFrame) -> int:
+        """Stage `df` as one hidden file per partition; return rows staged."""
+        if df.empty:
+            return 0
+        df = self._with_partitions(df)
+        cols = [c for c in self.partition_cols if c in df.columns]
+        groups = df.groupby(cols, dropna=False, sort=False) if cols else [((), df)]
+        for values, part in groups:
+            values = values if isinstance(values, tuple) else (values,)
+            directory = partition_path(self.root, self.dataset, list(zip(cols, values)))
+            directory.mkdir(parents=True, exist_ok=True)
+            if self.mode == "overwrite" and directory not in self._replaced:
+                self._replaced[directory] = sorted(directory.glob("part-*.parquet"))
+
+            data = part.drop(columns=cols)
+            order = [c for c in self.sort_by if c in data.columns]
+            if order:
+                data = data.sort_values(order, kind="stable")
+            self._append(directory, pa.Table.from_pandas(data, preserve_index=False))
+            self.rows_written += len(part)
+        return len(df)
+
+    def _append(self, directory: Path, table: "pa.Table") -> None:
+        """Append `table` to the open staged file of `directory`, starting one if needed."""
+        if directory in self._writers:
+            writer = self._writers[directory][0]
+            if not table.schema.equals(writer.schema):
+                try:
+                    # e.g. a column that was all NULL (null type) in the first chunk of the file
+                    table = table.cast(writer.schema)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError, ValueError):
+                    self._close(directory)
+        if directory not in self._writers:
+            name = f"part-{uuid.uuid4().hex}.parquet"
+            tmp = directory / f".{name}.tmp"
+            writer = pq.ParquetWriter(tmp, table.schema, compression=self.compression, write_statistics=True)
+            self._writers[directory] = (writer, tmp)
+            self._staged.append((tmp, directory / name))
+        self._writers[directory][0].write_table(table, row_group_size=self.row_group_size)
+
+    def _close(self, directory: Path) -> None:
+        writer, tmp = self._writers.pop(directory)
+        writer.close()
+        self.bytes_written += tmp.stat().st_size
+
+    def commit(self) -> None:
+        """Publish the staged files (atomic rename each) and drop replaced ones."""
+        for directory in list(self._writers):
+            self._close(directory)
+        for tmp, final in self._staged:
+            os.replace(tmp, final)
+            self._published.setdefault(final.parent, []).append(final)
+            self.files_written += 1
+        self._staged = []
+        for old_files in self._replaced.values():
+            for old in old_files:
+                old.unlink(missing_ok=True)
+        # later commits of the same run only add to these partitions
+        self._replaced = {directory: [] for directory in self._replaced}
+
+    def abort(self) -> None:
+        """Delete the staged files that were not committed."""
+        for writer, _ in self._writers.values():
+            writer.close()
+        self._writers = {}
+        for tmp, _ in self._staged:
+            tmp.unlink(missing_ok=True)
+        self._staged = []
+
+    def compact(self) -> None:
+        """Merge the files this run published in each partition into files of up to `target_file_rows` rows."""
+        for directory, files in self._published.items():
+            if len(files) < 2:
+                continue
+            tables = [pq.read_table(f, partitioning=None) for f in files]
+            merged = pa.concat_tables(tables, promote_options="permissive")
+            order = [c for c in self.sort_by if c in merged.column_names]
+            if order:
+                merged = merged.sort_by([(c, "ascending") for c in order])
+            merged_files = []
+            for start in range(0, merged.num_rows, self.target_file_rows):
+                self._append(directory, merged.slice(start, self.target_file_rows))
+                self._close(directory)
+            for tmp, final in self._staged:
+                os.replace(tmp, final)
+                merged_files.append(final)
+            self._staged = []
+            for old in files:
+                old.unlink(missing_ok=True)
+            self.files_compacted += len(files)
+            self.files_written += len(merged_files) - len(files)
+            self._published[directory] = merged_files
+
+    def stats(self) -> dict:
+        return {"files": self.files_written, "rows": self.rows_written, "bytes": self.bytes_written,
+                "compacted": self.files_compacted}
+
+
+def write_partitioned(df: pd.DataFrame, root: str, dataset: str, **sink_options) -> dict:
+    """Write one DataFrame to the lake and commit it; return the sink counters."""
+    sink = ParquetSink(root, dataset, **sink_options)
+    try:
+        sink.write(df)
+    except BaseException:
+        sink.abort()
+        raise
+    sink.commit()
+    return sink.stats()
+
+
+__all__ = ["PARTITION_COLUMNS", "PARQUET_ROW_GROUP_SIZE", "PARQUET_TARGET_FILE_ROWS", "ParquetSink", "partition_path", "write_partitioned"]
@@ -1,3 +1,4 @@
+import asyncio
 import os
 from pydoc import text
 try:
@@ -12,15 +13,26 @@ except Exception:
 
 from calendar import month
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
-from . import models, schemas
-from .db import SessionLocal, init_db
+from . import caching, dimcache, fastread, models, schemas
+from .admission import AdmissionLane
+from .db import AsyncSessionLocal, SessionLocal, init_db
 from .rekap import run_rekap, run_rekap_tahunan
 
 app = FastAPI(title="Simple FastAPI App")
+# gzip responses above GZIP_MINIMUM_SIZE bytes when the client accepts it
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MINIMUM_SIZE", 1024)))
+
+# Heavy pipeline endpoints (/rekap, /rekap_tahunan, /data_local_db_engine) run
+# in their own lane: limited concurrency, bounded queue, dedicated executor.
+# Configure with HEAVY_MAX_CONCURRENT, HEAVY_MAX_QUEUE, HEAVY_QUEUE_TIMEOUT
+# and HEAVY_RETRY_AFTER.
+heavy_lane = AdmissionLane.from_env("heavy", "HEAVY")
 
 
 def get_db():
@@ -31,12 +43,50 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def _negotiate_format(accept: Optional[str]) -> str:
+    """Pick the response format from the Accept header (json, arrow or parquet)."""
+    fmt = fastread.negotiate_format(accept)
+    if fmt != "json" and fastread.pa is None:
+        raise HTTPException(status_code=406, detail="Arrow/Parquet output requires pyarrow on the server")
+    return fmt
+
+
+async def _list_response(db: AsyncSession, stmt, table, columns, fmt: str) -> Response:
+    """Execute a fast-read select on the async session and encode it in the negotiated format."""
+    result = await db.execute(stmt)
+    # the result is buffered; encoding a large list is CPU work, keep it off the event loop
+    if fmt == "json":
+        content = await asyncio.to_thread(fastread.encode_list_response, columns, result.all())
+    else:
+        content = await asyncio.to_thread(fastread.encode_columnar, fmt, result, table, columns)
+    return Response(content=content, media_type=fastread.MEDIA_TYPES[fmt])
+
+
 @app.on_event("startup")
 def on_startup():
     # Create tables automatically for development/testing. Use Alembic for migrations in prod.
     init_db()
 
 
+@app.on_event("startup")
+async def warm_dimension_cache():
+    # Preload presensi_shift and the karyawan of DIMCACHE_WARM_INSTANSI so the
+    # first /rekap calls skip those downloads; runs in the background and
+    # never delays startup.
+    if os.getenv("DIMCACHE_WARM", "1") != "0":
+        asyncio.get_running_loop().run_in_executor(None, dimcache.warm_from_env)
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    heavy_lane.shutdown()
+
+
 @app.get("/")
 def read_root():
     return {"message": "Hello from FastAPI"}
@@ -62,45 +112,52 @@ def create_item(item: schemas.Item, db: Session = Depends(get_db)):
     return db_item
 
 @app.get("/data_karyawan", response_model=schemas.PresensiKaryawanListResponse, status_code=200)
-def get_karyawan_data(karyawan_id: Optional[int] = None, instansi_id: Optional[int] = None, limit: int = 100, db: Session = Depends(get_db)):
-    query = db.query(models.PresensIKaryawanModel)
-    if karyawan_id is not None:
-        query = query.filter(models.PresensIKaryawanModel.id == karyawan_id)
-    if instansi_id is not None:
-        query = query.filter(models.PresensIKaryawanModel.instansi_id == instansi_id)
-    karyawan_records = query.limit(limit).all()
-    if not karyawan_records:
-        return {"count": 0, "data": []}
-    karyawan_list = []
-    for record in karyawan_records:
-        karyawan_list.append(schemas.PresensiKaryawanResponse.from_orm(record))
-    return {
-        "count": len(karyawan_list),
-        "data": karyawan_list
-    }
+async def get_karyawan_data(karyawan_id: Optional[int] = None, instansi_id: Optional[int] = None, limit: int = 100, accept: Optional[str] = Header(None), db: AsyncSession = Depends(get_async_db)):
+    fmt = _negotiate_format(accept)
+    # Core select + direct JSON encoding; skips ORM hydration and from_orm per row
+    stmt = fastread.karyawan_select(karyawan_id=karyawan_id, instansi_id=instansi_id, limit=limit)
+    return await _list_response(db, stmt, models.PresensIKaryawanModel.__table__, fastread.KARYAWAN_COLUMNS, fmt)
 
 
-@app.get("/data_local_db_engine")
-def get_local_data(instansi_id: int, tanggal_awal: str, tanggal_akhir: str):
-    # get local data using _fetch_local_db in rekap.py
+def _encoded(func, *args, **kwargs) -> bytes:
+    """Run a DataFrame-returning pipeline and encode it as the JSON list body.
 
-    try:
-        from .rekap import _fetch_local_db
-        df = _fetch_local_db(instansi_id, tanggal_awal, tanggal_akhir)
+    Called through `heavy_lane.run`, so `to_dict` and the JSON encoding happen
+    on the lane executor too and never on the event loop.
+    """
+    return fastread.encode_records_response(func(*args, **kwargs))
+
+
+def _json_response(content: bytes) -> Response:
+    return Response(content=content, media_type=fastread.JSON_MEDIA_TYPE)
+
+
+def _local_data(instansi_id: int, tanggal_awal: str, tanggal_akhir: str) -> bytes:
+    # get local data using _fetch_local_db in rekap.py
+    from .rekap import _fetch_local_db
+    df = _fetch_local_db(instansi_id, tanggal_awal, tanggal_akhir)
+    result = df.to_dict(orient='records') if not df.empty else []
+    res = _fetch_local_db(instansi_id, tanggal_awal, tanggal_akhir, return_meta=True)
+    # support fuction that returns (df, meta) or df or list
+    df = res[0] if isinstance(res, (tuple, list)) and len(res) > 2 else res
+    if hasattr(df, 'empty'):
         result = df.to_dict(orient='records') if not df.empty else []
-        res = _fetch_local_db(instansi_id, tanggal_awal, tanggal_akhir, return_meta=True)
-        # support fuction that returns (df, meta) or df or list
-        df = res[0] if isinstance(res, (tuple, list)) and len(res) > 2 else res
-        if hasattr(df, 'empty'):
-            result = df.to_dict(orient='records') if not df.empty else []
-        else:
-            result = df or []
-        return {"count": len(result), "data": result}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    else:
+        result = df or []
+    return fastread.dumps({"count": len(result), "data": result})
+
+
+@app.get("/data_local_db_engine")
+async def get_local_data(instansi_id: int, tanggal_awal: str, tanggal_akhir: str):
+    async with heavy_lane.slot():
+        try:
+            content = await heavy_lane.run(_local_data, instansi_id, tanggal_awal, tanggal_akhir)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return _json_response(content)
 
 @app.post("/rekap")
-def rekap_endpoint(payload: schemas.RekapRequest):
+async def rekap_endpoint(payload: schemas.RekapRequest):
     # """Run rekap pipeline in-memory and return laporan as JSON list.
 
     # This endpoint accepts a minimal payload (instansi, month, year). Connection
@@ -137,32 +194,33 @@ def rekap_endpoint(payload: schemas.RekapRequest):
     if use_ssh and not (ssh_host and ssh_user and db_user and db_password):
         raise HTTPException(status_code=400, detail="SSH mode enabled but SSH/DB credentials are missing in environment or request")
 
-    try:
-        df = run_rekap(
-            payload.instansi,
-            payload.month,
-            payload.year,
-            remote_url=remote_url,
-            use_ssh=use_ssh,
-            ssh_host=ssh_host,
-            ssh_port=ssh_port,
-            ssh_user=ssh_user,
-            ssh_password=ssh_password,
-            db_host=db_host,
-            db_port=db_port,
-            db_user=db_user,
-            db_password=db_password,
-            db_name=db_name,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-    # convert DataFrame to list of records
-    result = df.to_dict(orient='records') if not df.empty else []
-    return {"count": len(result), "data": result}
+    async with heavy_lane.slot():
+        try:
+            content = await heavy_lane.run(
+                _encoded,
+                run_rekap,
+                payload.instansi,
+                payload.month,
+                payload.year,
+                remote_url=remote_url,
+                use_ssh=use_ssh,
+                ssh_host=ssh_host,
+                ssh_port=ssh_port,
+                ssh_user=ssh_user,
+                ssh_password=ssh_password,
+                db_host=db_host,
+                db_port=db_port,
+                db_user=db_user,
+                db_password=db_password,
+                db_name=db_name,
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return _json_response(content)
 
 @app.post("/rekap_tahunan")
-def rekap_tahunan_endpoint(payload: schemas.RekapTahunanRequest):
+async def rekap_tahunan_endpoint(payload: schemas.RekapTahunanRequest):
 
     # If month and year are in the future, raise error
     if payload.year > datetime.now().year:
@@ -188,39 +246,41 @@ def rekap_tahunan_endpoint(payload: schemas.RekapTahunanRequest):
         raise HTTPException(status_code=400, detail="No remote DB configured: set REMOTE_DATABASE_URL or enable SSH in environment")
     if use_ssh and not (ssh_host and ssh_user and db_user and db_password):
         raise HTTPException(status_code=400, detail="SSH mode enabled but SSH/DB credentials are missing in environment or request")
-    try:
-        df = run_rekap_tahunan(
-            payload.instansi,
-            payload.year,
-            remote_url=remote_url,
-            use_ssh=use_ssh,
-            ssh_host=ssh_host,
-            ssh_port=ssh_port,
-            ssh_user=ssh_user,
-            ssh_password=ssh_password,
-            db_host=db_host,
-            db_port=db_port,
-            db_user=db_user,
-            db_password=db_password,
-            db_name=db_name,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-    result = df.to_dict(orient='records') if not df.empty else []
-    return {"count": len(result), "data": result}
+    async with heavy_lane.slot():
+        try:
+            content = await heavy_lane.run(
+                _encoded,
+                run_rekap_tahunan,
+                payload.instansi,
+                payload.year,
+                remote_url=remote_url,
+                use_ssh=use_ssh,
+                ssh_host=ssh_host,
+                ssh_port=ssh_port,
+                ssh_user=ssh_user,
+                ssh_password=ssh_password,
+                db_host=db_host,
+                db_port=db_port,
+                db_user=db_user,
+                db_password=db_password,
+                db_name=db_name,
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return _json_response(content)
 
 @app.post("/analisis_kehadiran")
-def api_analisis_kehadiran(payload: schemas.AnalasisKehadiranResponse):
+async def api_analisis_kehadiran(payload: schemas.AnalasisKehadiranResponse, db: AsyncSession = Depends(get_async_db)):
     """
     Analyze sum of `tanpa_keterangan` in `rekap_bulanan` for given year and month.
     Returns a list of rows with instansi_id and total_tanpa_keterangan.
     """
     try:
         # import here to avoid import-time side effects / circular imports
-        from .analisis import analisis_kehadiran
+        from .analisis import analisis_kehadiran_async
 
-        results = analisis_kehadiran(year=payload.year, month=payload.month, minimum_tk=payload.minimum_tk)
+        results = await analisis_kehadiran_async(db, year=payload.year, month=payload.month, minimum_tk=payload.minimum_tk)
         return {"count": len(results), "data": results}
         # return payload
     except Exception as e:
@@ -228,42 +288,48 @@ def api_analisis_kehadiran(payload: schemas.AnalasisKehadiranResponse):
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/rekap_kehadiran", response_model=schemas.RekapKehadiranListResponse, status_code=200)
-def api_hasil_analisis(tahun: int, bulan: Optional[int] = None, karyawan_id: Optional[int] = None, instansi_id: Optional[int] = None, db: Session = Depends(get_db)):
+async def api_hasil_analisis(tahun: int, bulan: Optional[int] = None, karyawan_id: Optional[int] = None, instansi_id: Optional[int] = None, accept: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_async_db)):
+    fmt = _negotiate_format(accept)
     try:
-        query = db.query(models.RekapKehadiranModel).filter(
-            models.RekapKehadiranModel.tahun == tahun,
-        )
         if bulan is not None:
             if bulan < 1 or bulan > 12:
                 raise HTTPException(status_code=400, detail="Bulan harus antara 1 dan 12.")
-            
-            query = query.filter(models.RekapKehadiranModel.bulan == bulan)
-
-        if karyawan_id is not None:
-            query = query.filter(models.RekapKehadiranModel.karyawan_id == karyawan_id)
-        
-        if instansi_id is not None:
-            query = query.filter(models.RekapKehadiranModel.instansi_id == instansi_id)
-
-        # get all matching records ordered by instansi_id karyawan_id, tahun, bulan
-        rekap_record = query.order_by(
-            models.RekapKehadiranModel.instansi_id,
-            models.RekapKehadiranModel.karyawan_id,
-            models.RekapKehadiranModel.tahun,
-            models.RekapKehadiranModel.bulan
-        ).all()
-
-        if not rekap_record:
-            return {"count": 0, "data": []}
-    
-        rekap_list = [schemas.RekapKehadiranResponse.from_orm(r) for r in rekap_record]
 
-        return {
-            "count": len(rekap_list),
-            "data": rekap_list
-        }
+        # ETag from the rekap_versi counters of the covered partitions; a
+        # matching If-None-Match is answered without reading rekap rows.
+        versions = (await db.execute(caching.rekap_versi_select(tahun, bulan=bulan, instansi_id=instansi_id))).all()
+        etag, last_modified = caching.compute_etag(versions, fmt, tahun, bulan, karyawan_id, instansi_id)
+        headers = caching.cache_headers(etag, last_modified, caching.cache_control_for(tahun, bulan))
+        if caching.etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+
+        # Core select on the response columns only, rows are encoded as-is
+        stmt = fastread.rekap_kehadiran_select(tahun, bulan=bulan, karyawan_id=karyawan_id, instansi_id=instansi_id)
+        response = await _list_response(db, stmt, models.RekapKehadiranModel.__table__, fastread.REKAP_COLUMNS, fmt)
+        response.headers.update(headers)
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/rekap_rollup")
+async def api_rekap_rollup(tahun: int, bulan_awal: int = 1, bulan_akhir: int = 12, instansi_id: Optional[int] = None, per: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    """Per-instansi totals and attendance rate for months `bulan_awal..bulan_akhir` of `tahun`.
+
+    Served from the coarsest precomputed rollup that covers the range (see
+    `app/rollup.py`); `per=bulan|kuartal|tahun` returns one row per period.
+    """
+    from .rollup import rollup_records, rollup_select
+
+    try:
+        grain, stmt = rollup_select(tahun, bulan_awal, bulan_akhir, instansi_id=instansi_id, per=per)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        result = await db.execute(stmt)
+        records = rollup_records(list(result.keys()), result.all())
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return _json_response(fastread.dumps({"grain": grain, "count": len(records), "data": records}))
 
 if __name__ == "__main__":
     import uvicorn
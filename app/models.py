@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, PrimaryKeyConstraint, BigInteger, DateTime, Date
+from sqlalchemy import Column, Integer, String, Text, PrimaryKeyConstraint, BigInteger, DateTime, Date, Float, Index
 from .db import Base
 
 
@@ -44,7 +44,15 @@ class PresensIKaryawanModel(Base):
 
 class RekapKehadiranModel(Base):
     __tablename__ = "rekap_bulanan"
-    __table_args__ = (PrimaryKeyConstraint('karyawan_id','tahun','bulan'),)
+    # secondary indexes follow the read paths (migration c3e8a1f07d52):
+    # /rekap_kehadiran by tahun(+bulan)(+instansi) ordered by instansi, karyawan;
+    # analisis_kehadiran's SUM(tanpa_keterangan) by tahun, bulan < m per karyawan
+    __table_args__ = (
+        PrimaryKeyConstraint('karyawan_id','tahun','bulan'),
+        Index('ix_rekap_bulanan_periode_instansi', 'tahun', 'bulan', 'instansi_id', 'karyawan_id'),
+        Index('ix_rekap_bulanan_tahun_instansi', 'tahun', 'instansi_id', 'karyawan_id', 'bulan'),
+        Index('ix_rekap_bulanan_tahun_karyawan_tk', 'tahun', 'karyawan_id', 'bulan', 'tanpa_keterangan'),
+    )
 
     karyawan_id = Column(Integer, nullable=False)
     tahun = Column(Integer, nullable=False)
@@ -65,4 +73,135 @@ class RekapKehadiranModel(Base):
     p4 = Column(Integer, nullable=False)
     izin_sakit = Column(Integer, nullable=False)
     tugas_bk = Column(Integer, nullable=False)
-    tanpa_keterangan = Column(Integer, nullable=False)
\ No newline at end of file
+    tanpa_keterangan = Column(Integer, nullable=False)
+
+class RekapVersiModel(Base):
+    """Version counter per (tahun, bulan, instansi_id) partition of rekap_bulanan.
+
+    Bumped whenever rekap rows for that partition are written; the read
+    endpoints derive ETags from it without touching the row data.
+    """
+    __tablename__ = "rekap_versi"
+    __table_args__ = (PrimaryKeyConstraint('tahun', 'bulan', 'instansi_id'),)
+
+    tahun = Column(Integer, nullable=False)
+    bulan = Column(Integer, nullable=False)
+    instansi_id = Column(Integer, nullable=False)
+    versi = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class RekapTkKumulatifModel(Base):
+    """Running total of tanpa_keterangan per karyawan and year (see `app/kumulatif.py`).
+
+    One row per month from the first rekap month up to December; kept in sync
+    with rekap_bulanan by the writers.
+    """
+    __tablename__ = "rekap_tk_kumulatif"
+    __table_args__ = (
+        PrimaryKeyConstraint('karyawan_id', 'tahun', 'bulan'),
+        Index('ix_rekap_tk_kumulatif_lookup', 'tahun', 'bulan', 'tk_kumulatif'),
+    )
+
+    karyawan_id = Column(Integer, nullable=False)
+    tahun = Column(Integer, nullable=False)
+    bulan = Column(Integer, nullable=False)
+    instansi_id = Column(Integer, nullable=False)
+    tanpa_keterangan = Column(Integer, nullable=False)
+    tk_kumulatif = Column(Integer, nullable=False)
+
+
+class RekapTkKumulatifTahunModel(Base):
+    """Years whose rekap_tk_kumulatif rows cover every karyawan in rekap_bulanan (see `app/kumulatif.py`)."""
+    __tablename__ = "rekap_tk_kumulatif_tahun"
+
+    tahun = Column(Integer, primary_key=True, autoincrement=False)
+    covered_at = Column(DateTime, nullable=False)
+
+
+class RekapRollupModel(Base):
+    """Instansi totals of rekap_bulanan per month, quarter or year (see `app/rollup.py`).
+
+    `grain` is 'bulan', 'kuartal' or 'tahun'; `periode` is the month (1-12),
+    the quarter (1-4) or 0 for the year.
+    """
+    __tablename__ = "rekap_rollup"
+    __table_args__ = (PrimaryKeyConstraint('grain', 'tahun', 'periode', 'instansi_id'),)
+
+    grain = Column(String(10), nullable=False)
+    tahun = Column(Integer, nullable=False)
+    periode = Column(Integer, nullable=False)
+    instansi_id = Column(Integer, nullable=False)
+    jumlah_karyawan = Column(Integer, nullable=False)
+    jumlah_hari = Column(BigInteger, nullable=False)
+    hadir = Column(BigInteger, nullable=False)
+    tidak_hadir = Column(BigInteger, nullable=False)
+    twm = Column(BigInteger, nullable=False)
+    t1 = Column(BigInteger, nullable=False)
+    t2 = Column(BigInteger, nullable=False)
+    t3 = Column(BigInteger, nullable=False)
+    t4 = Column(BigInteger, nullable=False)
+    twp = Column(BigInteger, nullable=False)
+    p1 = Column(BigInteger, nullable=False)
+    p2 = Column(BigInteger, nullable=False)
+    p3 = Column(BigInteger, nullable=False)
+    p4 = Column(BigInteger, nullable=False)
+    izin_sakit = Column(BigInteger, nullable=False)
+    tugas_bk = Column(BigInteger, nullable=False)
+    tanpa_keterangan = Column(BigInteger, nullable=False)
+
+
+class PresensiAnomaliModel(Base):
+    """Check-ins and karyawan flagged by the anomaly scan (see `app/anomali.py`)."""
+    __tablename__ = "presensi_anomali"
+    __table_args__ = (Index('ix_presensi_anomali_tanggal_instansi', 'tanggal', 'instansi_id'),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    jenis_anomali = Column(String(50), nullable=False)
+    karyawan_id = Column(Integer, nullable=False)
+    instansi_id = Column(Integer, nullable=False)
+    tanggal = Column(Date, nullable=False)
+    waktu = Column(DateTime, nullable=True)
+    nilai = Column(Float, nullable=True)
+    keterangan = Column(String(255), nullable=True)
+    created_at = Column(DateTime, nullable=False)
+
+
+class EtlStateModel(Base):
+    """Per-table high-water mark for incremental ETL (see `app/etl.py`)."""
+    __tablename__ = "etl_state"
+
+    table_name = Column(String(191), primary_key=True)
+    watermark_column = Column(String(191), nullable=False)
+    watermark_value = Column(String(191), nullable=True)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class EtlCheckpointModel(Base):
+    """Last committed chunk of an in-progress keyset ETL run (resume journal)."""
+    __tablename__ = "etl_checkpoint"
+
+    table_name = Column(String(191), primary_key=True)
+    key_column = Column(String(191), nullable=False)
+    first_key = Column(String(191), nullable=True)
+    last_key = Column(String(191), nullable=False)
+    rows_loaded = Column(BigInteger, nullable=False, default=0)
+    watermark_value = Column(String(191), nullable=True)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class EtlCheckpointKeyModel(Base):
+    """Keys loaded by the in-progress keyset ETL run of a table, so a discarded run removes exactly its rows."""
+    __tablename__ = "etl_checkpoint_key"
+
+    table_name = Column(String(191), primary_key=True)
+    key_value = Column(String(191), primary_key=True)
+
+
+class EtlRowHashModel(Base):
+    """Content hash of every row synced in diff mode, keyed by the row's key values (JSON)."""
+    __tablename__ = "etl_row_hash"
+
+    table_name = Column(String(191), primary_key=True)
+    row_key = Column(String(191), primary_key=True)
+    row_hash = Column(BigInteger, nullable=False)
@@ -0,0 +1,77 @@
+"""Query-plan checks for the read endpoints.
+
+`endpoint_queries()` lists the statements the read endpoints run against
+`rekap_bulanan` and the tables derived from it. For each one it names the
+table that must be reached through an index. `check_query_plans(conn)` runs
+`EXPLAIN` for each statement on the connection's dialect and reports
+whether that table is searched by an index or scanned in full:
+
+- SQLite: `EXPLAIN QUERY PLAN`. A `SEARCH <table> USING ...` line passes;
+  `SCAN <table>` fails.
+- MySQL: `EXPLAIN`. The table's row must have a `key` and an access type
+  other than `ALL`.
+
+The test suite runs it on SQLite. `scripts/check_query_plans.py` runs it
+against `DATABASE_URL`, so the MySQL plans can be checked after a migration.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import Select
+
+from .analisis import analisis_kehadiran_select
+from .fastread import rekap_kehadiran_select
+from .kumulatif import tk_kumulatif_select
+from .rollup import rollup_select
+
+
+def endpoint_queries() -> Dict[str, Tuple[str, Select]]:
+    """Name -> (table that must use an index, statement) for the read paths."""
+    return {
+        "rekap_kehadiran tahun": ("rekap_bulanan", rekap_kehadiran_select(2025)),
+        "rekap_kehadiran tahun+bulan": ("rekap_bulanan", rekap_kehadiran_select(2025, bulan=1)),
+        "rekap_kehadiran tahun+bulan+instansi": ("rekap_bulanan", rekap_kehadiran_select(2025, bulan=1, instansi_id=1)),
+        "rekap_kehadiran tahun+instansi": ("rekap_bulanan", rekap_kehadiran_select(2025, instansi_id=1)),
+        "rekap_kehadiran tahun+karyawan": ("rekap_bulanan", rekap_kehadiran_select(2025, karyawan_id=1)),
+        "analisis_kehadiran (rekap_bulanan)": ("rekap_bulanan", analisis_kehadiran_select(2025, 6, 3)),
+        "analisis_kehadiran (kumulatif)": ("rekap_tk_kumulatif", tk_kumulatif_select(2025, 6, 3)),
+        "rekap_rollup": ("rekap_rollup", rollup_select(2025, 1, 6)[1]),
+    }
+
+
+def explain(conn: Connection, stmt: Select) -> List[tuple]:
+    """Raw `EXPLAIN` rows of `stmt` on `conn`'s dialect."""
+    compiled = stmt.compile(dialect=conn.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup or ())
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    return [tuple(row) for row in conn.exec_driver_sql(prefix + str(compiled), params)]
+
+
+def uses_index(conn: Connection, stmt: Select, table: str) -> Tuple[bool, List[str]]:
+    """Whether `table` is read through an index in the plan of `stmt`, and the plan lines."""
+    if conn.dialect.name == "sqlite":
+        lines = [str(row[-1]) for row in explain(conn, stmt)]
+        access = [line for line in lines if line.split(" ")[1:2] == [table]]
+        ok = bool(access) and all(line.startswith("SEARCH ") for line in access)
+        return ok, lines
+
+    result = conn.exec_driver_sql("EXPLAIN " + str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})))
+    rows = [dict(zip(result.keys(), row)) for row in result]
+    lines = [f"{r.get('table')}: type={r.get('type')} key={r.get('key')} extra={r.get('Extra')}" for r in rows]
+    access = [r for r in rows if r.get("table") == table]
+    ok = bool(access) and all(r.get("key") and r.get("type") != "ALL" for r in access)
+    return ok, lines
+
+
+def check_query_plans(conn: Connection) -> Dict[str, dict]:
+    """Plan check of every endpoint query: name -> {"ok", "table", "plan"}."""
+    report = {}
+    for name, (table, stmt) in endpoint_queries().items():
+        ok, plan = uses_index(conn, stmt, table)
+        report[name] = {"ok": ok, "table": table, "plan": plan}
+    return report
+
+
+__all__ = ["endpoint_queries", "explain", "uses_index", "check_query_plans"]
@@ -0,0 +1,188 @@
+"""Pluggable SQL reader backends.
+
+Every DataFrame read from a database (`analytics.query_to_df`,
+`query_to_df_chunks`, the ETL's chunk fetches, `tabletypes.read_sql_typed`
+and with it every `run_rekap` fetch) goes through a reader, picked by
+`get_reader()` from `READER_BACKEND`:
+
+- `pandas` (default): `pd.read_sql_query`. pandas turns the fetched tuples
+  into one object array and infers every column from Python objects.
+- `arrow`: fetches the raw driver rows in batches of `ARROW_BATCH_SIZE` and
+  builds one Arrow array per column directly from them (`pa.array`, in C).
+  `parse_dates` columns are cast to timestamps with Arrow compute. The result
+  is returned as a DataFrame of `pd.ArrowDtype` columns, or as numpy-backed
+  columns with `READER_DTYPE_BACKEND=numpy`; all-NULL columns are object
+  columns of None either way. `read_arrow` returns the `pyarrow.Table`
+  itself. The rows are the driver's values: statements built
+  with SQLAlchemy types are not run through their result processors.
+
+`scripts/bench_readers.py` compares the two on a seeded SQLite table.
+"""
+from __future__ import annotations
+
+import os
+from typing import Iterator, List, Optional, Union
+
+import pandas as pd
+from sqlalchemy.engine import Connection, Engine
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+READER_BACKEND = os.getenv("READER_BACKEND", "pandas")
+READER_DTYPE_BACKEND = os.getenv("READER_DTYPE_BACKEND", "pyarrow")
+ARROW_BATCH_SIZE = int(os.getenv("ARROW_BATCH_SIZE", 65536))
+
+
+class PandasReader:
+    """`pd.read_sql_query`, unchanged."""
+
+    name = "pandas"
+
+    def read(self, sql, con, params=None, chunksize: Optional[int] = None, parse_dates=None,
+             **read_sql_kwargs) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+        return pd.read_sql_query(sql, con, params=params, chunksize=chunksize, parse_dates=parse_dates, **read_sql_kwargs)
+
+
+def _to_array(values) -> "pa.Array":
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # a column mixing Python types (possible in SQLite) is read as text
+        return pa.array([None if v is None else str(v) for v in values], pa.string())
+
+
+def _date_options(parse_dates) -> dict:
+    if parse_dates is None:
+        return {}
+    if isinstance(parse_dates, dict):
+        return {col: opts if isinstance(opts, dict) else {"format": opts} for col, opts in parse_dates.items()}
+    return {col: {} for col in parse_dates}
+
+
+def _parse_date_column(array: "pa.Array", options: dict) -> "pa.Array":
+    if pa.types.is_timestamp(array.type):
+        return array
+    if pa.types.is_null(array.type):
+        # an all-NULL batch still reads as the timestamp column it was asked for
+        return pa.nulls(len(array), pa.timestamp("us"))
+    fmt = options.get("format")
+    if pa.types.is_string(array.type) or pa.types.is_date(array.type):
+        try:
+            if fmt in (None, "ISO8601") or pa.types.is_date(array.type):
+                return pc.cast(array, pa.timestamp("us"))
+            return pc.strptime(array, format=fmt, unit="us", error_is_null=options.get("errors") == "coerce")
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass
+    # values Arrow cannot parse (or coerce): let pandas apply the same options
+    parsed = pd.to_datetime(array.to_pandas(), **{"errors": "coerce", **options})
+    return pa.array(parsed.to_numpy(dtype="datetime64[us]"), pa.timestamp("us"))
+
+
+class ArrowReader:
+    """Decode result batches straight into Arrow columns."""
+
+    name = "arrow"
+
+    def __init__(self, batch_size: int = ARROW_BATCH_SIZE, dtype_backend: str = READER_DTYPE_BACKEND):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for the arrow reader backend")
+        if dtype_backend not in ("pyarrow", "numpy"):
+            raise ValueError("dtype_backend must be 'pyarrow' or 'numpy'")
+        self.batch_size = batch_size
+        self.dtype_backend = dtype_backend
+
+    def _rows(self, sql, con, params) -> Iterator[tuple]:
+        """Yield the column names, then lists of raw row tuples of at most `batch_size`."""
+        if isinstance(con, Engine):
+            with con.connect() as conn:
+                yield from self._rows(sql, conn, params)
+            return
+        if isinstance(con, Connection):
+            if isinstance(sql, str):
+                result = con.exec_driver_sql(sql, tuple(params) if isinstance(params, list) else params)
+            else:
+                result = con.execute(sql, params or {})
+            cursor, close = result.cursor, result.close
+        else:
+            # a DB-API connection (pymysql)
+            cursor = con.cursor()
+            if params is None:
+                cursor.execute(sql)
+            else:
+                cursor.execute(sql, params)
+            close = cursor.close
+        try:
+            yield [d[0] for d in cursor.description]
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            close()
+
+    def _batches(self, sql, con, params=None, parse_dates=None, batch_size: Optional[int] = None) -> Iterator["pa.Table"]:
+        dates = _date_options(parse_dates)
+        reader = self if batch_size is None else ArrowReader(batch_size, self.dtype_backend)
+        rows = reader._rows(sql, con, params)
+        names = next(rows)
+        empty = True
+        for batch in rows:
+            empty = False
+            columns = [_to_array(values) for values in zip(*batch)]
+            columns = [_parse_date_column(a, dates[n]) if n in dates else a for n, a in zip(names, columns)]
+            yield pa.Table.from_arrays(columns, names=names)
+        if empty:
+            yield pa.table({n: pa.array([], pa.null()) for n in names})
+
+    def read_arrow(self, sql, con, params=None, parse_dates=None) -> "pa.Table":
+        """The whole result as one `pyarrow.Table`."""
+        tables: List[pa.Table] = list(self._batches(sql, con, params, parse_dates))
+        # batches whose column was all NULL (null type) or int vs float are unified here
+        return pa.concat_tables(tables, promote_options="permissive") if len(tables) > 1 else tables[0]
+
+    def to_pandas(self, table: "pa.Table") -> pd.DataFrame:
+        if self.dtype_backend == "pyarrow":
+            # all-NULL columns (null type, nothing to infer from) become object columns of None,
+            # as `pd.read_sql_query` reads them; null[pyarrow] cannot take values (isin, fillna)
+            return table.to_pandas(types_mapper=lambda t: None if pa.types.is_null(t) else pd.ArrowDtype(t))
+        return table.to_pandas()
+
+    def _frame(self, table: "pa.Table", index_col=None, coerce_float: bool = True, dtype=None) -> pd.DataFrame:
+        if coerce_float:
+            # DECIMAL columns come back as floats, as with `pd.read_sql_query`
+            for i, field in enumerate(table.schema):
+                if pa.types.is_decimal(field.type):
+                    table = table.set_column(i, field.name, pc.cast(table.column(i), pa.float64()))
+        df = self.to_pandas(table)
+        if dtype is not None:
+            df = df.astype(dtype)
+        if index_col is not None:
+            df = df.set_index(index_col)
+        return df
+
+    def read(self, sql, con, params=None, chunksize: Optional[int] = None, parse_dates=None, index_col=None,
+             coerce_float: bool = True, dtype=None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+        """Like `pd.read_sql_query`: `index_col`, `coerce_float` and `dtype` are applied to each frame."""
+        options = {"index_col": index_col, "coerce_float": coerce_float, "dtype": dtype}
+        if chunksize is None:
+            return self._frame(self.read_arrow(sql, con, params, parse_dates), **options)
+        return (self._frame(t, **options) for t in self._batches(sql, con, params, parse_dates, batch_size=chunksize))
+
+
+def get_reader(name: Optional[str] = None):
+    """Reader backend `name` (default `READER_BACKEND`): "pandas" or "arrow"."""
+    name = name or READER_BACKEND
+    if name == "pandas":
+        return PandasReader()
+    if name == "arrow":
+        return ArrowReader()
+    raise ValueError(f"Backend pembaca tidak dikenal: {name} (pandas, arrow)")
+
+
+__all__ = ["READER_BACKEND", "ARROW_BATCH_SIZE", "PandasReader", "ArrowReader", "get_reader"]
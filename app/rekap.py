@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-from typing import Optional, Tuple
+from typing import Iterator, List, Optional, Tuple
 from calendar import monthrange
+from contextlib import contextmanager
 from pathlib import Path
 
 import pandas as pd
-from sqlalchemy.exc import OperationalError
+import numpy as np
+from pandas.errors import DatabaseError
+from sqlalchemy.exc import DBAPIError
 from sshtunnel import SSHTunnelForwarder
 import pymysql
 
@@ -15,119 +18,303 @@ from dotenv import load_dotenv
 import datetime
 
 from .analytics import get_engine
+from .dimcache import engine_source, fetch_dimension
 from .presensi import generate_presensi_laporan, generate_laporan_bulanan
+from .shifts import merge_rencana_shift
+from .tabletypes import read_sql_typed
 
 
 def _fetch_via_ssh(ssh_host: str, ssh_port: int, ssh_user: str, ssh_password: Optional[str],
                    db_host: str, db_port: int, db_user: str, db_password: str, db_name: str,
                    instansi_id: int, tanggal_awal: str, tanggal_akhir: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    with SSHTunnelForwarder(
-        (ssh_host, ssh_port),
-        ssh_username=ssh_user,
-        ssh_password=ssh_password,
-        remote_bind_address=(db_host, db_port),
-        local_bind_address=('127.0.0.1', 10022),
-    ) as tunnel:
-        conn = pymysql.connect(host='127.0.0.1', port=10022, user=db_user, password=db_password, db=db_name)
-
-        df_pegawai = pd.read_sql("SELECT * FROM presensi_karyawan WHERE instansi_id = %s", conn, params=[instansi_id])
-
-        df_presensi = pd.read_sql(
-            "SELECT * FROM presensi_kehadiran WHERE instansi_id = %s AND date(tanggal_masuk) BETWEEN %s AND %s",
-            conn, params=[instansi_id, tanggal_awal, tanggal_akhir]
-        )
-
-        df_rencana = pd.read_sql(
-            "SELECT * FROM presensi_rencana_shift WHERE instansi_id = %s AND date(tanggal_masuk) BETWEEN %s AND %s",
-            conn, params=[instansi_id, tanggal_awal, tanggal_akhir]
-        )
-
-        df_shift = pd.read_sql("SELECT * FROM presensi_shift", conn)
-
-        df_absen = pd.read_sql(
-            "SELECT presensi_absen.* FROM presensi_absen LEFT JOIN presensi_karyawan ON presensi_absen.karyawan_id = presensi_karyawan.id WHERE presensi_karyawan.instansi_id = %s",
-            conn, params=[instansi_id]
-        )
-
-        conn.close()
-
-    return df_pegawai, df_rencana, df_presensi, df_shift, df_absen
+    ssh = (ssh_host, ssh_port, ssh_user, ssh_password, db_host, db_port, db_user, db_password, db_name)
+    with _source_connection(None, ssh) as (conn, source):
+        return _fetch_tables(conn, source, instansi_id, tanggal_awal, tanggal_akhir)
 # End of _fetch_via_ssh
 
 # Fetch data to Local DB using SQLAlchemy engine and using pydantic models
 def _fetch_local_db(instansi_id: int, tanggal_awal: str, tanggal_akhir: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     engine = get_engine(None)  # get local engine from env DATABASE_URL
     with engine.connect() as conn:
-        df_pegawai = pd.read_sql_query(f"SELECT * FROM presensi_karyawan WHERE instansi_id = {instansi_id}", conn)
+        df_pegawai = read_sql_typed(f"SELECT * FROM presensi_karyawan WHERE instansi_id = {instansi_id}", conn, "presensi_karyawan")
 
-        df_presensi = pd.read_sql_query(
+        df_presensi = read_sql_typed(
             f"SELECT * FROM presensi_kehadiran WHERE instansi_id = {instansi_id} AND date(tanggal_masuk) BETWEEN '{tanggal_awal}' AND '{tanggal_akhir}'",
-            conn,
+            conn, "presensi_kehadiran",
         )
 
-        df_rencana = pd.read_sql_query(
+        df_rencana = read_sql_typed(
             f"SELECT * FROM presensi_rencana_shift WHERE instansi_id = {instansi_id} AND date(tanggal_masuk) BETWEEN '{tanggal_awal}' AND '{tanggal_akhir}'",
-            conn,
+            conn, "presensi_rencana_shift",
         )
 
-        df_shift = pd.read_sql_query("SELECT * FROM presensi_shift", conn)
+        df_shift = read_sql_typed("SELECT * FROM presensi_shift", conn, "presensi_shift")
 
-        df_absen = pd.read_sql_query(
+        df_absen = read_sql_typed(
             f"SELECT presensi_absen.* FROM presensi_absen LEFT JOIN presensi_karyawan ON presensi_absen.karyawan_id = presensi_karyawan.id WHERE presensi_karyawan.instansi_id = {instansi_id}",
-            conn,
+            conn, "presensi_absen",
         )
 
     return df_pegawai, df_rencana, df_presensi, df_shift, df_absen
 
 
 def _fetch_via_engine(remote_url: str, instansi_id: int, tanggal_awal: str, tanggal_akhir: str):
+    with _source_connection(remote_url, None) as (conn, source):
+        return _fetch_tables(conn, source, instansi_id, tanggal_awal, tanggal_akhir)
+# End of _fetch_via_engine
+
+
+# Out-of-core mode: instansi whose month of check-ins exceeds the threshold
+# are rekapped per batch of karyawan instead of from five whole tables.
+REKAP_STREAM_THRESHOLD = int(os.getenv('REKAP_STREAM_THRESHOLD', 1000000))
+REKAP_STREAM_BATCH = int(os.getenv('REKAP_STREAM_BATCH', 500))
+
+
+@contextmanager
+def _source_connection(remote_url: Optional[str], ssh: Optional[tuple]):
+    """Yield (connection, dimension cache source) for the remote DB; `ssh` as the arguments of `_fetch_via_ssh`."""
+    if ssh is not None:
+        ssh_host, ssh_port, ssh_user, ssh_password, db_host, db_port, db_user, db_password, db_name = ssh
+        with SSHTunnelForwarder(
+            (ssh_host, ssh_port),
+            ssh_username=ssh_user,
+            ssh_password=ssh_password,
+            remote_bind_address=(db_host, db_port),
+            local_bind_address=('127.0.0.1', 10022),
+        ) as tunnel:
+            conn = pymysql.connect(host='127.0.0.1', port=10022, user=db_user, password=db_password, db=db_name)
+            try:
+                yield conn, f"mysql+ssh://{ssh_user}@{ssh_host}:{ssh_port}/{db_host}:{db_port}/{db_name}"
+            finally:
+                conn.close()
+        return
     engine = get_engine(remote_url)
-    with engine.connect() as conn:
-        # Some DBs (like SQLite used for testing) may not have schema prefixes; queries are written conservatively
-        try:
-            df_pegawai = pd.read_sql_query(f"SELECT * FROM presensi_karyawan WHERE instansi_id = {instansi_id}", conn)
+    try:
+        with engine.connect() as conn:
+            yield conn, engine_source(engine)
+    finally:
+        engine.dispose()
 
-            df_presensi = pd.read_sql_query(
-                f"SELECT * FROM presensi_kehadiran WHERE instansi_id = {instansi_id} AND date(tanggal_masuk) BETWEEN '{tanggal_awal}' AND '{tanggal_akhir}'",
-                conn,
-            )
 
-            df_rencana = pd.read_sql_query(
-                f"SELECT * FROM presensi_rencana_shift WHERE instansi_id = {instansi_id} AND date(tanggal_masuk) BETWEEN '{tanggal_awal}' AND '{tanggal_akhir}'",
-                conn,
-            )
+def _missing_column(exc: BaseException) -> bool:
+    """Whether `exc` (or the driver error it wraps) is SQLite's "no such column" or MySQL's 1054 "Unknown column"."""
+    while exc is not None:
+        args = getattr(exc, 'args', ())
+        if (args and args[0] == 1054) or 'no such column' in str(exc).lower():
+            return True
+        exc = getattr(exc, 'orig', None) or exc.__cause__
+    return False
 
-            df_shift = pd.read_sql_query("SELECT * FROM presensi_shift", conn)
 
-            df_absen = pd.read_sql_query(
-                f"SELECT presensi_absen.* FROM presensi_absen LEFT JOIN presensi_karyawan ON presensi_absen.karyawan_id = presensi_karyawan.id WHERE presensi_karyawan.instansi_id = {instansi_id}",
-                conn,
-            )
-        except OperationalError:
-            # Fallback for simple/local DBs where instansi_id or schema prefixes may be missing.
-            df_pegawai = pd.read_sql_query("SELECT * FROM presensi_karyawan", conn)
-            df_presensi = pd.read_sql_query(
-                f"SELECT * FROM presensi_kehadiran WHERE date(tanggal_masuk) BETWEEN '{tanggal_awal}' AND '{tanggal_akhir}'",
-                conn,
-            )
-            df_rencana = pd.read_sql_query(
-                f"SELECT * FROM presensi_rencana_shift WHERE date(tanggal_masuk) BETWEEN '{tanggal_awal}' AND '{tanggal_akhir}'",
-                conn,
-            )
-            df_shift = pd.read_sql_query("SELECT * FROM presensi_shift", conn)
-            df_absen = pd.read_sql_query("SELECT * FROM presensi_absen", conn)
+# what a query on a source without instansi_id raises: SQLAlchemy's wrapper, pymysql's
+# own error on the SSH path, or pandas' wrapper of the DB-API error (`pd.read_sql`)
+_QUERY_ERRORS = (DBAPIError, pymysql.err.Error, DatabaseError)
+
+
+def _fetch_tables(conn, source: str, instansi_id: int, tanggal_awal: str, tanggal_akhir: str):
+    """(pegawai, rencana, presensi, shift, absen) of the period, read on an open source connection."""
+    period = f"date(tanggal_masuk) BETWEEN '{tanggal_awal}' AND '{tanggal_akhir}'"
+    try:
+        df_pegawai = fetch_dimension(conn, source, "presensi_karyawan", instansi_id)
+
+        df_presensi = read_sql_typed(
+            f"SELECT * FROM presensi_kehadiran WHERE instansi_id = {int(instansi_id)} AND {period}",
+            conn, "presensi_kehadiran",
+        )
+
+        df_rencana = read_sql_typed(
+            f"SELECT * FROM presensi_rencana_shift WHERE instansi_id = {int(instansi_id)} AND {period}",
+            conn, "presensi_rencana_shift",
+        )
+
+        df_shift = fetch_dimension(conn, source, "presensi_shift")
+
+        df_absen = read_sql_typed(
+            f"SELECT presensi_absen.* FROM presensi_absen LEFT JOIN presensi_karyawan ON presensi_absen.karyawan_id = presensi_karyawan.id WHERE presensi_karyawan.instansi_id = {int(instansi_id)}",
+            conn, "presensi_absen",
+        )
+    except _QUERY_ERRORS as e:
+        if not _missing_column(e):
+            raise
+        # Fallback for simple/local DBs (like SQLite used for testing) where instansi_id may be missing.
+        df_pegawai = read_sql_typed("SELECT * FROM presensi_karyawan", conn, "presensi_karyawan")
+        df_presensi = read_sql_typed(f"SELECT * FROM presensi_kehadiran WHERE {period}", conn, "presensi_kehadiran")
+        df_rencana = read_sql_typed(f"SELECT * FROM presensi_rencana_shift WHERE {period}", conn, "presensi_rencana_shift")
+        df_shift = read_sql_typed("SELECT * FROM presensi_shift", conn, "presensi_shift")
+        df_absen = read_sql_typed("SELECT * FROM presensi_absen", conn, "presensi_absen")
 
     return df_pegawai, df_rencana, df_presensi, df_shift, df_absen
-# End of _fetch_via_engine
+
+
+def _count_kehadiran(conn, instansi_id: int, tanggal_awal: str, tanggal_akhir: str) -> int:
+    """Number of check-ins a rekap of the period would load (the pre-fetch `COUNT(*)`)."""
+    sql = (f"SELECT COUNT(*) FROM presensi_kehadiran WHERE instansi_id = {int(instansi_id)} "
+           f"AND date(tanggal_masuk) BETWEEN '{tanggal_awal}' AND '{tanggal_akhir}'")
+    return int(pd.read_sql(sql, conn).iloc[0, 0])
+
+
+def _karyawan_ranges(df_pegawai: pd.DataFrame, batch_size: int) -> List[Tuple[int, int]]:
+    """Consecutive (first, last) karyawan id ranges of at most `batch_size` karyawan each."""
+    ids = sorted(int(i) for i in df_pegawai['id'].dropna().unique())
+    return [(ids[i], ids[min(i + batch_size, len(ids)) - 1]) for i in range(0, len(ids), batch_size)]
+
+
+def _stream_batches(conn, instansi_id: int, tanggal_awal: str, tanggal_akhir: str,
+                    ranges: List[Tuple[int, int]]) -> Iterator[Tuple[int, int, pd.DataFrame, pd.DataFrame, pd.DataFrame]]:
+    """Yield (first, last, rencana, presensi, absen) of each karyawan id range, ordered by karyawan_id."""
+    period = f"date(tanggal_masuk) BETWEEN '{tanggal_awal}' AND '{tanggal_akhir}'"
+    for lo, hi in ranges:
+        scope = f"instansi_id = {int(instansi_id)} AND karyawan_id BETWEEN {lo} AND {hi}"
+        df_rencana = read_sql_typed(
+            f"SELECT * FROM presensi_rencana_shift WHERE {scope} AND {period} ORDER BY karyawan_id, tanggal_masuk",
+            conn, "presensi_rencana_shift",
+        )
+        df_presensi = read_sql_typed(
+            f"SELECT * FROM presensi_kehadiran WHERE {scope} AND {period} ORDER BY karyawan_id, tanggal_kirim",
+            conn, "presensi_kehadiran",
+        )
+        df_absen = read_sql_typed(
+            f"SELECT presensi_absen.* FROM presensi_absen LEFT JOIN presensi_karyawan ON presensi_absen.karyawan_id = presensi_karyawan.id "
+            f"WHERE presensi_karyawan.instansi_id = {int(instansi_id)} AND presensi_absen.karyawan_id BETWEEN {lo} AND {hi} "
+            f"ORDER BY presensi_absen.karyawan_id",
+            conn, "presensi_absen",
+        )
+        yield lo, hi, df_rencana, df_presensi, df_absen
+
+
+def _save_raw_tables(local_url: Optional[str], raw_tables: dict, save_raw_mode: str, if_exists: str = 'replace') -> None:
+    """Write fetched source tables to the local DB (`save_raw` of `run_rekap`)."""
+    # get local engine (prefer explicit local_url, then env DATABASE_URL)
+    try:
+        local_engine = get_engine(local_url)
+    except Exception:
+        local_engine = None
+
+    if local_engine is None:
+        raise ValueError("save_raw=True but no local database available (set local_url or DATABASE_URL)")
+
+    with local_engine.begin() as conn:
+        for name, df_raw in raw_tables.items():
+            if save_raw_mode == 'diff' and 'id' in df_raw.columns:
+                from .cdc import diff_sync_frame
+
+                diff_sync_frame(conn, name, df_raw, ['id'])
+            else:
+                df_raw.to_sql(name, conn, if_exists=if_exists, index=False)
+
+
+def _rekap_frames(df_pegawai, df_rencana, df_presensi, df_shift, df_absen, instansi: int, month: int, year: int,
+                  tanggal_awal: str, tanggal_akhir: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Daily laporan and monthly rekap rows (with instansi_id, tahun, bulan) of the fetched tables."""
+    # merge rencana + shift; jadwal columns come from the compiled shift templates
+    df_rencana_shift = merge_rencana_shift(df_rencana, df_shift)
+
+    # tanggal_* columns of presensi and absen were parsed at read time (app/tabletypes.py)
+    df_laporan = generate_presensi_laporan(df_pegawai, df_rencana_shift, df_presensi, df_absen, month, year, tanggal_awal, tanggal_akhir)
+    if df_laporan.empty:
+        return df_laporan, pd.DataFrame()
+
+    df_laporan_bulanan = generate_laporan_bulanan(df_laporan)
+
+    df_laporan_bulanan['instansi_id'] = instansi
+    df_laporan_bulanan['tahun'] = year
+    df_laporan_bulanan['bulan'] = month
+    return df_laporan, df_laporan_bulanan
+
+
+def _run_rekap_stream(conn, source: str, instansi: int, month: int, year: int, tanggal_awal: str, tanggal_akhir: str, *,
+                      batch_size: int, local_url: Optional[str], save_raw: bool, save_raw_mode: str,
+                      scan_anomali: bool) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """Rekap `instansi` batch by batch of karyawan; return the monthly rows and the anomaly flags.
+
+    Only the dimension tables and one batch of rencana, presensi and absen
+    are held at a time. Each batch's rekap rows are saved before the next
+    batch is read; the returned monthly rows are one per karyawan.
+    rekap_versi, the rollup, the TK running totals and the cubes are
+    refreshed once for all saved rows, after the last batch. With
+    `scan_anomali`, 12 bytes per check-in of the month are kept until the end
+    for `kirim_kembar`.
+    """
+    df_pegawai = fetch_dimension(conn, source, "presensi_karyawan", instansi)
+    df_shift = fetch_dimension(conn, source, "presensi_shift")
+    if save_raw:
+        _save_raw_tables(local_url, {'presensi_karyawan': df_pegawai, 'presensi_shift': df_shift}, save_raw_mode)
+
+    bulanan, flags = [], []
+    # kirim_kembar compares karyawan across batches, so it needs every check-in of the
+    # instansi: only karyawan_id (int32) and tanggal_kirim (int64 ns) are kept, 12 bytes each
+    checkin_karyawan, checkin_kirim = [], []
+    ranges = _karyawan_ranges(df_pegawai, batch_size)
+    try:
+        for i, (lo, hi, df_rencana, df_presensi, df_absen) in enumerate(_stream_batches(conn, instansi, tanggal_awal, tanggal_akhir, ranges)):
+            if save_raw:
+                raw_tables = {'presensi_rencana_shift': df_rencana, 'presensi_kehadiran': df_presensi, 'presensi_absen': df_absen}
+                _save_raw_tables(local_url, raw_tables, save_raw_mode, if_exists='replace' if i == 0 else 'append')
+
+            df_batch_pegawai = df_pegawai[df_pegawai['id'].between(lo, hi)]
+            df_laporan, df_batch = _rekap_frames(df_batch_pegawai, df_rencana, df_presensi, df_shift, df_absen,
+                                                 instansi, month, year, tanggal_awal, tanggal_akhir)
+            if df_batch.empty:
+                continue
+            # rows only; rekap_versi, the derived tables and the cubes are refreshed once, below
+            simpan_rekap_bulanan(df_batch, refresh=False)
+            bulanan.append(df_batch)
+
+            if scan_anomali:
+                from .anomali import lokasi_mustahil, selalu_tepat_waktu
+
+                # per-karyawan rules run per batch
+                flags += [lokasi_mustahil(df_presensi), selalu_tepat_waktu(df_laporan)]
+                sent = df_presensi.dropna(subset=['karyawan_id', 'tanggal_kirim'])
+                checkin_karyawan.append(sent['karyawan_id'].to_numpy(dtype=np.int32))
+                checkin_kirim.append(sent['tanggal_kirim'].to_numpy(dtype='datetime64[ns]'))
+    finally:
+        # also after a failed batch, so the rows already saved are not served from stale caches
+        if bulanan:
+            refresh_rekap_bulanan(pd.concat(bulanan, ignore_index=True))
+
+    if scan_anomali:
+        from .anomali import ANOMALI_COLUMNS, kirim_kembar
+
+        if checkin_karyawan:
+            karyawan_ids = np.concatenate(checkin_karyawan)
+            flags.append(kirim_kembar(pd.DataFrame({
+                'karyawan_id': karyawan_ids,
+                'instansi_id': np.full(len(karyawan_ids), instansi, dtype=np.int32),
+                'tanggal_kirim': np.concatenate(checkin_kirim),
+            })))
+        flags = [f for f in flags if not f.empty]
+        flags = pd.concat(flags, ignore_index=True) if flags else pd.DataFrame(columns=ANOMALI_COLUMNS)
+    else:
+        flags = None
+    return (pd.concat(bulanan, ignore_index=True) if bulanan else pd.DataFrame()), flags
 
 
 def run_rekap(instansi: int, month: int, year: int, *, remote_url: Optional[str] = None, use_ssh: bool = False,
               ssh_host: Optional[str] = None, ssh_port: int = 22, ssh_user: Optional[str] = None, ssh_password: Optional[str] = None,
               db_host: str = '127.0.0.1', db_port: int = 3306, db_user: Optional[str] = None, db_password: Optional[str] = None, db_name: str = 'bkd_presensi',
-              local_url: Optional[str] = None, save_raw: bool = False) -> pd.DataFrame:
+              local_url: Optional[str] = None, save_raw: bool = False, save_raw_mode: str = "replace",
+              parquet_root: Optional[str] = None, scan_anomali: bool = False,
+              stream: Optional[bool] = None, stream_threshold: Optional[int] = None, stream_batch: Optional[int] = None) -> pd.DataFrame:
     """Fetch data (via direct engine or SSH), run generate_presensi_laporan and return the result DataFrame.
 
     This function keeps everything in-memory and does not write to local DB or Excel.
+    With `save_raw`, the fetched tables are also written to the local DB:
+    `save_raw_mode="replace"` replaces them, `"diff"` upserts only new or
+    changed rows by `id` (see `app/cdc.py`) and keeps rows of other months.
+    With `parquet_root` (default env `REKAP_PARQUET_ROOT`) the monthly rekap
+    also replaces its instansi/tahun/bulan partition of the `rekap_bulanan`
+    Parquet dataset (see `app/lake.py`).
+    With `scan_anomali`, the check-ins and daily laporan of the month are
+    scanned for suspicious patterns and the flags of this instansi and month
+    replace the earlier ones in the local `presensi_anomali` table (see
+    `app/anomali.py`).
+    With `stream=True` the month is rekapped out of core: rencana, presensi
+    and absen are read in batches of `stream_batch` karyawan (default env
+    `REKAP_STREAM_BATCH`) ordered by karyawan_id, and each batch's rekap rows
+    are saved before the next batch is read. With `stream=None` (default) a
+    `COUNT(*)` of the month's check-ins picks the mode: streamed above
+    `stream_threshold` rows (default env `REKAP_STREAM_THRESHOLD`).
     """
     now = datetime.datetime.now()
 
@@ -149,94 +336,79 @@ def run_rekap(instansi: int, month: int, year: int, *, remote_url: Optional[str]
     if use_ssh:
         if not all([ssh_host, ssh_user, db_user, db_password]):
             raise ValueError('SSH mode requires ssh_host, ssh_user, db_user and db_password')
-        df_pegawai, df_rencana, df_presensi, df_shift, df_absen = _fetch_via_ssh(
-            ssh_host, ssh_port, ssh_user, ssh_password,
-            db_host, db_port, db_user, db_password, db_name,
-            instansi, tanggal_awal, tanggal_akhir
-        )
+        ssh = (ssh_host, ssh_port, ssh_user, ssh_password, db_host, db_port, db_user, db_password, db_name)
     else:
         if not remote_url:
             raise ValueError('remote_url must be provided when not using SSH')
-        df_pegawai, df_rencana, df_presensi, df_shift, df_absen = _fetch_via_engine(remote_url, instansi, tanggal_awal, tanggal_akhir)
+        ssh = None
 
-    # Optionally save the raw fetched tables to a local DB
-    if save_raw:
-        # get local engine (prefer explicit local_url, then env DATABASE_URL)
-        try:
-            from .analytics import get_engine
-
-            local_engine = get_engine(local_url)
-        except Exception:
-            local_engine = None
-
-        if local_engine is None:
-            raise ValueError("save_raw=True but no local database available (set local_url or DATABASE_URL)")
-
-        # write DataFrames to local DB replacing existing content for an idempotent snapshot
-        try:
-            with local_engine.begin() as conn:
-                # choose table names matching source
-                df_pegawai.to_sql('presensi_karyawan', conn, if_exists='replace', index=False)
-                df_rencana.to_sql('presensi_rencana_shift', conn, if_exists='replace', index=False)
-                df_presensi.to_sql('presensi_kehadiran', conn, if_exists='replace', index=False)
-                df_shift.to_sql('presensi_shift', conn, if_exists='replace', index=False)
-                df_absen.to_sql('presensi_absen', conn, if_exists='replace', index=False)
-        except Exception as e:
-            # fail early and surface the error
-            raise
-
-    # merge rencana + shift similar to script
-    if 'shift_id' in df_rencana.columns:
-        df_rencana_shift = df_rencana.merge(df_shift, left_on='shift_id', right_on='id', how='left')
-    else:
-        df_rencana_shift = df_rencana
+    flags = None
+    # one connection (and SSH tunnel) serves the count and whichever fetch it picks
+    with _source_connection(remote_url, ssh) as (conn, source):
+        if stream is None:
+            threshold = REKAP_STREAM_THRESHOLD if stream_threshold is None else stream_threshold
+            try:
+                stream = _count_kehadiran(conn, instansi, tanggal_awal, tanggal_akhir) > threshold
+            except _QUERY_ERRORS as e:
+                if not _missing_column(e):
+                    raise
+                # sources without instansi_id (see _fetch_tables) are small: load them whole
+                stream = False
+        if stream:
+            df_laporan_bulanan, flags = _run_rekap_stream(
+                conn, source, instansi, month, year, tanggal_awal, tanggal_akhir,
+                batch_size=stream_batch or REKAP_STREAM_BATCH, local_url=local_url,
+                save_raw=save_raw, save_raw_mode=save_raw_mode, scan_anomali=scan_anomali,
+            )
+        else:
+            df_pegawai, df_rencana, df_presensi, df_shift, df_absen = _fetch_tables(conn, source, instansi, tanggal_awal, tanggal_akhir)
 
-    # normalize/parse columns
-    if 'tanggal_masuk' in df_rencana_shift.columns:
-        df_rencana_shift['tanggal_masuk'] = pd.to_datetime(df_rencana_shift['tanggal_masuk'], errors='coerce')
+    if not stream:
+        # Optionally save the raw fetched tables to a local DB, replacing existing content for an idempotent snapshot
+        if save_raw:
+            _save_raw_tables(local_url, {
+                'presensi_karyawan': df_pegawai,
+                'presensi_rencana_shift': df_rencana,
+                'presensi_kehadiran': df_presensi,
+                'presensi_shift': df_shift,
+                'presensi_absen': df_absen,
+            }, save_raw_mode)
 
-    for time_col in ['masuk_pre_time', 'masuk_post_time', 'masuk_max_time', 'pulang_pre_time', 'pulang_post_time', 'jam_masuk', 'jam_pulang']:
-        if time_col in df_rencana_shift.columns:
-            try:
-                df_rencana_shift[time_col] = df_rencana_shift['tanggal_masuk'] + pd.to_timedelta(df_rencana_shift[time_col])
-            except Exception:
-                df_rencana_shift[time_col] = pd.to_datetime(df_rencana_shift[time_col], errors='coerce')
+        # simpan_data_karyawan(df_pegawai)
 
-    if 'tanggal_mulai' in df_absen.columns:
-        df_absen['tanggal_mulai'] = pd.to_datetime(df_absen['tanggal_mulai'], errors='coerce')
-    if 'tanggal_selesai' in df_absen.columns:
-        df_absen['tanggal_selesai'] = pd.to_datetime(df_absen['tanggal_selesai'], errors='coerce')
+        df_laporan, df_laporan_bulanan = _rekap_frames(df_pegawai, df_rencana, df_presensi, df_shift, df_absen,
+                                                       instansi, month, year, tanggal_awal, tanggal_akhir)
 
-    if 'tanggal_masuk' in df_presensi.columns:
-        df_presensi['tanggal_masuk'] = pd.to_datetime(df_presensi['tanggal_masuk'], errors='coerce')
-    if 'tanggal_kirim' in df_presensi.columns:
-        df_presensi['tanggal_kirim'] = pd.to_datetime(df_presensi['tanggal_kirim'], errors='coerce')
+        # menyimpan hasil rekap ke local db
+        # df_laporan_bulanan ditambahkan kolom instansi_id, tahun dan bulan
 
-    # simpan_data_karyawan(df_pegawai)
+        if not df_laporan_bulanan.empty:
+            simpan_rekap_bulanan(df_laporan_bulanan)
 
-    df_laporan = generate_presensi_laporan(df_pegawai, df_rencana_shift, df_presensi, df_absen, month, year, tanggal_awal, tanggal_akhir)
+        if scan_anomali:
+            from .anomali import scan_anomali as _scan
 
-    # df_laporan = df_laporan[df_laporan['karyawan_id'] == 22777]
-    
-    # return df_laporan
+            flags = _scan(df_laporan, df_presensi)
 
-    df_laporan_bulanan = generate_laporan_bulanan(df_laporan)
+    parquet_root = parquet_root or os.getenv('REKAP_PARQUET_ROOT')
+    if parquet_root:
+        from .lake import write_partitioned
 
-    df_laporan_bulanan['instansi_id'] = instansi
-    df_laporan_bulanan['tahun'] = year
-    df_laporan_bulanan['bulan'] = month
+        write_partitioned(df_laporan_bulanan, parquet_root, 'rekap_bulanan', mode='overwrite')
 
-    # menyimpan hasil rekap ke local db
-    # df_laporan_bulanan ditambahkan kolom instansi_id, tahun dan bulan
+    if flags is not None:
+        from .anomali import simpan_anomali
 
-    simpan_rekap_bulanan(df_laporan_bulanan)
+        with get_engine(local_url).begin() as conn:
+            simpan_anomali(conn, flags, tanggal_awal, tanggal_akhir, instansi_id=instansi)
 
     return df_laporan_bulanan
 # End of run_rekap
 
 def run_rekap_tahunan(instansi: int, year: int, *, remote_url: Optional[str] = None, use_ssh: bool = False,
               ssh_host: Optional[str] = None, ssh_port: int = 22, ssh_user: Optional[str] = None, ssh_password: Optional[str] = None,
-              db_host: str = '127.0.0.1', db_port: int = 3306, db_user: Optional[str] = None, db_password: Optional[str] = None, db_name: str = 'bkd_presensi') -> pd.DataFrame:
+              db_host: str = '127.0.0.1', db_port: int = 3306, db_user: Optional[str] = None, db_password: Optional[str] = None, db_name: str = 'bkd_presensi',
+              parquet_root: Optional[str] = None) -> pd.DataFrame:
     """Run rekap for all months in the given year and return the concatenated DataFrame.
     """
     df_list = []
@@ -263,6 +435,7 @@ def run_rekap_tahunan(instansi: int, year: int, *, remote_url: Optional[str] = N
             db_user=db_user,
             db_password=db_password,
             db_name=db_name,
+            parquet_root=parquet_root,
         )
         df_list.append(df_monthly)
     df_yearly = pd.concat(df_list, ignore_index=True)
@@ -332,16 +505,25 @@ def simpan_data_karyawan(df_pegawai: pd.DataFrame) -> None:
     local_db_connection.close()
 
 
-def simpan_rekap_bulanan(df_laporan_bulanan: pd.DataFrame) -> None:
-    """Simpan df_laporan_bulanan ke local DB dengan menambahkan kolom instansi_id, tahun, bulan."""
-
-    local_db_connection = pymysql.connect(
+def _local_rekap_connection():
+    return pymysql.connect(
         host=os.getenv('DB_HOST_LOCAL', 'localhost'),
         port=int(os.getenv('DB_PORT_LOCAL', 3306)),
         user=os.getenv('DB_USER_LOCAL', 'root'),
         password=os.getenv('DB_PASSWORD_LOCAL', ''),
         db=os.getenv('DB_NAME_LOCAL', 'bkd_presensi')
     )
+
+
+def simpan_rekap_bulanan(df_laporan_bulanan: pd.DataFrame, refresh: bool = True) -> None:
+    """Simpan df_laporan_bulanan ke local DB dengan menambahkan kolom instansi_id, tahun, bulan.
+
+    With `refresh=False` only the rows are written; the caller runs
+    `refresh_rekap_bulanan` once for everything it saved (the streamed rekap
+    does so after its last batch).
+    """
+
+    local_db_connection = _local_rekap_connection()
     
     insert_query = """
     INSERT INTO rekap_bulanan (
@@ -392,5 +574,76 @@ def simpan_rekap_bulanan(df_laporan_bulanan: pd.DataFrame) -> None:
                 row['tugas_bk'],
                 row['tanpa_keterangan']
             ))
+
+        if refresh:
+            _refresh_partitions(cursor, df_laporan_bulanan)
         local_db_connection.commit()
-    local_db_connection.close()
\ No newline at end of file
+    local_db_connection.close()
+
+    if refresh:
+        # keep the in-process analytics cubes in step with the committed rows (app/cube.py)
+        from .cube import refresh_cubes
+
+        refresh_cubes(df_laporan_bulanan)
+
+
+def refresh_rekap_bulanan(df_laporan_bulanan: pd.DataFrame) -> None:
+    """Refresh what derives from the saved rows `df_laporan_bulanan` (see `simpan_rekap_bulanan(..., refresh=False)`)."""
+    local_db_connection = _local_rekap_connection()
+    with local_db_connection.cursor() as cursor:
+        _refresh_partitions(cursor, df_laporan_bulanan)
+        local_db_connection.commit()
+    local_db_connection.close()
+
+    from .cube import refresh_cubes
+
+    refresh_cubes(df_laporan_bulanan)
+
+
+def _refresh_partitions(cursor, df_laporan_bulanan: pd.DataFrame) -> None:
+    """Bump rekap_versi and rebuild the TK running totals and rollup of the written rows, on `cursor`'s transaction."""
+    versi_query = """
+    INSERT INTO rekap_versi (tahun, bulan, instansi_id, versi, updated_at)
+    VALUES (%s, %s, %s, 1, %s)
+    ON DUPLICATE KEY UPDATE
+        versi=versi + 1,
+        updated_at=VALUES(updated_at)
+    """
+
+    # bump the rekap_versi counter of every written partition in the same
+    # transaction, so cached ETags of /rekap_kehadiran are invalidated
+    partitions = df_laporan_bulanan[['tahun', 'bulan', 'instansi_id']].drop_duplicates()
+    updated_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    for tahun, bulan, instansi_id in partitions.itertuples(index=False):
+        cursor.execute(versi_query, (int(tahun), int(bulan), int(instansi_id), updated_at))
+
+    # rebuild the cumulative TK rows of the written karyawan-years (app/kumulatif.py)
+    _refresh_tk_kumulatif(cursor, df_laporan_bulanan)
+    # and the instansi month/quarter/year totals of the written partitions (app/rollup.py)
+    from .rollup import refresh_rekap_rollup_cursor
+
+    refresh_rekap_rollup_cursor(cursor, partitions.itertuples(index=False))
+
+
+def _refresh_tk_kumulatif(cursor, df_laporan_bulanan: pd.DataFrame, batch_size: int = 1000) -> None:
+    """MySQL counterpart of `kumulatif.refresh_tk_kumulatif` on a pymysql cursor."""
+    from .kumulatif import KUMULATIF_COLUMNS, kumulatif_frame, mark_tk_kumulatif_coverage_cursor
+
+    kolom = ", ".join(KUMULATIF_COLUMNS)
+    insert_query = f"INSERT INTO rekap_tk_kumulatif ({kolom}) VALUES ({', '.join(['%s'] * len(KUMULATIF_COLUMNS))})"
+    keys = df_laporan_bulanan[['karyawan_id', 'tahun']].drop_duplicates()
+    for tahun, group in keys.groupby('tahun'):
+        karyawan_ids = [int(k) for k in group['karyawan_id']]
+        for start in range(0, len(karyawan_ids), batch_size):
+            batch = karyawan_ids[start:start + batch_size]
+            markers = ", ".join(['%s'] * len(batch))
+            cursor.execute(
+                f"SELECT karyawan_id, tahun, bulan, instansi_id, tanpa_keterangan FROM rekap_bulanan WHERE tahun = %s AND karyawan_id IN ({markers})",
+                [int(tahun), *batch],
+            )
+            rows = pd.DataFrame(list(cursor.fetchall()), columns=['karyawan_id', 'tahun', 'bulan', 'instansi_id', 'tanpa_keterangan'])
+            cursor.execute(f"DELETE FROM rekap_tk_kumulatif WHERE tahun = %s AND karyawan_id IN ({markers})", [int(tahun), *batch])
+            frame = kumulatif_frame(rows)
+            if not frame.empty:
+                cursor.executemany(insert_query, [tuple(int(v) for v in row) for row in frame.itertuples(index=False)])
+    mark_tk_kumulatif_coverage_cursor(cursor, keys['tahun'].unique())
\ No newline at end of file
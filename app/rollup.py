@@ -0,0 +1,176 @@
+"""Precomputed instansi totals of `rekap_bulanan` at month, quarter and year grain.
+
+Dashboards ask for per-instansi totals and attendance rates over a period.
+The `rekap_rollup` table holds them ahead of time at three grains,
+distinguished by the `grain` column:
+
+- `bulan`: one row per instansi and month (`periode` 1-12), summed from
+  `rekap_bulanan`,
+- `kuartal`: one row per instansi and quarter (`periode` 1-4), summed from the
+  month rows,
+- `tahun`: one row per instansi and year (`periode` 0), summed from the month
+  rows.
+
+`jumlah_karyawan` is the number of karyawan with a rekap in the month; the
+quarter and year rows keep the largest monthly count. Writers refresh the
+rows of every (tahun, bulan, instansi_id) partition they touch in the same
+transaction (`simpan_rekap_bulanan`, `refresh_rekap_rollup`). A refresh
+aggregates that one partition, then re-sums at most 12 month rows for the
+quarter and the year.
+
+`rollup_select` answers a month range from the coarsest grain that covers it
+exactly: the year row for January-December, quarter rows for ranges on
+quarter boundaries, and month rows otherwise.
+"""
+from __future__ import annotations
+
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import Select
+
+from . import models
+from .bulkload import placeholders
+
+MEASURES = (
+    "jumlah_hari", "hadir", "tidak_hadir", "twm", "t1", "t2", "t3", "t4", "twp",
+    "p1", "p2", "p3", "p4", "izin_sakit", "tugas_bk", "tanpa_keterangan",
+)
+# coarsest first
+GRAINS = ("tahun", "kuartal", "bulan")
+
+
+def _kuartal(bulan: int) -> int:
+    return (bulan - 1) // 3 + 1
+
+
+def _refresh_partition(execute: Callable[[str, tuple], None], marker: str, tahun: int, bulan: int, instansi_id: int) -> None:
+    """Recompute the month, quarter and year rows one rekap partition contributes to."""
+    kuartal = _kuartal(bulan)
+    kolom = ", ".join(("grain", "tahun", "periode", "instansi_id", "jumlah_karyawan") + MEASURES)
+    sums = ", ".join(f"SUM({m})" for m in MEASURES)
+    m = marker
+    execute(
+        f"DELETE FROM rekap_rollup WHERE tahun = {m} AND instansi_id = {m} "
+        f"AND ((grain = 'bulan' AND periode = {m}) OR (grain = 'kuartal' AND periode = {m}) OR grain = 'tahun')",
+        (tahun, instansi_id, bulan, kuartal),
+    )
+    execute(
+        f"INSERT INTO rekap_rollup ({kolom}) SELECT 'bulan', tahun, bulan, instansi_id, COUNT(*), {sums} "
+        f"FROM rekap_bulanan WHERE tahun = {m} AND bulan = {m} AND instansi_id = {m} GROUP BY tahun, bulan, instansi_id",
+        (tahun, bulan, instansi_id),
+    )
+    # coarser grains from the (at most 12) month rows of this instansi-year
+    execute(
+        f"INSERT INTO rekap_rollup ({kolom}) SELECT 'kuartal', tahun, {m}, instansi_id, MAX(jumlah_karyawan), {sums} "
+        f"FROM rekap_rollup WHERE grain = 'bulan' AND tahun = {m} AND instansi_id = {m} AND periode BETWEEN {m} AND {m} "
+        "GROUP BY tahun, instansi_id",
+        (kuartal, tahun, instansi_id, 3 * kuartal - 2, 3 * kuartal),
+    )
+    execute(
+        f"INSERT INTO rekap_rollup ({kolom}) SELECT 'tahun', tahun, 0, instansi_id, MAX(jumlah_karyawan), {sums} "
+        f"FROM rekap_rollup WHERE grain = 'bulan' AND tahun = {m} AND instansi_id = {m} GROUP BY tahun, instansi_id",
+        (tahun, instansi_id),
+    )
+
+
+def _partitions(partitions: Iterable[Tuple[int, int, int]]) -> List[Tuple[int, int, int]]:
+    return sorted({(int(t), int(b), int(i)) for t, b, i in partitions})
+
+
+def refresh_rekap_rollup(conn: Connection, partitions: Iterable[Tuple[int, int, int]]) -> int:
+    """Refresh the rollup rows of each (tahun, bulan, instansi_id) partition.
+
+    Call inside the transaction that writes the rekap rows. Dialect-neutral
+    counterpart of the refresh done by `simpan_rekap_bulanan`. Returns the
+    number of partitions refreshed.
+    """
+    parts = _partitions(partitions)
+    for tahun, bulan, instansi_id in parts:
+        _refresh_partition(conn.exec_driver_sql, placeholders(conn, 1), tahun, bulan, instansi_id)
+    return len(parts)
+
+
+def refresh_rekap_rollup_cursor(cursor, partitions: Iterable[Tuple[int, int, int]]) -> int:
+    """`refresh_rekap_rollup` on a DB-API cursor with `%s` parameters (pymysql)."""
+    parts = _partitions(partitions)
+    for tahun, bulan, instansi_id in parts:
+        _refresh_partition(cursor.execute, "%s", tahun, bulan, instansi_id)
+    return len(parts)
+
+
+def rebuild_rekap_rollup(conn: Connection, tahun: Optional[int] = None) -> int:
+    """Backfill the rollups from every rekap partition (optionally one year only)."""
+    rekap = models.RekapKehadiranModel.__table__
+    stmt = select(rekap.c.tahun, rekap.c.bulan, rekap.c.instansi_id).distinct()
+    if tahun is not None:
+        stmt = stmt.where(rekap.c.tahun == tahun)
+    return refresh_rekap_rollup(conn, conn.execute(stmt).all())
+
+
+def plan_rollup(bulan_awal: int = 1, bulan_akhir: int = 12, per: Optional[str] = None) -> Tuple[str, int, int]:
+    """Pick the grain and `periode` range that answer months `bulan_awal..bulan_akhir`.
+
+    Without `per` the coarsest grain whose periods cover the range exactly is
+    used. `per` asks for one row per period of that grain, and the range must
+    then fall on its boundaries.
+    """
+    if not 1 <= bulan_awal <= bulan_akhir <= 12:
+        raise ValueError("Rentang bulan harus 1 <= bulan_awal <= bulan_akhir <= 12.")
+    if per is not None and per not in GRAINS:
+        raise ValueError(f"per harus salah satu dari: {', '.join(GRAINS)}.")
+    whole_year = bulan_awal == 1 and bulan_akhir == 12
+    on_quarters = bulan_awal % 3 == 1 and bulan_akhir % 3 == 0
+    if per == "tahun" and not whole_year:
+        raise ValueError("per=tahun hanya untuk rentang Januari-Desember.")
+    if per == "kuartal" and not on_quarters:
+        raise ValueError("per=kuartal membutuhkan rentang bulan pada batas kuartal.")
+    grain = per or ("tahun" if whole_year else "kuartal" if on_quarters else "bulan")
+    if grain == "tahun":
+        return grain, 0, 0
+    if grain == "kuartal":
+        return grain, _kuartal(bulan_awal), _kuartal(bulan_akhir)
+    return grain, bulan_awal, bulan_akhir
+
+
+def rollup_select(tahun: int, bulan_awal: int = 1, bulan_akhir: int = 12, instansi_id: Optional[int] = None,
+                  per: Optional[str] = None) -> Tuple[str, Select]:
+    """Return the grain used and a select of totals per instansi (and per period with `per`)."""
+    grain, awal, akhir = plan_rollup(bulan_awal, bulan_akhir, per)
+    table = models.RekapRollupModel.__table__
+    keys = [table.c.instansi_id] + ([table.c.periode] if per else [])
+    stmt = (
+        select(*keys, func.max(table.c.jumlah_karyawan).label("jumlah_karyawan"),
+               *[func.sum(table.c[m]).label(m) for m in MEASURES])
+        .where(table.c.grain == grain, table.c.tahun == tahun, table.c.periode.between(awal, akhir))
+        .group_by(*keys)
+        .order_by(*keys)
+    )
+    if instansi_id is not None:
+        stmt = stmt.where(table.c.instansi_id == instansi_id)
+    return grain, stmt
+
+
+def rollup_records(columns: Sequence[str], rows: Iterable[Sequence]) -> List[Dict]:
+    """Rows of `rollup_select` as dicts with integer totals and `tingkat_kehadiran` (hadir / jumlah_hari)."""
+    records = []
+    for row in rows:
+        # MySQL returns SUM() as Decimal
+        record = {name: int(value) if value is not None else None for name, value in zip(columns, row)}
+        hari = record.get("jumlah_hari")
+        record["tingkat_kehadiran"] = round(record["hadir"] / hari, 4) if hari else None
+        records.append(record)
+    return records
+
+
+__all__ = [
+    "MEASURES",
+    "GRAINS",
+    "refresh_rekap_rollup",
+    "refresh_rekap_rollup_cursor",
+    "rebuild_rekap_rollup",
+    "plan_rollup",
+    "rollup_select",
+    "rollup_records",
+]
@@ -0,0 +1,104 @@
+"""Shift schedules compiled once and applied to rencana rows by shift_id.
+
+A rencana row's jadwal timestamps (`masuk_pre_time`, `masuk_post_time`, ...)
+are its `tanggal_masuk` plus a time of day that comes only from its shift.
+Parsing those times per rencana row repeats the same few dozen parses
+thousands of times. `compile_shifts` therefore parses the `presensi_shift`
+table once into a `ShiftTemplates`: the sorted shift ids and one
+[shift, column] array of offsets. `apply_shifts` then maps each rencana row's
+`shift_id` to a row code with one binary search and adds
+`offsets[code, column]` to `tanggal_masuk` as a single vector operation per
+column.
+
+Like the per-row conversion it replaces, a column whose values do not parse
+as durations (e.g. full datetimes) is taken as absolute timestamps instead.
+Rencana rows whose shift is unknown get NaT.
+"""
+from __future__ import annotations
+
+from typing import NamedTuple, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+SHIFT_TIME_COLUMNS = (
+    "masuk_pre_time", "masuk_post_time", "masuk_max_time",
+    "pulang_pre_time", "pulang_post_time", "jam_masuk", "jam_pulang",
+)
+
+
+class ShiftTemplates(NamedTuple):
+    shift_ids: np.ndarray   # (S,) sorted
+    columns: Tuple[str, ...]
+    values: np.ndarray      # (S + 1, C) int64 ns; the last row (code -1) is NaT for unknown shifts
+    is_offset: np.ndarray   # (C,) True: offset from tanggal_masuk, False: absolute timestamp
+
+
+_NAT = np.iinfo(np.int64).min
+
+
+def _compile_column(values: pd.Series) -> Tuple[np.ndarray, bool]:
+    try:
+        parsed = pd.to_timedelta(values)
+        return parsed.to_numpy(dtype="timedelta64[ns]").view(np.int64), True
+    except Exception:
+        parsed = pd.to_datetime(values, errors="coerce")
+        return parsed.to_numpy(dtype="datetime64[ns]").view(np.int64), False
+
+
+def compile_shifts(df_shift: pd.DataFrame, columns: Sequence[str] = SHIFT_TIME_COLUMNS) -> ShiftTemplates:
+    """Parse the time columns of `presensi_shift` (keyed by `id`) once."""
+    df = df_shift.drop_duplicates("id", keep="last").sort_values("id")
+    columns = tuple(c for c in columns if c in df.columns)
+    values = np.full((len(df) + 1, len(columns)), _NAT, dtype=np.int64)
+    is_offset = np.ones(len(columns), dtype=bool)
+    for j, col in enumerate(columns):
+        values[:-1, j], is_offset[j] = _compile_column(df[col])
+    return ShiftTemplates(df["id"].to_numpy(), columns, values, is_offset)
+
+
+def shift_codes(templates: ShiftTemplates, shift_id: pd.Series) -> np.ndarray:
+    """Row of `templates.values` for each shift id; -1 (the NaT row) when unknown."""
+    ids = pd.to_numeric(shift_id, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    known = templates.shift_ids.astype(np.float64)
+    codes = np.searchsorted(known, ids)
+    found = codes < len(known)
+    found[found] = known[codes[found]] == ids[found]
+    return np.where(found, codes, -1)
+
+
+def apply_shifts(templates: ShiftTemplates, shift_id: pd.Series, tanggal_masuk: pd.Series) -> dict:
+    """Jadwal timestamps per column (datetime64[ns] arrays) for rencana rows."""
+    codes = shift_codes(templates, shift_id)
+    base = pd.to_datetime(tanggal_masuk, errors="coerce").to_numpy(dtype="datetime64[ns]")
+    out = {}
+    for j, col in enumerate(templates.columns):
+        values = templates.values[codes, j]
+        if templates.is_offset[j]:
+            # NaT offsets (and NaT tanggal_masuk) propagate through the addition
+            out[col] = base + values.view("timedelta64[ns]")
+        else:
+            out[col] = values.view("datetime64[ns]")
+    return out
+
+
+def merge_rencana_shift(df_rencana: pd.DataFrame, df_shift: pd.DataFrame, how: str = "left") -> pd.DataFrame:
+    """Merge rencana with its shift and fill the jadwal columns from compiled templates.
+
+    `tanggal_masuk` is parsed to datetime. The shift's time columns are not
+    copied through the merge; they are computed from `shift_id` instead.
+    """
+    df_rencana = df_rencana.copy()
+    if "tanggal_masuk" in df_rencana.columns:
+        df_rencana["tanggal_masuk"] = pd.to_datetime(df_rencana["tanggal_masuk"], errors="coerce")
+    if "shift_id" not in df_rencana.columns:
+        return df_rencana
+
+    templates = compile_shifts(df_shift)
+    shift_info = df_shift.drop(columns=list(templates.columns))
+    merged = df_rencana.merge(shift_info, left_on="shift_id", right_on="id", how=how)
+    jadwal = apply_shifts(templates, merged["shift_id"], merged["tanggal_masuk"])
+    return merged.assign(**jadwal)
+
+
+__all__ = ["SHIFT_TIME_COLUMNS", "ShiftTemplates", "compile_shifts", "shift_codes", "apply_shifts", "merge_rencana_shift"]
@@ -0,0 +1,103 @@
+"""Column types of the presensi source tables, applied when they are read.
+
+Every fetch of a presensi table (`run_rekap`'s fetchers, the dimension
+cache, `scripts/run_rekap.py`, the ETL's `fetch_table_chunks`) reads through
+`read_sql_typed` or passes these types to its reader, so a column has the
+same dtype whichever path loaded it and is converted once, at decode time:
+
+- datetime columns are passed to the reader as `parse_dates` with an
+  explicit `ISO8601` format (no per-value format inference) and
+  `errors="coerce"`,
+- id columns become nullable `Int64`, so chunks with and without NULLs agree.
+
+Columns a table does not have are skipped, so `SELECT *` from a source with
+fewer columns still reads. Tables outside `TABLE_SCHEMAS` are read untouched.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple, Union
+
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_integer_dtype
+
+from .readers import get_reader
+
+ISO8601 = "ISO8601"
+
+
+class TableSchema(NamedTuple):
+    datetimes: Dict[str, str]  # column -> to_datetime format
+    integers: Tuple[str, ...] = ()
+
+    @property
+    def columns(self) -> Tuple[str, ...]:
+        return (*self.datetimes, *self.integers)
+
+    def parse_dates(self) -> Dict[str, dict]:
+        """`parse_dates` argument of `pd.read_sql` (missing columns are ignored by pandas)."""
+        return {col: {"format": fmt, "errors": "coerce"} for col, fmt in self.datetimes.items()}
+
+    def cast(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Make the id columns of `df` that exist nullable `Int64` and its datetimes `datetime64[us]` (in place) and return it.
+
+        Both reader backends end up with these dtypes: Arrow timestamps and
+        integers (`timestamp[us][pyarrow]`, `int64[pyarrow]`) are converted too.
+        """
+        for col in self.datetimes:
+            # date objects and all-NULL columns parse to [s], driver datetimes to [us] or [ns]
+            if col in df.columns and is_datetime64_any_dtype(df[col]) and df[col].dtype != "datetime64[us]":
+                df[col] = df[col].astype("datetime64[us]")
+        for col in self.integers:
+            if col in df.columns and str(df[col].dtype) != "Int64":
+                values = df[col] if is_integer_dtype(df[col]) else pd.to_numeric(df[col], errors="coerce")
+                df[col] = values.astype("Int64")
+        return df
+
+
+_IDS = ("id", "karyawan_id", "instansi_id")
+
+TABLE_SCHEMAS: Dict[str, TableSchema] = {
+    "presensi_kehadiran": TableSchema(
+        {"tanggal_masuk": ISO8601, "tanggal_kirim": ISO8601, "created_at": ISO8601, "updated_at": ISO8601},
+        _IDS,
+    ),
+    "presensi_rencana_shift": TableSchema(
+        {"tanggal_masuk": ISO8601, "created_at": ISO8601, "updated_at": ISO8601},
+        (*_IDS, "shift_id"),
+    ),
+    "presensi_absen": TableSchema(
+        {"tanggal_mulai": ISO8601, "tanggal_selesai": ISO8601, "created_at": ISO8601, "updated_at": ISO8601},
+        ("id", "karyawan_id"),
+    ),
+    "presensi_karyawan": TableSchema(
+        {"tanggal_lahir": ISO8601, "created_at": ISO8601, "updated_at": ISO8601, "deleted_at": ISO8601, "verified_date": ISO8601},
+        ("id", "instansi_id", "group_id"),
+    ),
+    # the TIME columns stay as read; app/shifts.py compiles them per shift
+    "presensi_shift": TableSchema({"created_at": ISO8601, "updated_at": ISO8601}, ("id",)),
+}
+
+
+def table_schema(table: str) -> Optional[TableSchema]:
+    return TABLE_SCHEMAS.get(table)
+
+
+def read_sql_typed(sql, con, table: str, params=None, chunksize: Optional[int] = None,
+                   reader: Optional[str] = None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Rows of `table`, read by the configured reader backend and typed by its registered schema.
+
+    `con` is a SQLAlchemy connection or a DB-API (pymysql) connection.
+    `reader` overrides `READER_BACKEND` (see `app/readers.py`). With
+    `chunksize` an iterator of typed chunks is returned.
+    """
+    schema = TABLE_SCHEMAS.get(table)
+    backend = get_reader(reader)
+    if schema is None:
+        return backend.read(sql, con, params=params, chunksize=chunksize)
+    result = backend.read(sql, con, params=params, chunksize=chunksize, parse_dates=schema.parse_dates())
+    if chunksize is None:
+        return schema.cast(result)
+    return (schema.cast(chunk) for chunk in result)
+
+
+__all__ = ["ISO8601", "TableSchema", "TABLE_SCHEMAS", "table_schema", "read_sql_typed"]
@@ -0,0 +1,81 @@
+"""Measure per-row overhead of the `/rekap_kehadiran` read path.
+
+Seeds a throwaway SQLite database with `rekap_bulanan` rows and times the
+old ORM path (query -> model objects -> `from_orm` -> JSON) against the lean
+Core path in `app/fastread.py` (select -> tuples -> JSON).
+
+    python scripts/bench_read_path.py --rows 50000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import fastread, models, schemas
+from app.db import Base
+
+
+def seed(engine, rows: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    metrics = {c: 1 for c in fastread.REKAP_COLUMNS if c not in ("tahun", "bulan", "karyawan_id", "instansi_id")}
+    payload = [
+        dict(metrics, karyawan_id=i // 12, tahun=2025, bulan=i % 12 + 1, instansi_id=i % 40)
+        for i in range(rows)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(models.RekapKehadiranModel.__table__), payload)
+
+
+def orm_path(session) -> bytes:
+    records = session.query(models.RekapKehadiranModel).filter(models.RekapKehadiranModel.tahun == 2025).order_by(
+        models.RekapKehadiranModel.instansi_id, models.RekapKehadiranModel.karyawan_id,
+        models.RekapKehadiranModel.tahun, models.RekapKehadiranModel.bulan,
+    ).all()
+    rekap_list = [schemas.RekapKehadiranResponse.model_validate(r) for r in records]
+    body = schemas.RekapKehadiranListResponse(count=len(rekap_list), data=rekap_list).model_dump(mode="json")
+    return json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def core_path(session) -> bytes:
+    rows = session.execute(fastread.rekap_kehadiran_select(2025)).all()
+    return fastread.encode_list_response(fastread.REKAP_COLUMNS, rows)
+
+
+def timed(fn, session, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        session.expunge_all()
+        start = time.perf_counter()
+        fn(session)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark ORM vs Core read path for rekap_bulanan")
+    p.add_argument("--rows", type=int, default=20000)
+    p.add_argument("--repeat", type=int, default=5)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        seed(engine, args.rows)
+        session = sessionmaker(bind=engine)()
+        try:
+            assert json.loads(orm_path(session)) == json.loads(core_path(session))
+            for name, fn in (("orm+from_orm", orm_path), ("core+tuples", core_path)):
+                elapsed = timed(fn, session, args.repeat)
+                print(f"{name:14s} {elapsed * 1000:9.1f} ms total  {elapsed / args.rows * 1e6:6.2f} us/row")
+        finally:
+            session.close()
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
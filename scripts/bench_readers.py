@@ -0,0 +1,102 @@
+"""Benchmark the SQL reader backends on a seeded `presensi_kehadiran` table.
+
+Seeds a throwaway SQLite database (or `--database-url`, e.g. a local MySQL
+stand-in, with `--seed` to create the table there) and times a typed read
+of the whole table through each backend of `app/readers.py`. The raw driver
+`fetchall()` is timed as the floor no backend can beat. "decode" is the time
+a backend spends above that floor: building columns, parsing dates.
+
+    python scripts/bench_readers.py --rows 500000
+"""
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+from app.readers import ArrowReader, PandasReader
+from app.tabletypes import read_sql_typed, table_schema
+
+SQL = "SELECT * FROM presensi_kehadiran"
+
+
+def seed(engine, rows: int) -> None:
+    rng = np.random.default_rng(0)
+    kirim = pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 365 * 86400, rows), unit="s")
+    pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "karyawan_id": rng.integers(1, 5000, rows),
+        "instansi_id": rng.integers(1, 50, rows),
+        "jenis": rng.choice(["M", "P"], rows),
+        "tanggal_masuk": kirim.strftime("%Y-%m-%d %H:%M:%S"),
+        "tanggal_kirim": kirim.strftime("%Y-%m-%d %H:%M:%S"),
+        "approver_status": rng.choice(["TERIMA", None], rows),
+        "catatan": None,
+        "lat": "3.5952",
+        "long": "98.6722",
+    }).to_sql("presensi_kehadiran", engine, index=False, if_exists="replace", chunksize=50000)
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(engine, rows: int, repeat: int) -> None:
+    parse_dates = table_schema("presensi_kehadiran").parse_dates()
+    with engine.connect() as conn:
+        readers = {
+            "pandas": lambda: read_sql_typed(SQL, conn, "presensi_kehadiran", reader="pandas"),
+            "arrow": lambda: ArrowReader(dtype_backend="pyarrow").read(SQL, conn, parse_dates=parse_dates),
+            "arrow+numpy": lambda: ArrowReader(dtype_backend="numpy").read(SQL, conn, parse_dates=parse_dates),
+        }
+        base = PandasReader().read(SQL, conn, parse_dates=parse_dates)
+        arrow = readers["arrow"]()
+        assert len(base) == len(arrow) == rows
+        assert (base["tanggal_kirim"].to_numpy("datetime64[us]") == arrow["tanggal_kirim"].to_numpy("datetime64[us]")).all()
+
+        floor = timed(lambda: conn.exec_driver_sql(SQL).cursor.fetchall(), repeat)
+        print(f"{'driver fetchall':16s} {floor:7.2f} s")
+        for name, fn in readers.items():
+            elapsed = timed(fn, repeat)
+            print(f"{name:16s} {elapsed:7.2f} s  {rows / elapsed:10,.0f} rows/s  decode {elapsed - floor:6.2f} s")
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--rows", type=int, default=200000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--database-url", default=None, help="default: a temporary SQLite file")
+    p.add_argument("--seed", action="store_true", help="(re)create presensi_kehadiran at --database-url")
+    args = p.parse_args()
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+        if args.seed:
+            seed(engine, args.rows)
+        try:
+            run(engine, args.rows, args.repeat)
+        finally:
+            engine.dispose()
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        seed(engine, args.rows)
+        try:
+            run(engine, args.rows, args.repeat)
+        finally:
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Load test: read latency while heavy rekap jobs occupy the server.
+
+Starts the API in-process with uvicorn against a throwaway SQLite database,
+replaces `run_rekap` with a blocking stand-in that sleeps for
+`--rekap-seconds` (a rekap run is mostly blocking DB/SSH I/O), fires
+`--rekap-jobs` concurrent `/rekap` calls and meanwhile measures the latency
+of `--reads` requests for the same `/rekap_kehadiran` query served two ways:
+
+- the real async handler (async engine, encoding off the event loop), and
+- a sync twin registered by this script at `/_load/rekap_kehadiran_sync`
+  (plain `def` handler on a sync session, served from the threadpool) that
+  runs the same select and encoding.
+
+By default the rekap jobs run in the heavy admission lane, as in production.
+`--shared-threadpool` runs them on the default threadpool instead, which is
+how `/rekap` behaved before the lane existed; the sync twin then queues
+behind them while the async handler keeps answering.
+
+    python scripts/load_test_reads.py --rekap-jobs 60 --reads 200 --shared-threadpool
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{Path(_tmp.name) / 'load.db'}"
+
+import httpx  # noqa: E402
+import pandas as pd  # noqa: E402
+import uvicorn  # noqa: E402
+from fastapi import Response  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from starlette.concurrency import run_in_threadpool  # noqa: E402
+
+import app.main as main_module  # noqa: E402
+from app.admission import AdmissionLane  # noqa: E402
+from app import fastread, models  # noqa: E402
+from app.db import Base, SessionLocal, engine  # noqa: E402
+
+READ_PARAMS = {"tahun": 2025, "bulan": 1, "instansi_id": 1}
+
+
+@main_module.app.get("/_load/rekap_kehadiran_sync")
+def rekap_kehadiran_sync(tahun: int, bulan: int, instansi_id: int):
+    """Sync twin of `/rekap_kehadiran`: same select and encoding, threadpool-served."""
+    db = SessionLocal()
+    try:
+        rows = db.execute(fastread.rekap_kehadiran_select(tahun, bulan, instansi_id=instansi_id)).all()
+    finally:
+        db.close()
+    return Response(content=fastread.encode_list_response(fastread.REKAP_COLUMNS, rows), media_type=fastread.JSON_MEDIA_TYPE)
+
+
+def seed(rows: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    metrics = {c: 1 for c in fastread.REKAP_COLUMNS if c not in ("tahun", "bulan", "karyawan_id", "instansi_id")}
+    with engine.begin() as conn:
+        conn.execute(insert(models.RekapKehadiranModel.__table__), [
+            dict(metrics, karyawan_id=i // 12, tahun=2025, bulan=i % 12 + 1, instansi_id=i % 40) for i in range(rows)
+        ])
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def measure_reads(client: httpx.AsyncClient, path: str, params: dict, reads: int, concurrency: int):
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            start = time.perf_counter()
+            r = await client.get(path, params=params)
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(reads)))
+    return latencies
+
+
+async def run(args, base_url: str):
+    payload = {"instansi": 1, "month": 1, "year": 2025, "remote_url": "stand-in://"}
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=httpx.Limits(max_connections=None)) as client:
+        rekap_jobs = [asyncio.create_task(client.post("/rekap", json=payload)) for _ in range(args.rekap_jobs)]
+        await asyncio.sleep(0.2)  # let the rekap jobs grab their workers
+
+        # same query and response body, only the handler style differs
+        for label, path in (
+            ("async /rekap_kehadiran", "/rekap_kehadiran"),
+            ("sync  /rekap_kehadiran", "/_load/rekap_kehadiran_sync"),
+        ):
+            latencies = await measure_reads(client, path, READ_PARAMS, args.reads, args.read_concurrency)
+            print(f"{label:24s} p50={statistics.median(latencies) * 1000:8.1f} ms  p99={percentile(latencies, 0.99) * 1000:8.1f} ms")
+
+        await asyncio.gather(*rekap_jobs)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Measure read latency while rekap jobs run")
+    p.add_argument("--rekap-jobs", type=int, default=60, help="Concurrent /rekap calls (threadpool default is 40)")
+    p.add_argument("--rekap-seconds", type=float, default=5.0, help="Duration of each stand-in rekap job")
+    p.add_argument("--reads", type=int, default=200)
+    p.add_argument("--read-concurrency", type=int, default=10)
+    p.add_argument("--rows", type=int, default=20000)
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--shared-threadpool", action="store_true",
+                   help="Run rekap jobs on the default threadpool (pre-admission-lane behaviour)")
+    args = p.parse_args()
+
+    seed(args.rows)
+
+    def blocking_rekap(*_args, **_kwargs):
+        time.sleep(args.rekap_seconds)
+        return pd.DataFrame()
+
+    main_module.run_rekap = blocking_rekap
+    if args.shared_threadpool:
+        main_module.heavy_lane = AdmissionLane("heavy", max_concurrent=args.rekap_jobs, max_queue=0)
+        main_module.heavy_lane.run = run_in_threadpool
+
+    server = uvicorn.Server(uvicorn.Config(main_module.app, host="127.0.0.1", port=args.port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    try:
+        asyncio.run(run(args, f"http://127.0.0.1:{args.port}"))
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
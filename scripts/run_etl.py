@@ -10,7 +10,7 @@ import argparse
 import os
 from typing import List
 
-from app.etl import etl_table
+from app.etl import etl_tables
 
 
 def parse_args() -> argparse.Namespace:
@@ -20,6 +20,27 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--local-url", default=os.getenv("DATABASE_URL"), help="Local DB URL (overrides DATABASE_URL env)")
     p.add_argument("--chunksize", type=int, default=10000, help="Chunk size for reading remote DB")
     p.add_argument("--where", default=None, help="Optional SQL WHERE clause to filter rows (no leading WHERE)")
+    p.add_argument("--watermark-column", default=None, help="Monotonic id/timestamp column for incremental ETL (high-water mark kept in local etl_state table)")
+    p.add_argument("--full", action="store_true", help="Reset the high-water mark and replace the local table with a full copy")
+    p.add_argument("--key-column", default="id", help="Primary key column for keyset-paginated, resumable fetching (default: id)")
+    p.add_argument("--no-keyset", action="store_true", help="Fetch with one streaming SELECT instead of keyset pagination")
+    p.add_argument("--max-in-flight", type=int, default=2, help="Chunks queued between fetch/transform/load stages (0 = sequential)")
+    p.add_argument("--no-resume", action="store_true", help="Ignore the checkpoint of an interrupted run and start over")
+    p.add_argument("--jobs", type=int, default=1, help="Tables to ETL concurrently, each with its own connections (default: 1)")
+    p.add_argument("--chunk-budget", type=int, default=None,
+                   help="Max chunks held in memory across all running tables (default: 2 per job, plus 2)")
+    p.add_argument("--dedup", action="store_true", help="Drop rows already seen in earlier chunks of the run (64-bit row hashes)")
+    p.add_argument("--dedup-columns", nargs="+", default=None, help="Hash only these columns for --dedup (default: whole row)")
+    p.add_argument("--dedup-max-memory", type=int, default=None,
+                   help="Max row hashes kept in RAM per table before spilling to disk (8 bytes each; default: no spill)")
+    p.add_argument("--dedup-spill-dir", default=None, help="Directory for dedup spill files (default: system temp dir)")
+    p.add_argument("--diff-keys", nargs="+", default=None,
+                   help="Diff sync on these key columns: write only new/changed rows (for tables edited in place)")
+    p.add_argument("--delete-missing", action="store_true", help="With --diff-keys, delete local rows whose key is gone from the source")
+    p.add_argument("--parquet-root", default=os.getenv("PARQUET_LAKE_ROOT"),
+                   help="Also write loaded rows to a Parquet lake under this directory (partitioned by instansi_id/tahun/bulan)")
+    p.add_argument("--parquet-date-column", default=None, help="Derive tahun/bulan partitions from this date column when the table has none")
+    p.add_argument("--parquet-overwrite", action="store_true", help="Replace the Parquet partitions written by this run instead of adding files")
     return p.parse_args()
 
 
@@ -35,19 +56,40 @@ def main():
         print("No local DB URL provided. Set DATABASE_URL or pass --local-url")
         return
 
+    budget = args.chunk_budget or 2 * max(args.jobs, 1) + 2
+    print(f"ETL {len(args.tables)} table(s) from {remote} -> {local} (chunksize={args.chunksize}, jobs={args.jobs}, chunk budget={budget})")
+    dedup_options = None
+    if args.dedup:
+        dedup_options = {"columns": args.dedup_columns, "max_memory_hashes": args.dedup_max_memory, "spill_dir": args.dedup_spill_dir}
+    parquet_options = None
+    if args.parquet_root:
+        parquet_options = {"root": args.parquet_root, "date_column": args.parquet_date_column,
+                           "mode": "overwrite" if args.parquet_overwrite else "append"}
+    results = etl_tables(args.tables, jobs=args.jobs, chunk_budget=budget,
+                         remote_database_url=remote, local_database_url=local, chunksize=args.chunksize, where=args.where,
+                         watermark_column=args.watermark_column, full=args.full,
+                         key_column=None if args.no_keyset else args.key_column, resume=not args.no_resume,
+                         max_in_flight=args.max_in_flight, dedup_options=dedup_options,
+                         diff_keys=args.diff_keys, delete_missing=args.delete_missing, parquet_options=parquet_options)
+
     total = 0
-    for table in args.tables:
-        print(f"ETL table {table} from {remote} -> {local} (chunksize={args.chunksize})")
-        try:
-            written = etl_table(table, remote_database_url=remote, local_database_url=local, chunksize=args.chunksize, where=args.where)
-        except Exception as exc:
-            print(f"Failed ETL for {table}: {exc}")
+    failed = []
+    for result in results:
+        table = result["table"]
+        if result["error"]:
+            print(f"Failed ETL for {table} after {result['seconds']}s: {result['error']}")
+            failed.append(table)
             continue
-        print(f"Wrote {written} rows to local table {table}")
-        total += written
+        print(f"Wrote {result['rows']} rows to local table {table} in {result['seconds']}s ({result['rows_per_sec']} rows/s)")
+        for stage in ("fetch", "transform", "load", "dedup", "diff", "parquet"):
+            if stage in result["stats"]:
+                print(f"  {stage:9s} {result['stats'][stage]}")
+        total += result["rows"]
 
     print(f"ETL complete. Total rows written: {total}")
-
+    if failed:
+        print(f"Failed tables: {', '.join(failed)}")
+        raise SystemExit(1)
 
 if __name__ == "__main__":
     main()
@@ -27,7 +27,10 @@ from sshtunnel import SSHTunnelForwarder
 import pymysql
 
 from app.presensi import generate_presensi_laporan
+from app.shifts import merge_rencana_shift
+from app.tabletypes import read_sql_typed
 from app.analytics import get_engine
+from app.cdc import diff_sync_frame
 
 
 def fetch_via_ssh(ssh_host: str, ssh_port: int, ssh_user: str, ssh_password: Optional[str], db_host: str, db_port: int, db_user: str, db_password: str, db_name: str, instansi_id: int, tanggal_awal: str, tanggal_akhir: str):
@@ -40,39 +43,39 @@ def fetch_via_ssh(ssh_host: str, ssh_port: int, ssh_user: str, ssh_password: Opt
     ) as tunnel:
         conn = pymysql.connect(host='127.0.0.1', port=10022, user=db_user, password=db_password, db=db_name)
 
-        df_pegawai = pd.read_sql("""
+        df_pegawai = read_sql_typed("""
             SELECT * FROM bkd_presensi.presensi_karyawan
             WHERE instansi_id = %s
-        """, conn, params=[instansi_id])
+        """, conn, "presensi_karyawan", params=[instansi_id])
 
-        df_presensi = pd.read_sql(
+        df_presensi = read_sql_typed(
             """
             SELECT * FROM bkd_presensi.presensi_kehadiran
             WHERE instansi_id = %s AND date(tanggal_masuk) BETWEEN %s AND %s
             """,
-            conn,
+            conn, "presensi_kehadiran",
             params=[instansi_id, tanggal_awal, tanggal_akhir],
         )
 
-        df_rencana = pd.read_sql(
+        df_rencana = read_sql_typed(
             """
             SELECT * FROM bkd_presensi.presensi_rencana_shift
             WHERE instansi_id = %s AND date(tanggal_masuk) BETWEEN %s AND %s
             """,
-            conn,
+            conn, "presensi_rencana_shift",
             params=[instansi_id, tanggal_awal, tanggal_akhir],
         )
 
-        df_shift = pd.read_sql("SELECT * FROM presensi_shift", conn)
+        df_shift = read_sql_typed("SELECT * FROM presensi_shift", conn, "presensi_shift")
 
         # presensi_absen may not have instansi_id column; filter using joined presensi_karyawan
-        df_absen = pd.read_sql(
+        df_absen = read_sql_typed(
             """
             SELECT presensi_absen.* FROM presensi_absen
             LEFT JOIN presensi_karyawan ON presensi_absen.karyawan_id = presensi_karyawan.id
             WHERE presensi_karyawan.instansi_id = %s
             """,
-            conn,
+            conn, "presensi_absen",
             params=[instansi_id],
         )
 
@@ -84,26 +87,26 @@ def fetch_via_ssh(ssh_host: str, ssh_port: int, ssh_user: str, ssh_password: Opt
 def fetch_via_engine(remote_url: str, instansi_id: int, tanggal_awal: str, tanggal_akhir: str):
     engine = get_engine(remote_url)
     with engine.connect() as conn:
-        df_pegawai = pd.read_sql_query("SELECT * FROM bkd_presensi.presensi_karyawan WHERE instansi_id = %s", conn, params=[instansi_id])
+        df_pegawai = read_sql_typed("SELECT * FROM bkd_presensi.presensi_karyawan WHERE instansi_id = %s", conn, "presensi_karyawan", params=[instansi_id])
 
-        df_presensi = pd.read_sql_query(
+        df_presensi = read_sql_typed(
             "SELECT * FROM bkd_presensi.presensi_kehadiran WHERE instansi_id = %s AND date(tanggal_masuk) BETWEEN %s AND %s",
-            conn,
+            conn, "presensi_kehadiran",
             params=[instansi_id, tanggal_awal, tanggal_akhir],
         )
 
-        df_rencana = pd.read_sql_query(
+        df_rencana = read_sql_typed(
             "SELECT * FROM bkd_presensi.presensi_rencana_shift WHERE instansi_id = %s AND date(tanggal_masuk) BETWEEN %s AND %s",
-            conn,
+            conn, "presensi_rencana_shift",
             params=[instansi_id, tanggal_awal, tanggal_akhir],
         )
 
-        df_shift = pd.read_sql_query("SELECT * FROM presensi_shift", conn)
+        df_shift = read_sql_typed("SELECT * FROM presensi_shift", conn, "presensi_shift")
 
         # presensi_absen may not have instansi_id column; filter using joined presensi_karyawan
-        df_absen = pd.read_sql_query(
+        df_absen = read_sql_typed(
             "SELECT presensi_absen.* FROM presensi_absen LEFT JOIN presensi_karyawan ON presensi_absen.karyawan_id = presensi_karyawan.id WHERE presensi_karyawan.instansi_id = %s",
-            conn,
+            conn, "presensi_absen",
             params=[instansi_id],
         )
 
@@ -131,6 +134,7 @@ def main():
     p.add_argument('--out-excel', default=None)
     p.add_argument('--save-raw', action='store_true', help='Save raw fetched tables (presensi_karyawan, presensi_rencana_shift, presensi_kehadiran, presensi_shift, presensi_absen) to local DB')
     p.add_argument('--replace-raw', action='store_true', help='When saving raw tables, replace existing local tables instead of appending')
+    p.add_argument('--diff-raw', action='store_true', help='When saving raw tables, upsert only new or changed rows by id (keeps other months)')
     args = p.parse_args()
 
     # compose tanggal_awal / akhir
@@ -173,35 +177,10 @@ def main():
             return
         df_pegawai, df_rencana, df_presensi, df_shift, df_absen = fetch_via_engine(remote, args.instansi, tanggal_awal_dt.strftime('%Y-%m-%d'), tanggal_akhir_dt.strftime('%Y-%m-%d'))
 
-    # merge rencana + shift similar to notebook
-    df_rencana_shift = df_rencana.merge(df_shift, left_on='shift_id', right_on='id')
-
-    # convert and normalize columns similar to notebook (safe coercions)
-    for col in ['tanggal_masuk']:
-        if col in df_rencana_shift.columns:
-            df_rencana_shift[col] = pd.to_datetime(df_rencana_shift[col])
-
-    # combine date + time columns if present (the notebook used additions)
-    # Attempt to add time offsets if columns exist
-    for time_col in ['masuk_pre_time', 'masuk_post_time', 'masuk_max_time', 'pulang_pre_time', 'pulang_post_time', 'jam_masuk', 'jam_pulang']:
-        if time_col in df_rencana_shift.columns:
-            try:
-                df_rencana_shift[time_col] = df_rencana_shift['tanggal_masuk'] + pd.to_timedelta(df_rencana_shift[time_col])
-            except Exception:
-                # fallback: try direct to_datetime (some columns already have full datetimes)
-                df_rencana_shift[time_col] = pd.to_datetime(df_rencana_shift[time_col], errors='coerce')
-
-    # ensure absences dates are datetimes
-    if 'tanggal_mulai' in df_absen.columns:
-        df_absen['tanggal_mulai'] = pd.to_datetime(df_absen['tanggal_mulai'])
-    if 'tanggal_selesai' in df_absen.columns:
-        df_absen['tanggal_selesai'] = pd.to_datetime(df_absen['tanggal_selesai'])
-
-    # ensure presensi datetimes are parsed
-    if 'tanggal_masuk' in df_presensi.columns:
-        df_presensi['tanggal_masuk'] = pd.to_datetime(df_presensi['tanggal_masuk'])
-    if 'tanggal_kirim' in df_presensi.columns:
-        df_presensi['tanggal_kirim'] = pd.to_datetime(df_presensi['tanggal_kirim'])
+    # merge rencana + shift similar to notebook; jadwal columns come from the compiled shift templates
+    df_rencana_shift = merge_rencana_shift(df_rencana, df_shift, how='inner')
+
+    # tanggal_* columns of presensi and absen were parsed at read time (app/tabletypes.py)
 
     # generate laporan
     df_laporan = generate_presensi_laporan(df_pegawai, df_rencana_shift, df_presensi, df_absen, args.month, args.year, tanggal_awal_dt, tanggal_akhir_dt)
@@ -220,14 +199,23 @@ def main():
 
     # Optionally save raw fetched tables to the local DB
     if args.save_raw:
-        mode = 'replace' if args.replace_raw else 'append'
+        mode = 'diff' if args.diff_raw else 'replace' if args.replace_raw else 'append'
         try:
             print(f"Saving raw tables to local DB (mode={mode})...")
-            df_pegawai.to_sql('presensi_karyawan', local_engine, if_exists=mode, index=False, method='multi')
-            df_rencana.to_sql('presensi_rencana_shift', local_engine, if_exists=mode, index=False, method='multi')
-            df_presensi.to_sql('presensi_kehadiran', local_engine, if_exists=mode, index=False, method='multi')
-            df_shift.to_sql('presensi_shift', local_engine, if_exists=mode, index=False, method='multi')
-            df_absen.to_sql('presensi_absen', local_engine, if_exists=mode, index=False, method='multi')
+            raw_tables = {
+                'presensi_karyawan': df_pegawai,
+                'presensi_rencana_shift': df_rencana,
+                'presensi_kehadiran': df_presensi,
+                'presensi_shift': df_shift,
+                'presensi_absen': df_absen,
+            }
+            if mode == 'diff':
+                with local_engine.begin() as conn:
+                    for name, df_raw in raw_tables.items():
+                        print(f"  {name}: {diff_sync_frame(conn, name, df_raw, ['id'])}")
+            else:
+                for name, df_raw in raw_tables.items():
+                    df_raw.to_sql(name, local_engine, if_exists=mode, index=False, method='multi')
             print('Saved raw tables to local DB')
         except Exception as e:
             print('Failed to save raw tables to local DB:', e)
@@ -0,0 +1,63 @@
+"""Nightly anomaly scan of the local check-ins.
+
+Reads `presensi_kehadiran` from `DATABASE_URL` (or `--database-url`) for the
+given date range, runs the check-in rules of `app.anomali` (`kirim_kembar`,
+`lokasi_mustahil`) and replaces their flags of that range in
+`presensi_anomali`. The on-time rule needs the daily laporan and runs with
+`run_rekap(..., scan_anomali=True)`.
+
+    python scripts/scan_anomali.py --tanggal-awal 2025-01-01 --tanggal-akhir 2025-12-31
+    python scripts/scan_anomali.py            # yesterday
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import sys
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+from app.analytics import get_engine
+from app.anomali import CHECKIN_RULES, scan_anomali, simpan_anomali
+
+CHECKIN_COLUMNS = "karyawan_id, instansi_id, tanggal_kirim, lat, `long`"
+
+
+def main() -> int:
+    kemarin = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--tanggal-awal", default=kemarin)
+    p.add_argument("--tanggal-akhir", default=None, help="defaults to --tanggal-awal")
+    p.add_argument("--instansi", type=int, default=None, help="one instansi only (default: all)")
+    p.add_argument("--max-kecepatan-kmh", type=float, default=120.0)
+    p.add_argument("--min-jarak-km", type=float, default=1.0)
+    p.add_argument("--database-url", default=None, help="defaults to DATABASE_URL")
+    args = p.parse_args()
+    tanggal_akhir = args.tanggal_akhir or args.tanggal_awal
+
+    engine = get_engine(args.database_url)
+    columns = CHECKIN_COLUMNS if engine.dialect.name == "mysql" else CHECKIN_COLUMNS.replace("`", '"')
+    sql = f"SELECT {columns} FROM presensi_kehadiran WHERE date(tanggal_kirim) BETWEEN :awal AND :akhir"
+    params = {"awal": args.tanggal_awal, "akhir": tanggal_akhir}
+    if args.instansi is not None:
+        sql += " AND instansi_id = :instansi"
+        params["instansi"] = args.instansi
+
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        checkins = pd.read_sql(text(sql), conn, params=params, parse_dates=["tanggal_kirim"])
+    flags = scan_anomali(df_presensi=checkins, max_kecepatan_kmh=args.max_kecepatan_kmh, min_jarak_km=args.min_jarak_km)
+    with engine.begin() as conn:
+        written = simpan_anomali(conn, flags, args.tanggal_awal, tanggal_akhir, instansi_id=args.instansi, jenis=CHECKIN_RULES)
+
+    print(f"{len(checkins)} check-in {args.tanggal_awal}..{tanggal_akhir}: {written} anomali "
+          f"({time.perf_counter() - started:.1f} s)")
+    for jenis, count in flags["jenis_anomali"].value_counts().sort_index().items():
+        print(f"  {jenis}: {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
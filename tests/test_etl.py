@@ -0,0 +1,710 @@
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from app.etl import etl_table, get_watermark
+
+
+@pytest.fixture
+def dbs(tmp_path):
+    remote_url = f"sqlite:///{tmp_path / 'remote.db'}"
+    local_url = f"sqlite:///{tmp_path / 'local.db'}"
+    remote = create_engine(remote_url)
+    pd.DataFrame({
+        "id": range(1, 26),
+        "karyawan_id": [i % 5 for i in range(1, 26)],
+        "jenis": ["M", "P"] * 12 + ["M"],
+    }).to_sql("presensi_kehadiran", remote, index=False)
+    yield remote, remote_url, local_url
+    remote.dispose()
+
+
+def _local_ids(local_url):
+    return pd.read_sql("SELECT id FROM presensi_kehadiran ORDER BY id", create_engine(local_url))["id"].tolist()
+
+
+def test_etl_incremental_watermark(dbs):
+    remote, remote_url, local_url = dbs
+
+    written = etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, chunksize=10, watermark_column="id")
+    assert written == 25
+
+    # nothing new: nothing fetched, mark unchanged
+    assert etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, watermark_column="id") == 0
+
+    pd.DataFrame({"id": [26, 27], "karyawan_id": [1, 2], "jenis": ["M", "P"]}).to_sql("presensi_kehadiran", remote, index=False, if_exists="append")
+    assert etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, watermark_column="id") == 2
+    assert _local_ids(local_url) == list(range(1, 28))
+
+    with create_engine(local_url).connect() as conn:
+        assert get_watermark(conn, "presensi_kehadiran") == 27
+
+
+def test_etl_full_resets_watermark(dbs):
+    _, remote_url, local_url = dbs
+    etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, watermark_column="id", where="id <= 10")
+    written = etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, watermark_column="id", full=True)
+    assert written == 25
+    assert _local_ids(local_url) == list(range(1, 26))
+
+
+def test_etl_keyset_resumes_after_interruption(dbs):
+    from app.etl import default_transform, fetch_table_chunks, get_checkpoint
+
+    _, remote_url, local_url = dbs
+    chunks = list(fetch_table_chunks("presensi_kehadiran", chunksize=10, database_url=remote_url, key_column="id"))
+    assert [len(c) for c in chunks] == [10, 10, 5]
+    assert chunks[1]["id"].tolist() == list(range(11, 21))
+
+    calls = {"n": 0}
+
+    def flaky_transform(df):
+        calls["n"] += 1
+        if calls["n"] == 2:
+            raise ConnectionError("link dropped")
+        return default_transform(df)
+
+    with pytest.raises(ConnectionError):
+        etl_table("presensi_kehadiran", flaky_transform, remote_database_url=remote_url, local_database_url=local_url, chunksize=10, key_column="id", watermark_column="id")
+
+    # the first chunk is committed along with its checkpoint
+    assert _local_ids(local_url) == list(range(1, 11))
+    with create_engine(local_url).connect() as conn:
+        assert get_checkpoint(conn, "presensi_kehadiran")["last_key"] == 10
+
+    written = etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, chunksize=10, key_column="id", watermark_column="id")
+    assert written == 25
+    assert _local_ids(local_url) == list(range(1, 26))
+    with create_engine(local_url).connect() as conn:
+        assert get_checkpoint(conn, "presensi_kehadiran") is None
+        assert get_watermark(conn, "presensi_kehadiran") == 25
+
+
+def _interrupt_after_first_chunk(remote_url, local_url, **kwargs):
+    from app.etl import default_transform
+
+    calls = {"n": 0}
+
+    def flaky_transform(df):
+        calls["n"] += 1
+        if calls["n"] == 2:
+            raise ConnectionError("link dropped")
+        return default_transform(df)
+
+    with pytest.raises(ConnectionError):
+        etl_table("presensi_kehadiran", flaky_transform, remote_database_url=remote_url, local_database_url=local_url,
+                  chunksize=10, key_column="id", max_in_flight=0, **kwargs)
+
+
+@pytest.mark.parametrize("options", [{"resume": False}, {"full": True}])
+def test_etl_keyset_restart_discards_interrupted_run(dbs, options):
+    from app.etl import get_checkpoint
+
+    _, remote_url, local_url = dbs
+    _interrupt_after_first_chunk(remote_url, local_url, watermark_column="id")
+    assert _local_ids(local_url) == list(range(1, 11))
+
+    written = etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, chunksize=10,
+                        key_column="id", watermark_column="id", **options)
+    assert written == 25
+    # no duplicates left over from the interrupted run
+    assert _local_ids(local_url) == list(range(1, 26))
+    with create_engine(local_url).connect() as conn:
+        assert get_checkpoint(conn, "presensi_kehadiran") is None
+        assert get_watermark(conn, "presensi_kehadiran") == 25
+
+
+def test_etl_keyset_discard_keeps_rows_of_earlier_runs(dbs):
+    _, remote_url, local_url = dbs
+    assert etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url,
+                     key_column="id", where="jenis = 'P'") == 12
+
+    # the interrupted run loads M rows 1, 3, ..., 19 between the P rows
+    _interrupt_after_first_chunk(remote_url, local_url, where="jenis = 'M'")
+    assert len(_local_ids(local_url)) == 22
+
+    written = etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, chunksize=10,
+                        key_column="id", where="jenis = 'M'", resume=False)
+    assert written == 13
+    assert _local_ids(local_url) == list(range(1, 26))
+
+
+def test_etl_keyset_resume_with_timestamp_watermark(dbs):
+    remote, remote_url, local_url = dbs
+    stamps = pd.DataFrame({"id": range(1, 26), "dibuat": [f"2025-01-{i:02d} 08:00:00" for i in range(1, 26)]})
+    stamps.to_sql("presensi_kehadiran", remote, index=False, if_exists="replace")
+
+    _interrupt_after_first_chunk(remote_url, local_url, watermark_column="dibuat")
+    written = etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, chunksize=10,
+                        key_column="id", watermark_column="dibuat")
+    assert written == 25
+    with create_engine(local_url).connect() as conn:
+        assert get_watermark(conn, "presensi_kehadiran") == pd.Timestamp("2025-01-25 08:00:00")
+
+    pd.DataFrame({"id": [26], "dibuat": ["2025-01-26 08:00:00"]}).to_sql("presensi_kehadiran", remote, index=False, if_exists="append")
+    assert etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, key_column="id", watermark_column="dibuat") == 1
+    assert _local_ids(local_url) == list(range(1, 27))
+
+
+def test_etl_tables_parallel_isolates_failures_and_caps_chunks(dbs):
+    from app.etl import etl_tables
+
+    remote, remote_url, local_url = dbs
+    pd.DataFrame({"id": range(1, 31), "nama": ["x"] * 30}).to_sql("presensi_shift", remote, index=False)
+
+    results = etl_tables(["presensi_kehadiran", "tidak_ada", "presensi_shift"], jobs=3, chunk_budget=2,
+                         remote_database_url=remote_url, local_database_url=local_url, chunksize=4, key_column="id")
+
+    assert [r["table"] for r in results] == ["presensi_kehadiran", "tidak_ada", "presensi_shift"]
+    assert [r["rows"] for r in results] == [25, 0, 30]
+    assert results[0]["error"] is None and results[2]["error"] is None
+    assert results[1]["error"]
+    assert results[0]["stats"]["load"]["chunks"] == 7
+    assert _local_ids(local_url) == list(range(1, 26))
+
+
+@pytest.mark.parametrize("options", [{}, {"diff_keys": ["id"]}])
+def test_etl_tables_parallel_sqlite_target_takes_turns(dbs, monkeypatch, options):
+    import time
+    from app import bulkload
+    from app.etl import default_transform, etl_tables
+
+    remote, remote_url, local_url = dbs
+    pd.DataFrame({"id": range(1, 31), "nama": ["x"] * 30}).to_sql("presensi_shift", remote, index=False)
+    # without the writer lock the second table gives up after 50 ms
+    monkeypatch.setattr(bulkload, "SQLITE_BUSY_TIMEOUT_MS", 50)
+
+    def slow_transform(df):
+        time.sleep(0.05)
+        return default_transform(df)
+
+    results = etl_tables(["presensi_kehadiran", "presensi_shift"], jobs=2, chunk_budget=2, transform=slow_transform,
+                         remote_database_url=remote_url, local_database_url=local_url, chunksize=4, key_column=None, **options)
+
+    assert [r["error"] for r in results] == [None, None]
+    assert [r["rows"] for r in results] == [25, 30]
+    assert _local_ids(local_url) == list(range(1, 26))
+
+
+def test_run_pipeline_budget_bounds_chunks_and_is_returned_on_error():
+    from app.etl import ChunkBudget, run_pipeline
+
+    budget = ChunkBudget(2)
+    seen = []
+
+    def load(df):
+        seen.append(budget.in_use)
+        return len(df)
+
+    run_pipeline(_frames(6), lambda df: df, load, max_in_flight=3, budget=budget)
+    assert max(seen) <= 2 and budget.peak <= 2
+    assert budget.in_use == 0
+
+    def failing_load(df):
+        raise RuntimeError("disk full")
+
+    with pytest.raises(RuntimeError):
+        run_pipeline(_frames(6), lambda df: df, failing_load, max_in_flight=2, budget=budget)
+    assert budget.in_use == 0
+
+
+def test_etl_converters_follow_source_schema(dbs, monkeypatch):
+    from sqlalchemy import text
+    from app import etl
+
+    remote, remote_url, local_url = dbs
+    with remote.begin() as conn:
+        conn.execute(text("CREATE TABLE presensi_karyawan (id INTEGER PRIMARY KEY, alamat VARCHAR(100), jabatan VARCHAR(50), "
+                          "tanggal_lahir DATE, created_at DATETIME, atasan_id INTEGER)"))
+        conn.execute(text("INSERT INTO presensi_karyawan VALUES "
+                          "(1, 'Jl. Mawar 2020-01-01', 'Staf', '1990-05-01', '2025-01-02 08:00:00', NULL), "
+                          "(2, 'Jl. Melati', 'Kepala', '1985-12-31', '2025-01-03 09:30:00', 1)"))
+
+    reflected = []
+    reflect = etl.ConverterPlan.reflect.__func__
+    monkeypatch.setattr(etl.ConverterPlan, "reflect", classmethod(lambda cls, engine, table: reflected.append(table) or reflect(cls, engine, table)))
+    etl.clear_converter_plans()
+
+    chunks = []
+    load = etl.append_chunks_to_table
+
+    def recording_append(chunks_iter, *args, **kwargs):
+        out = list(chunks_iter)
+        chunks.extend(out)
+        return load(iter(out), *args, **kwargs)
+
+    monkeypatch.setattr(etl, "append_chunks_to_table", recording_append)
+    etl_table("presensi_karyawan", remote_database_url=remote_url, local_database_url=local_url, chunksize=1, key_column="id")
+    etl_table("presensi_karyawan", remote_database_url=remote_url, local_database_url=local_url, chunksize=1, key_column="id", full=True)
+
+    # reflected once, reused by the second run
+    assert reflected == ["presensi_karyawan"]
+    assert len(chunks) == 4
+    for chunk in chunks:
+        assert pd.api.types.is_string_dtype(chunk["alamat"]) and pd.api.types.is_string_dtype(chunk["jabatan"])
+        # DATE and DATETIME columns share one resolution in every chunk
+        assert str(chunk["tanggal_lahir"].dtype) == str(chunk["created_at"].dtype) == "datetime64[us]"
+        # same dtype whether the chunk holds NULLs or not
+        assert str(chunk["atasan_id"].dtype) == "Int64"
+    assert chunks[0]["alamat"].iloc[0] == "Jl. Mawar 2020-01-01"
+    assert chunks[1]["created_at"].iloc[0] == pd.Timestamp("2025-01-03 09:30:00")
+    etl.clear_converter_plans()
+
+    # driver DATE objects and DATETIME values converted by a reflected plan
+    import datetime
+    plan = etl.ConverterPlan("t", {"tgl": ("datetime", "%Y-%m-%d"), "jam": ("datetime", "ISO8601")})
+    out = plan.apply(pd.DataFrame({"tgl": [datetime.date(2025, 1, 2)], "jam": [datetime.datetime(2025, 1, 2, 8)]}))
+    assert str(out["tgl"].dtype) == str(out["jam"].dtype) == "datetime64[us]"
+
+
+@pytest.mark.parametrize("max_memory_hashes", [None, 3])
+def test_etl_dedup_across_chunks(dbs, tmp_path, max_memory_hashes):
+    from app.dedup import RowDeduplicator
+
+    _, remote_url, local_url = dbs
+    stats = {}
+    # (karyawan_id, jenis) repeats every 10 ids: re-sent check-ins under new ids
+    with RowDeduplicator(["karyawan_id", "jenis"], max_memory_hashes=max_memory_hashes, spill_dir=str(tmp_path)) as dedup:
+        written = etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, chunksize=4,
+                            key_column="id", dedup=dedup, stats=stats)
+        spilled = list(tmp_path.glob("etl-dedup-*"))
+    assert written == 10
+    assert _local_ids(local_url) == list(range(1, 11))
+    assert stats["dedup"]["rows_in"] == 25
+    assert stats["dedup"]["duplicates_dropped"] == 15
+    assert stats["dedup"]["unique_rows"] == 10
+    assert (stats["dedup"]["spills"] > 0) == (max_memory_hashes is not None)
+    assert bool(spilled) == (max_memory_hashes is not None)
+    # the spill file is removed on close
+    assert not list(tmp_path.glob("etl-dedup-*"))
+
+
+def test_bulk_loader_sqlite_wide_chunk(tmp_path):
+    from app.bulkload import SqliteLoader, batch_rows_for, get_loader
+    from app.etl import append_chunks_to_table
+
+    assert batch_rows_for(10, max_values=1000) == 100
+    assert batch_rows_for(50, max_values=1000) == 20
+    assert batch_rows_for(5000, max_values=1000) == 1
+    assert isinstance(get_loader("sqlite"), SqliteLoader)
+
+    # 4000 x 10 values is past SQLite's bind-parameter limit for a single INSERT
+    df = pd.DataFrame({f"c{i}": range(4000) for i in range(8)})
+    df["waktu"] = pd.to_datetime("2025-01-01 08:00:00") + pd.to_timedelta(df["c0"], unit="s")
+    df["atasan_id"] = pd.array([None if i % 2 else i for i in range(4000)], dtype="Int64")
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'bulk.db'}")
+    assert append_chunks_to_table(iter([df, df.head(10)]), "wide", local_engine=engine, if_exists="replace") == 4010
+    out = pd.read_sql("SELECT * FROM wide", engine)
+    assert len(out) == 4010
+    assert out["waktu"].iloc[1] == "2025-01-01 08:00:01.000000"
+    assert out["atasan_id"].isna().sum() == 2005
+
+
+def test_mysql_tsv_escaping():
+    from app.bulkload import _iter_tsv
+
+    df = pd.DataFrame({
+        "id": pd.array([1, None], dtype="Int64"),
+        "alamat": ["Jl.\tMawar\\2", None],
+        "waktu": pd.to_datetime(["2025-01-01 08:00", None]),
+        "aktif": [True, False],
+    })
+    assert "".join(_iter_tsv(df, 1)) == "1\tJl.\\tMawar\\\\2\t2025-01-01 08:00:00.000000\t1\n\\N\t\\N\t\\N\t0\n"
+
+
+def test_etl_diff_sync_writes_only_changes(dbs):
+    from sqlalchemy import text
+
+    remote, remote_url, local_url = dbs
+    kwargs = dict(remote_database_url=remote_url, local_database_url=local_url, chunksize=10, key_column="id", diff_keys=["id"], delete_missing=True)
+
+    stats = {}
+    assert etl_table("presensi_kehadiran", stats=stats, **kwargs) == 25
+    assert stats["diff"] == {"inserted": 25, "updated": 0, "unchanged": 0, "deleted": 0}
+
+    # nothing changed upstream: nothing written
+    stats = {}
+    assert etl_table("presensi_kehadiran", stats=stats, **kwargs) == 0
+    assert stats["diff"]["unchanged"] == 25
+
+    with remote.begin() as conn:
+        conn.execute(text("UPDATE presensi_kehadiran SET jenis = 'X' WHERE id = 7"))
+        conn.execute(text("DELETE FROM presensi_kehadiran WHERE id = 3"))
+        conn.execute(text("INSERT INTO presensi_kehadiran VALUES (26, 1, 'M')"))
+    stats = {}
+    assert etl_table("presensi_kehadiran", stats=stats, **kwargs) == 2
+    assert stats["diff"] == {"inserted": 1, "updated": 1, "unchanged": 23, "deleted": 1}
+
+    local = pd.read_sql("SELECT * FROM presensi_kehadiran ORDER BY id", create_engine(local_url))
+    assert local["id"].tolist() == [i for i in range(1, 27) if i != 3]
+    assert local.loc[local["id"] == 7, "jenis"].item() == "X"
+
+    with pytest.raises(ValueError):
+        etl_table("presensi_kehadiran", watermark_column="id", **kwargs)
+
+
+def test_diff_sync_adopts_table_loaded_without_hashes(dbs):
+    from app.cdc import diff_sync_frame
+
+    _, remote_url, local_url = dbs
+    etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, key_column="id")
+    frame = pd.read_sql("SELECT * FROM presensi_kehadiran", create_engine(remote_url))
+    with create_engine(local_url).begin() as conn:
+        assert diff_sync_frame(conn, "presensi_kehadiran", frame, ["id"])["inserted"] == 25
+    # rows are replaced, not duplicated
+    assert _local_ids(local_url) == list(range(1, 26))
+
+
+def test_diff_sync_hashes_ignore_dtypes_and_keys_are_indexed(dbs):
+    from sqlalchemy import inspect
+    from app.cdc import DiffSync, row_hashes
+
+    _, _, local_url = dbs
+    parsed = pd.DataFrame({"id": [1, 2], "n": pd.array([5, None], dtype="Int64"),
+                           "t": pd.to_datetime(["2025-01-02 08:00:00", None])})
+    as_read = pd.DataFrame({"id": pd.array([1, 2], dtype="int64[pyarrow]"), "n": [5.0, None],
+                            "t": ["2025-01-02 08:00:00", None]})
+    assert (row_hashes(parsed) == row_hashes(as_read)).all()
+
+    with create_engine(local_url).begin() as conn:
+        sync = DiffSync(conn, "diff_target", ["id"])
+        deleted = []
+        sync._delete_keys = deleted.append
+        # new keys are inserted without a delete per row
+        assert sync.apply(parsed) == 2 and deleted == []
+        assert sync.apply(as_read) == 0
+        assert [ix["column_names"] for ix in inspect(conn).get_indexes("diff_target")] == [["id"]]
+
+
+def test_etl_parquet_sink_publishes_committed_chunks_only(dbs, tmp_path):
+    pytest.importorskip("pyarrow")
+    from app.analytics import read_parquet_lake
+    from app.etl import default_transform
+    from app.lake import ParquetSink
+
+    remote, remote_url, local_url = dbs
+    pd.DataFrame({
+        "id": range(1, 21),
+        "karyawan_id": [i % 4 for i in range(1, 21)],
+        "instansi_id": [100 + i % 2 for i in range(1, 21)],
+        "tanggal_masuk": pd.to_datetime(["2025-01-15"] * 10 + ["2025-02-15"] * 10),
+    }).to_sql("presensi_kehadiran", remote, index=False, if_exists="replace")
+    lake = str(tmp_path / "lake")
+
+    calls = {"n": 0}
+
+    def flaky_transform(df):
+        calls["n"] += 1
+        if calls["n"] == 2:
+            raise ConnectionError("link dropped")
+        return default_transform(df)
+
+    sink = ParquetSink(lake, "presensi_kehadiran", date_column="tanggal_masuk")
+    with pytest.raises(ConnectionError):
+        etl_table("presensi_kehadiran", flaky_transform, remote_database_url=remote_url, local_database_url=local_url,
+                  chunksize=10, key_column="id", max_in_flight=0, parquet_sink=sink)
+    # only the committed first chunk (January) is visible, nothing staged is left behind
+    assert sorted(read_parquet_lake(lake, "presensi_kehadiran")["id"]) == list(range(1, 11))
+    assert not list((tmp_path / "lake").rglob(".*.tmp"))
+
+    stats = {}
+    sink = ParquetSink(lake, "presensi_kehadiran", date_column="tanggal_masuk")
+    etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, chunksize=10, key_column="id",
+              parquet_sink=sink, stats=stats)
+    assert stats["parquet"]["rows"] == 10
+
+    feb = read_parquet_lake(lake, "presensi_kehadiran", instansi_id=101, tahun=2025, bulan=2)
+    assert sorted(feb["id"]) == [11, 13, 15, 17, 19]
+    assert set(feb["bulan"]) == {2}
+    assert len(read_parquet_lake(lake, "presensi_kehadiran", bulan=[1, 2], columns=["id"])) == 20
+
+
+def test_etl_parquet_sink_compacts_keyset_chunks(dbs, tmp_path):
+    pytest.importorskip("pyarrow")
+    from app.analytics import read_parquet_lake
+    from app.lake import ParquetSink
+
+    remote, remote_url, local_url = dbs
+    pd.DataFrame({
+        "id": range(1, 21),
+        "karyawan_id": [20 - i for i in range(1, 21)],
+        "instansi_id": 100,
+        "tanggal_masuk": pd.to_datetime(["2025-01-15"] * 20),
+        "catatan": [None] * 4 + ["ok"] * 16,  # all NULL in the first chunk
+    }).to_sql("presensi_kehadiran", remote, index=False, if_exists="replace")
+    lake = tmp_path / "lake"
+
+    stats = {}
+    sink = ParquetSink(str(lake), "presensi_kehadiran", date_column="tanggal_masuk")
+    etl_table("presensi_kehadiran", remote_database_url=remote_url, local_database_url=local_url, chunksize=4, key_column="id",
+              parquet_sink=sink, stats=stats)
+
+    files = list(lake.rglob("part-*.parquet"))
+    assert len(files) == 1 and not list(lake.rglob(".*.tmp"))
+    assert stats["parquet"]["files"] == 1 and stats["parquet"]["compacted"] == 5
+    out = read_parquet_lake(str(lake), "presensi_kehadiran")
+    assert out["karyawan_id"].tolist() == list(range(0, 20))
+    assert out["catatan"].notna().sum() == 16
+
+
+def test_parquet_sink_overwrite_replaces_partition(tmp_path):
+    pytest.importorskip("pyarrow")
+    from app.analytics import read_parquet_lake
+    from app.lake import write_partitioned
+
+    rekap = pd.DataFrame({"karyawan_id": [2, 1, 3], "instansi_id": [5, 5, 6], "tahun": 2025, "bulan": 1, "TK": [1, 2, 3]})
+    write_partitioned(rekap, str(tmp_path), "rekap_bulanan", mode="overwrite")
+    write_partitioned(rekap.head(2).assign(TK=9), str(tmp_path), "rekap_bulanan", mode="overwrite")
+
+    out = read_parquet_lake(str(tmp_path), "rekap_bulanan").sort_values("karyawan_id")
+    assert out["TK"].tolist() == [9, 9, 3]
+    # rows inside a partition are sorted by karyawan_id for tight row-group statistics
+    assert read_parquet_lake(str(tmp_path), "rekap_bulanan", instansi_id=5)["karyawan_id"].tolist() == [1, 2]
+    assert len(list((tmp_path / "rekap_bulanan" / "instansi_id=5" / "tahun=2025" / "bulan=1").glob("part-*.parquet"))) == 1
+
+
+def _frames(n, rows=3):
+    for i in range(n):
+        yield pd.DataFrame({"id": range(i * rows, (i + 1) * rows)})
+
+
+def test_run_pipeline_counters_and_sequential_mode():
+    from app.etl import run_pipeline
+
+    for max_in_flight in (0, 2):
+        loaded = []
+        stats = run_pipeline(_frames(4), lambda df: df.assign(x=1), lambda df: loaded.append(df) or len(df), max_in_flight=max_in_flight)
+        assert [df["id"].iloc[0] for df in loaded] == [0, 3, 6, 9]
+        assert all("x" in df for df in loaded)
+        for stage in ("fetch", "transform", "load"):
+            assert stats[stage]["chunks"] == 4
+            assert stats[stage]["rows"] == 12
+        assert stats["wall_seconds"] >= 0
+
+
+def test_run_pipeline_overlaps_stages():
+    import time
+    from app.etl import run_pipeline
+
+    def slow_source():
+        for df in _frames(4):
+            time.sleep(0.05)
+            yield df
+
+    def slow_load(df):
+        time.sleep(0.05)
+        return len(df)
+
+    sequential = run_pipeline(slow_source(), lambda df: df, slow_load, max_in_flight=0)["wall_seconds"]
+    pipelined = run_pipeline(slow_source(), lambda df: df, slow_load, max_in_flight=2)["wall_seconds"]
+    # 8 x 50 ms sequentially vs roughly 5 x 50 ms when fetch and load overlap
+    assert pipelined < sequential * 0.8
+
+
+def test_run_pipeline_backpressure_bounds_in_flight():
+    import threading
+    import time
+    from app.etl import run_pipeline
+
+    fetched = []
+    loaded = []
+    lock = threading.Lock()
+    peak = {"value": 0}
+
+    def source():
+        for df in _frames(20):
+            with lock:
+                fetched.append(1)
+                peak["value"] = max(peak["value"], len(fetched) - len(loaded))
+            yield df
+
+    def slow_load(df):
+        time.sleep(0.01)
+        with lock:
+            loaded.append(1)
+        return len(df)
+
+    run_pipeline(source(), lambda df: df, slow_load, max_in_flight=1)
+    # two queues of one chunk, one chunk in each of the three stages
+    assert peak["value"] <= 2 * 1 + 3
+
+
+@pytest.mark.parametrize("stage", ["fetch", "transform", "load"])
+def test_run_pipeline_propagates_stage_errors(stage):
+    import threading
+    from app.etl import run_pipeline
+
+    def source():
+        for i, df in enumerate(_frames(5)):
+            if stage == "fetch" and i == 1:
+                raise ConnectionError("fetch failed")
+            yield df
+
+    def transform(df):
+        if stage == "transform" and df["id"].iloc[0] == 3:
+            raise ValueError("transform failed")
+        return df
+
+    def load(df):
+        if stage == "load" and df["id"].iloc[0] == 3:
+            raise RuntimeError("load failed")
+        return len(df)
+
+    outcome = {}
+
+    def target():
+        try:
+            run_pipeline(source(), transform, load, max_in_flight=2)
+        except Exception as exc:
+            outcome["error"] = exc
+
+    worker = threading.Thread(target=target, daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+    assert not worker.is_alive(), "pipeline deadlocked"
+    assert type(outcome["error"]) is {"fetch": ConnectionError, "transform": ValueError, "load": RuntimeError}[stage]
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".csv.gz", ".csv.zst"])
+def test_export_csv_chunked_single_handle_and_compression(dbs, tmp_path, suffix):
+    from app.analytics import export_csv_chunked, to_csv_chunked
+
+    _, remote_url, _ = dbs
+    path = str(tmp_path / f"kehadiran{suffix}")
+    stats = export_csv_chunked("SELECT * FROM presensi_kehadiran ORDER BY id", path, database_url=remote_url, chunksize=7)
+    assert stats["rows"] == 25 and stats["chunks"] == 4
+    assert stats["compression"] == {".csv": None, ".csv.gz": "gzip", ".csv.zst": "zstd"}[suffix]
+    assert stats["bytes_written"] == (tmp_path / f"kehadiran{suffix}").stat().st_size
+    if stats["compression"] is None:
+        assert stats["bytes_written"] == stats["bytes_raw"]
+
+    df = pd.read_csv(path)
+    assert df["id"].tolist() == list(range(1, 26))
+    assert list(df.columns) == ["id", "karyawan_id", "jenis"]
+    assert [p.name for p in tmp_path.iterdir() if p.name.startswith(".")] == []
+
+    assert to_csv_chunked("SELECT id FROM presensi_kehadiran", path, database_url=remote_url, chunksize=10) == path
+    assert len(pd.read_csv(path)) == 25
+
+
+def test_dimension_cache_serves_unchanged_tables_from_memory(tmp_path):
+    from sqlalchemy import text
+    from app.dimcache import DimensionCache, engine_source, fetch_dimension
+
+    remote = create_engine(f"sqlite:///{tmp_path / 'remote.db'}")
+    pd.DataFrame({"id": [1, 2], "name": ["Pagi", "Siang"], "updated_at": ["2025-01-01", "2025-01-01"]}).to_sql("presensi_shift", remote, index=False)
+    pd.DataFrame({"id": [1, 2, 3], "instansi_id": [10, 10, 20], "updated_at": ["2025-01-01"] * 3}).to_sql("presensi_karyawan", remote, index=False)
+    cache = DimensionCache(max_entries=2)
+    source = engine_source(remote)
+
+    with remote.connect() as conn:
+        assert fetch_dimension(conn, source, "presensi_shift", cache=cache)["name"].tolist() == ["Pagi", "Siang"]
+        assert fetch_dimension(conn, source, "presensi_karyawan", 10, cache=cache)["id"].tolist() == [1, 2]
+        shift = fetch_dimension(conn, source, "presensi_shift", cache=cache)
+        shift["name"] = "diubah"  # callers get a copy
+        assert cache.stats() == {"entries": 2, "hits": 1, "misses": 2, "evictions": 0}
+
+        # an edit moves MAX(updated_at), a delete changes COUNT(*)
+        conn.execute(text("UPDATE presensi_shift SET name = 'Malam', updated_at = '2025-02-01' WHERE id = 2"))
+        assert fetch_dimension(conn, source, "presensi_shift", cache=cache)["name"].tolist() == ["Pagi", "Malam"]
+        conn.execute(text("DELETE FROM presensi_karyawan WHERE id = 2"))
+        assert fetch_dimension(conn, source, "presensi_karyawan", 10, cache=cache)["id"].tolist() == [1]
+        assert cache.stats()["misses"] == 4
+
+        # a third instansi evicts the least recently used entry (the shift table)
+        fetch_dimension(conn, source, "presensi_karyawan", 20, cache=cache)
+        assert cache.stats()["evictions"] == 1
+        fetch_dimension(conn, source, "presensi_shift", cache=cache)
+        assert cache.stats()["misses"] == 6
+
+    # no updated_at column: loaded every time, never cached
+    pd.DataFrame({"id": [1]}).to_sql("presensi_shift", remote, index=False, if_exists="replace")
+    cache.invalidate()
+    with remote.connect() as conn:
+        assert fetch_dimension(conn, source, "presensi_shift", cache=cache)["id"].tolist() == [1]
+    assert cache.stats()["entries"] == 0
+    remote.dispose()
+
+
+def test_registered_tables_are_typed_at_read_time(dbs):
+    from sqlalchemy import text
+    from app.etl import fetch_table_chunks
+    from app.tabletypes import read_sql_typed
+
+    remote, remote_url, _ = dbs
+    with remote.begin() as conn:
+        conn.execute(text("CREATE TABLE presensi_absen (id INTEGER, karyawan_id INTEGER, type TEXT, tanggal_mulai TEXT, tanggal_selesai TEXT)"))
+        conn.execute(text("INSERT INTO presensi_absen VALUES (1, 7, 'C', '2025-01-02', '2025-01-03 00:00:00'), "
+                          "(2, NULL, 'S', 'bukan tanggal', NULL), (3, 8, 'TB', '2025-02-10', '2025-02-11')"))
+
+    with remote.connect() as conn:
+        df = read_sql_typed("SELECT * FROM presensi_absen ORDER BY id", conn, "presensi_absen")
+    assert pd.api.types.is_datetime64_any_dtype(df["tanggal_mulai"]) and pd.api.types.is_datetime64_any_dtype(df["tanggal_selesai"])
+    assert df["tanggal_mulai"].iloc[0] == pd.Timestamp("2025-01-02") and pd.isna(df["tanggal_mulai"].iloc[1])
+    assert str(df["karyawan_id"].dtype) == "Int64" and df["type"].tolist() == ["C", "S", "TB"]
+
+    # every chunk gets the same dtypes, with or without NULLs, on both fetch paths
+    for options in ({}, {"key_column": "id"}):
+        chunks = list(fetch_table_chunks("presensi_absen", chunksize=2, engine=remote, **options))
+        assert [len(c) for c in chunks] == [2, 1]
+        assert {str(c["karyawan_id"].dtype) for c in chunks} == {"Int64"}
+        assert all(pd.api.types.is_datetime64_any_dtype(c["tanggal_selesai"]) for c in chunks)
+    kehadiran = next(fetch_table_chunks("presensi_kehadiran", engine=remote))
+    assert str(kehadiran["karyawan_id"].dtype) == "Int64" and kehadiran["jenis"].tolist()[:2] == ["M", "P"]
+
+
+def test_arrow_reader_matches_pandas_reader(dbs):
+    import sqlite3
+    from sqlalchemy import text
+    from app.analytics import query_to_df, query_to_df_chunks
+    from app.readers import ArrowReader, get_reader
+    from app.tabletypes import read_sql_typed
+
+    remote, remote_url, _ = dbs
+    with remote.begin() as conn:
+        conn.execute(text("CREATE TABLE presensi_absen (id INTEGER, karyawan_id INTEGER, type TEXT, tanggal_mulai TEXT, catatan)"))
+        conn.execute(text("INSERT INTO presensi_absen VALUES (1, 7, 'C', '2025-01-02 07:30:00', 5), "
+                          "(2, NULL, 'S', 'bukan tanggal', 'teks'), (3, 8, NULL, '2025-02-10', NULL)"))
+    sql = "SELECT * FROM presensi_absen ORDER BY id"
+    dates = {"tanggal_mulai": {"format": "ISO8601", "errors": "coerce"}}
+
+    with remote.connect() as conn:
+        expected = get_reader("pandas").read(sql, conn, parse_dates=dates)
+        df = ArrowReader().read(sql, conn, parse_dates=dates)
+        assert str(df["karyawan_id"].dtype) == "int64[pyarrow]" and str(df["type"].dtype).startswith("string")
+        assert df["tanggal_mulai"].tolist()[::2] == expected["tanggal_mulai"].tolist()[::2]
+        assert pd.isna(df["tanggal_mulai"].iloc[1])
+        assert df["catatan"].tolist()[:2] == ["5", "teks"]  # mixed SQLite column read as text
+
+        numpy_df = ArrowReader(dtype_backend="numpy").read(text("SELECT * FROM presensi_absen WHERE id > :id ORDER BY id"), conn, params={"id": 1})
+        assert numpy_df["id"].tolist() == [2, 3] and numpy_df["karyawan_id"].isna().tolist() == [True, False]
+
+        empty = ArrowReader().read("SELECT id, type FROM presensi_absen WHERE id < 0", conn)
+        assert list(empty.columns) == ["id", "type"] and empty.empty
+
+        # all-NULL columns read as object columns of None, as with pandas; registered ones keep their type
+        nulls = ArrowReader().read("SELECT id, NULL AS status, NULL AS tanggal_mulai FROM presensi_absen ORDER BY id", conn, parse_dates=dates)
+        assert nulls["status"].dtype == object and nulls["status"].isin([None, "TERIMA"]).all()
+        assert str(nulls["tanggal_mulai"].dtype) == "timestamp[us][pyarrow]"
+
+        # read_sql_query's options are honoured
+        indexed = ArrowReader().read(sql, conn, index_col="id", dtype={"karyawan_id": "Int64"})
+        assert indexed.index.tolist() == [1, 2, 3] and str(indexed["karyawan_id"].dtype) == "Int64"
+        with pytest.raises(TypeError):
+            ArrowReader().read(sql, conn, no_such_option=True)
+
+        # registered tables get the same dtypes from either backend
+        typed = read_sql_typed(sql, conn, "presensi_absen", reader="arrow")
+        assert str(typed["karyawan_id"].dtype) == "Int64" and str(typed["tanggal_mulai"].dtype) == "datetime64[us]"
+
+    # raw DB-API connections (as used over the SSH tunnel) work as well
+    raw = sqlite3.connect(remote_url.removeprefix("sqlite:///"))
+    try:
+        assert ArrowReader().read("SELECT id FROM presensi_absen WHERE karyawan_id = ?", raw, params=(8,))["id"].tolist() == [3]
+    finally:
+        raw.close()
+
+    chunks = list(query_to_df_chunks("SELECT * FROM presensi_kehadiran ORDER BY id", engine=remote, chunksize=10, reader="arrow"))
+    assert [len(c) for c in chunks] == [10, 10, 5]
+    assert pd.concat(chunks)["id"].tolist() == query_to_df("SELECT id FROM presensi_kehadiran ORDER BY id", engine=remote)["id"].tolist()
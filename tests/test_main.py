@@ -43,3 +43,460 @@ async def test_create_duplicate_item():
         assert r.status_code == 201
         r_dup = await ac.post("/items", json=item)
         assert r_dup.status_code == 400
+
+def _seed_rekap_and_karyawan():
+    from datetime import date, datetime
+    from app.db import SessionLocal
+    from app import models
+
+    db = SessionLocal()
+    try:
+        db.add_all([
+            models.RekapKehadiranModel(
+                karyawan_id=k, tahun=2025, bulan=b, instansi_id=100 + (k % 2), jumlah_hari=22, hadir=20,
+                tidak_hadir=2, twm=18, t1=1, t2=1, t3=0, t4=0, twp=19, p1=1, p2=0, p3=0, p4=0,
+                izin_sakit=1, tugas_bk=0, tanpa_keterangan=1,
+            )
+            for k in (1, 2, 3) for b in (1, 2)
+        ])
+        db.add(models.PresensIKaryawanModel(
+            id=1, nip="1985", name="Ána", group_id=1, instansi_id=100,
+            created_at=datetime(2024, 5, 1, 7, 30, 15, 250000), tanggal_lahir=date(1985, 2, 3),
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+@pytest.mark.asyncio
+async def test_rekap_kehadiran_matches_schema_serialization():
+    from app import models, schemas
+    from app.db import SessionLocal
+
+    _seed_rekap_and_karyawan()
+    db = SessionLocal()
+    try:
+        records = db.query(models.RekapKehadiranModel).filter(models.RekapKehadiranModel.tahun == 2025).order_by(
+            models.RekapKehadiranModel.instansi_id, models.RekapKehadiranModel.karyawan_id,
+            models.RekapKehadiranModel.tahun, models.RekapKehadiranModel.bulan,
+        ).all()
+        expected = schemas.RekapKehadiranListResponse(count=len(records), data=records).model_dump(mode="json")
+    finally:
+        db.close()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.get("/rekap_kehadiran", params={"tahun": 2025})
+        r_empty = await ac.get("/rekap_kehadiran", params={"tahun": 1999})
+    assert r.status_code == 200
+    assert r.json() == expected
+    assert list(r.json()["data"][0]) == list(schemas.RekapKehadiranResponse.model_fields)
+    assert r_empty.json() == {"count": 0, "data": []}
+
+
+@pytest.mark.asyncio
+async def test_data_karyawan_matches_schema_serialization():
+    from app import models, schemas
+    from app.db import SessionLocal
+
+    _seed_rekap_and_karyawan()
+    db = SessionLocal()
+    try:
+        records = db.query(models.PresensIKaryawanModel).all()
+        expected = schemas.PresensiKaryawanListResponse(count=len(records), data=records).model_dump(mode="json")
+    finally:
+        db.close()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.get("/data_karyawan", params={"instansi_id": 100})
+    assert r.status_code == 200
+    assert r.json() == expected
+
+
+@pytest.mark.asyncio
+async def test_rekap_kehadiran_arrow_and_parquet():
+    import io
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    _seed_rekap_and_karyawan()
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r_json = await ac.get("/rekap_kehadiran", params={"tahun": 2025})
+        r_arrow = await ac.get("/rekap_kehadiran", params={"tahun": 2025}, headers={"Accept": "application/vnd.apache.arrow.stream"})
+        r_parquet = await ac.get("/rekap_kehadiran", params={"tahun": 2025}, headers={"Accept": "application/vnd.apache.parquet"})
+        r_arrow_file = await ac.get("/rekap_kehadiran", params={"tahun": 2025}, headers={"Accept": "application/vnd.apache.arrow.file"})
+
+    assert r_arrow.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    arrow_table = pa.ipc.open_stream(r_arrow.content).read_all()
+    assert arrow_table.to_pylist() == r_json.json()["data"]
+
+    assert r_arrow_file.headers["content-type"] == "application/vnd.apache.arrow.file"
+    assert pa.ipc.open_file(r_arrow_file.content).read_all().to_pylist() == r_json.json()["data"]
+
+    assert r_parquet.headers["content-type"] == "application/vnd.apache.parquet"
+    parquet_table = pq.read_table(io.BytesIO(r_parquet.content))
+    assert parquet_table.to_pylist() == r_json.json()["data"]
+
+
+@pytest.mark.parametrize("accept, fmt", [
+    (None, "json"),
+    ("*/*", "json"),
+    ("application/vnd.apache.parquet", "parquet"),
+    ("application/json, application/vnd.apache.arrow.stream", "json"),
+    ("application/json;q=0.5, application/vnd.apache.arrow.stream", "arrow"),
+    ("application/vnd.apache.parquet;q=0.2, application/vnd.apache.arrow.file;q=0.9", "arrow_file"),
+    ("application/vnd.apache.arrow.stream;q=0, text/html", "json"),
+])
+def test_negotiate_format_honours_q_values(accept, fmt):
+    from app.fastread import negotiate_format
+
+    assert negotiate_format(accept) == fmt
+
+
+@pytest.mark.asyncio
+async def test_analisis_kehadiran_async():
+    _seed_rekap_and_karyawan()
+    payload = {"year": 2025, "month": 3, "minimum_tk": 1}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.post("/analisis_kehadiran", json=payload)
+    assert r.status_code == 200
+    body = r.json()
+    # three employees with tanpa_keterangan=1 in January and February
+    assert body["count"] == 3
+    assert body["data"][0] == {"karyawan_id": 1, "nip": "1985", "nama_pegawai": "Ána", "tahun": 2025, "TK": 2}
+
+
+@pytest.mark.asyncio
+async def test_analisis_kehadiran_uses_materialized_running_totals():
+    from sqlalchemy import delete, update
+    from app import models
+    from app.kumulatif import rebuild_tk_kumulatif, refresh_tk_kumulatif
+
+    _seed_rekap_and_karyawan()
+    rekap = models.RekapKehadiranModel.__table__
+    with engine.begin() as conn:
+        assert rebuild_tk_kumulatif(conn) == 3 * 12
+        conn.execute(update(rekap).where(rekap.c.karyawan_id == 2, rekap.c.bulan == 2).values(tanpa_keterangan=5))
+        assert refresh_tk_kumulatif(conn, [(2, 2025)]) == 12
+        # answered from rekap_tk_kumulatif alone
+        conn.execute(delete(rekap))
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.post("/analisis_kehadiran", json={"year": 2025, "month": 3, "minimum_tk": 2})
+        r_dec = await ac.post("/analisis_kehadiran", json={"year": 2025, "month": 12, "minimum_tk": 0})
+        r_jan = await ac.post("/analisis_kehadiran", json={"year": 2025, "month": 1, "minimum_tk": 0})
+
+    assert r.json() == {"count": 1, "data": [{"karyawan_id": 2, "nip": None, "nama_pegawai": None, "tahun": 2025, "TK": 6}]}
+    assert [row["TK"] for row in r_dec.json()["data"]] == [2, 6, 2]
+    assert r_jan.json()["count"] == 0
+
+
+@pytest.mark.asyncio
+async def test_analisis_kehadiran_partial_running_totals_fall_back():
+    from sqlalchemy import select
+    from app import models
+    from app.kumulatif import refresh_tk_kumulatif
+
+    _seed_rekap_and_karyawan()
+    marker = models.RekapTkKumulatifTahunModel.__table__
+    with engine.begin() as conn:
+        # only the karyawan of instansi 101 (k=1, 3) written since the deploy
+        refresh_tk_kumulatif(conn, [(1, 2025), (3, 2025)])
+        assert conn.execute(select(marker.c.tahun)).all() == []
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.post("/analisis_kehadiran", json={"year": 2025, "month": 3, "minimum_tk": 1})
+    # karyawan 2 has no running totals yet and is still reported
+    assert [row["karyawan_id"] for row in r.json()["data"]] == [1, 2, 3]
+
+    with engine.begin() as conn:
+        refresh_tk_kumulatif(conn, [(2, 2025)])
+        assert conn.execute(select(marker.c.tahun)).scalars().all() == [2025]
+
+
+@pytest.mark.asyncio
+async def test_rekap_rollup_picks_coarsest_grain_and_refreshes():
+    from sqlalchemy import update
+    from app import models
+    from app.rollup import plan_rollup, rebuild_rekap_rollup, refresh_rekap_rollup
+
+    assert plan_rollup(1, 12) == ("tahun", 0, 0)
+    assert plan_rollup(4, 9) == ("kuartal", 2, 3)
+    assert plan_rollup(2, 3) == ("bulan", 2, 3)
+    assert plan_rollup(1, 12, per="bulan") == ("bulan", 1, 12)
+
+    _seed_rekap_and_karyawan()
+    rekap = models.RekapKehadiranModel.__table__
+    with engine.begin() as conn:
+        assert rebuild_rekap_rollup(conn) == 4
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r_year = await ac.get("/rekap_rollup", params={"tahun": 2025})
+        r_month = await ac.get("/rekap_rollup", params={"tahun": 2025, "bulan_awal": 2, "bulan_akhir": 2, "instansi_id": 101})
+        r_bad = await ac.get("/rekap_rollup", params={"tahun": 2025, "bulan_awal": 2, "per": "kuartal"})
+
+        # karyawan 1 and 3 are in instansi 101, karyawan 2 in instansi 100
+        assert r_year.json()["grain"] == "tahun"
+        year_101 = r_year.json()["data"][1]
+        assert (year_101["instansi_id"], year_101["jumlah_karyawan"], year_101["hadir"], year_101["jumlah_hari"]) == (101, 2, 80, 88)
+        assert year_101["tingkat_kehadiran"] == round(80 / 88, 4)
+        assert r_month.json()["grain"] == "bulan" and r_month.json()["data"][0]["hadir"] == 40
+        assert r_bad.status_code == 400
+
+        with engine.begin() as conn:
+            conn.execute(update(rekap).where(rekap.c.karyawan_id == 1, rekap.c.bulan == 2).values(hadir=10))
+            refresh_rekap_rollup(conn, [(2025, 2, 101)])
+        r_quarter = await ac.get("/rekap_rollup", params={"tahun": 2025, "bulan_akhir": 3, "per": "kuartal", "instansi_id": 101})
+        r_year = await ac.get("/rekap_rollup", params={"tahun": 2025, "instansi_id": 101})
+
+    assert r_quarter.json()["grain"] == "kuartal"
+    assert [(row["periode"], row["hadir"]) for row in r_quarter.json()["data"]] == [(1, 70)]
+    assert r_year.json()["data"][0]["hadir"] == 70
+
+
+def test_attendance_cube_queries_and_refresh_on_write():
+    import pandas as pd
+    from app.cube import clear_cubes, get_cube, refresh_cubes
+
+    _seed_rekap_and_karyawan()
+    clear_cubes()
+    try:
+        cube = get_cube(2025, engine)
+        assert cube.stats()["karyawan"] == 3 and cube.stats()["rows"] == 6
+        assert cube.value(1, 2, "hadir") == 20 and cube.value(1, 3, "hadir") is None
+        assert cube.threshold("tanpa_keterangan", 1) == [{"karyawan_id": k, "nilai": 2} for k in (1, 2, 3)]
+        assert cube.trend("hadir", instansi_id=101)[:3] == [40, 40, 0]
+
+        # a write for karyawan 2 (existing) and 4 (new) lands in the loaded cube
+        written = pd.DataFrame([
+            dict(karyawan_id=k, instansi_id=100, tahun=2025, bulan=3, jumlah_hari=22, hadir=h, tidak_hadir=22 - h, twm=0,
+                 t1=0, t2=0, t3=0, t4=t4, twp=0, p1=0, p2=0, p3=0, p4=0, izin_sakit=0, tugas_bk=0, tanpa_keterangan=tk)
+            for k, h, t4, tk in ((2, 15, 4, 3), (4, 21, 0, 0))
+        ])
+        refresh_cubes(written)
+        assert get_cube(2025) is cube
+        assert cube.stats()["karyawan"] == 4
+        assert cube.top_n("tanpa_keterangan", 2) == [{"karyawan_id": 2, "nilai": 5}, {"karyawan_id": 1, "nilai": 2}]
+        assert cube.spikes("t4", 3, min_increase=3) == [{"karyawan_id": 2, "perubahan": 4}]
+        assert cube.month_over_month("hadir", 2, instansi_id=100) == [{"karyawan_id": 2, "perubahan": 0}]
+        assert cube.percentile("hadir", 50, bulan=3) == 18.0
+        assert cube.threshold("hadir", 0, bulan=3, instansi_id=999) == []
+
+        # out-of-range months and n are rejected instead of wrapping around the month axis
+        for bad in (0, 13):
+            with pytest.raises(ValueError, match="Bulan harus antara 1 dan 12"):
+                cube.value(1, bad, "hadir")
+            with pytest.raises(ValueError, match="Bulan harus antara 1 dan 12"):
+                cube.top_n("hadir", 2, bulan=bad)
+        with pytest.raises(ValueError, match="Bulan harus antara 2 dan 12"):
+            cube.month_over_month("hadir", 1)
+        for bad in (0, -1):
+            with pytest.raises(ValueError, match="n harus minimal 1"):
+                cube.top_n("hadir", bad)
+    finally:
+        clear_cubes()
+
+
+def test_scan_anomali_rules_and_simpan():
+    import pandas as pd
+    from sqlalchemy import select
+    from app.anomali import CHECKIN_RULES, scan_anomali, simpan_anomali
+    from app.models import PresensiAnomaliModel
+
+    ts = pd.Timestamp("2025-03-03 07:15:00")
+    checkins = pd.DataFrame({
+        "karyawan_id": [1, 2, 3, 4, 4, 5],
+        "instansi_id": [100, 100, 200, 100, 100, 100],
+        "tanggal_kirim": [ts, ts, ts, ts + pd.Timedelta(hours=1), ts + pd.Timedelta(hours=1, minutes=5), ts],
+        "lat": ["3.5952", "3.5952", "3.5952", "3.5952", "2.9600", None],
+        "long": ["98.6722", "98.6722", "98.6722", "98.6722", "99.0600", None],
+    })
+    days = pd.date_range("2025-03-03", periods=12, freq="D")
+    laporan = pd.DataFrame({
+        "karyawan_id": [7] * 12 + [8] * 12,
+        "instansi_id": 100,
+        "jadwal_masuk": list(days + pd.Timedelta(hours=7, minutes=30)) * 2,
+        "jam_masuk": list(days + pd.Timedelta(hours=7, minutes=29, seconds=30))
+                     + list(days + pd.Timedelta(hours=7, minutes=10)),
+    })
+
+    flags = scan_anomali(laporan, checkins)
+    found = {(j, k) for j, k in zip(flags["jenis_anomali"], flags["karyawan_id"])}
+    # karyawan 3 shares the timestamp but in another instansi
+    assert found == {("kirim_kembar", 1), ("kirim_kembar", 2), ("kirim_kembar", 5),
+                     ("lokasi_mustahil", 4), ("selalu_tepat_waktu", 7)}
+    assert flags.loc[flags["jenis_anomali"] == "kirim_kembar", "nilai"].tolist() == [3.0, 3.0, 3.0]
+
+    table = PresensiAnomaliModel.__table__
+    with engine.begin() as conn:
+        assert simpan_anomali(conn, flags, "2025-03-01", "2025-03-31") == 5
+        # a check-in-only rescan keeps the on-time flag
+        assert simpan_anomali(conn, flags.iloc[:0], "2025-03-01", "2025-03-31", jenis=CHECKIN_RULES) == 0
+        rows = conn.execute(select(table.c.jenis_anomali, table.c.karyawan_id)).all()
+    assert rows == [("selalu_tepat_waktu", 7)]
+
+
+def test_endpoint_queries_use_indexes():
+    from app.queryplan import check_query_plans
+
+    with engine.connect() as conn:
+        report = check_query_plans(conn)
+    scans = {name: result["plan"] for name, result in report.items() if not result["ok"]}
+    assert scans == {}
+
+
+def test_rekap_indexes_migration_upgrade_and_downgrade(tmp_path, monkeypatch):
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import create_engine, inspect
+    from app import models
+
+    url = f"sqlite:///{tmp_path / 'migrate.db'}"
+    bare = create_engine(url)
+    # rekap_bulanan as init_db() created it before the indexes existed
+    table = models.RekapKehadiranModel.__table__
+    table.create(bare)
+    for index in table.indexes:
+        index.drop(bare)
+    monkeypatch.setenv("DATABASE_URL", url)
+    config = Config("alembic.ini")
+
+    command.upgrade(config, "head")
+    names = {ix["name"] for ix in inspect(bare).get_indexes("rekap_bulanan")}
+    assert {"ix_rekap_bulanan_periode_instansi", "ix_rekap_bulanan_tahun_instansi", "ix_rekap_bulanan_tahun_karyawan_tk"} <= names
+
+    assert inspect(bare).has_table("rekap_tk_kumulatif_tahun")
+
+    command.downgrade(config, "d1f9a7c34b2e")
+    assert [ix["name"] for ix in inspect(bare).get_indexes("rekap_bulanan")] == []
+    assert not inspect(bare).has_table("rekap_tk_kumulatif_tahun")
+    bare.dispose()
+
+
+@pytest.mark.asyncio
+async def test_heavy_lane_rejects_when_queue_full(monkeypatch):
+    import asyncio
+    import threading
+    import pandas as pd
+    import app.main as main_module
+    from app.admission import AdmissionLane
+
+    release = threading.Event()
+
+    def blocking_rekap(*args, **kwargs):
+        release.wait(5)
+        return pd.DataFrame([{"karyawan_id": 1}])
+
+    lane = AdmissionLane("heavy", max_concurrent=1, max_queue=0, retry_after=7)
+    monkeypatch.setattr(main_module, "heavy_lane", lane)
+    monkeypatch.setattr(main_module, "run_rekap", blocking_rekap)
+
+    payload = {"instansi": 1, "month": 1, "year": 2025, "remote_url": "sqlite://"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        first = asyncio.create_task(ac.post("/rekap", json=payload))
+        while lane.active == 0:
+            await asyncio.sleep(0.01)
+
+        rejected = await ac.post("/rekap", json=payload)
+        # cheap endpoints are unaffected while the heavy lane is busy
+        root = await ac.get("/")
+
+        release.set()
+        r = await first
+
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "7"
+    assert root.status_code == 200
+    assert r.status_code == 200
+    assert r.json() == {"count": 1, "data": [{"karyawan_id": 1}]}
+    assert lane.stats()["rejected"] == 1
+    lane.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_heavy_lane_encodes_off_event_loop(monkeypatch):
+    import threading
+    import pandas as pd
+    import app.fastread as fastread
+    import app.main as main_module
+    from app.admission import AdmissionLane
+
+    encoded_on = []
+    encode = fastread.encode_records_response
+
+    def recording_encode(df):
+        encoded_on.append(threading.current_thread().name)
+        return encode(df)
+
+    lane = AdmissionLane("heavy", max_concurrent=1)
+    monkeypatch.setattr(main_module, "heavy_lane", lane)
+    monkeypatch.setattr(main_module, "run_rekap", lambda *a, **k: pd.DataFrame({"tanggal": pd.to_datetime(["2025-01-02"]), "menit": [1.5]}))
+    monkeypatch.setattr(fastread, "encode_records_response", recording_encode)
+
+    payload = {"instansi": 1, "month": 1, "year": 2025, "remote_url": "sqlite://"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.post("/rekap", json=payload)
+
+    assert r.status_code == 200
+    assert r.json() == {"count": 1, "data": [{"tanggal": "2025-01-02T00:00:00", "menit": 1.5}]}
+    assert encoded_on and encoded_on[0].startswith("heavy-lane")
+    lane.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_rekap_kehadiran_etag_and_conditional_get():
+    from app.caching import bump_rekap_versi
+
+    _seed_rekap_and_karyawan()
+    with engine.begin() as conn:
+        bump_rekap_versi(conn, [(2025, 1, 100), (2025, 1, 101)])
+
+    params = {"tahun": 2025, "bulan": 1}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.get("/rekap_kehadiran", params=params)
+        etag = r.headers["ETag"]
+        assert r.status_code == 200
+        assert r.headers["Cache-Control"] == "public, max-age=3600"
+        assert "Last-Modified" in r.headers
+
+        r_304 = await ac.get("/rekap_kehadiran", params=params, headers={"If-None-Match": etag})
+        assert r_304.status_code == 304
+        assert r_304.content == b""
+        assert r_304.headers["ETag"] == etag
+
+        # another view of the same partitions gets its own tag
+        r_other = await ac.get("/rekap_kehadiran", params=dict(params, instansi_id=100), headers={"If-None-Match": etag})
+        assert r_other.status_code == 200
+
+        with engine.begin() as conn:
+            bump_rekap_versi(conn, [(2025, 1, 101)])
+        r_changed = await ac.get("/rekap_kehadiran", params=params, headers={"If-None-Match": etag})
+        assert r_changed.status_code == 200
+        assert r_changed.headers["ETag"] != etag
+        assert r_changed.json()["count"] == 3
+
+
+@pytest.mark.asyncio
+async def test_rekap_kehadiran_without_versions_is_not_cached():
+    # rows written without bumping rekap_versi: no tag to validate against
+    _seed_rekap_and_karyawan()
+    params = {"tahun": 2025, "bulan": 1}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.get("/rekap_kehadiran", params=params)
+        r_again = await ac.get("/rekap_kehadiran", params=params, headers={"If-None-Match": "*"})
+
+    assert r.status_code == 200
+    assert "ETag" not in r.headers
+    assert r.headers["Cache-Control"] == "no-cache"
+    assert r_again.status_code == 200
+    assert r_again.json()["count"] == 3
+
+
+@pytest.mark.asyncio
+async def test_rekap_kehadiran_gzip_above_threshold():
+    _seed_rekap_and_karyawan()
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        r = await ac.get("/rekap_kehadiran", params={"tahun": 2025}, headers={"Accept-Encoding": "gzip"})
+        r_small = await ac.get("/rekap_kehadiran", params={"tahun": 1999}, headers={"Accept-Encoding": "gzip"})
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert r.json()["count"] == 6
+    assert "Content-Encoding" not in r_small.headers
@@ -1,4 +1,5 @@
 import pandas as pd
+import pytest
 
 from app.presensi import (
     carbon_parse,
@@ -87,3 +88,138 @@ def test_generate_presensi_laporan_basic():
     row = out.iloc[0]
     assert pd.Timestamp(row["jam_masuk"]) == pd.Timestamp("2025-10-01 08:10:00")
     assert pd.Timestamp(row["jam_pulang"]) == pd.Timestamp("2025-10-01 17:05:00")
+
+
+def test_merge_rencana_shift_matches_per_row_conversion():
+    from app.shifts import compile_shifts, merge_rencana_shift
+
+    df_shift = pd.DataFrame({
+        'id': [2, 1],
+        'name': ['Siang', 'Pagi'],
+        'masuk_post_time': ['12:00:00', '07:30:00'],
+        'pulang_pre_time': ['20:00:00', '16:00:00'],
+        'jam_masuk': ['2025-01-01 12:00:00', '2025-01-01 07:30:00'],  # absolute, not a time of day
+    })
+    df_rencana = pd.DataFrame({
+        'id': [10, 11, 12, 13],
+        'karyawan_id': [1, 1, 2, 3],
+        'shift_id': [1, 2, 1, 99],
+        'tanggal_masuk': ['2025-01-02', '2025-01-03', '2025-01-02', '2025-01-02'],
+    })
+
+    templates = compile_shifts(df_shift)
+    assert templates.shift_ids.tolist() == [1, 2]
+    assert templates.is_offset.tolist() == [True, True, False]
+
+    merged = merge_rencana_shift(df_rencana, df_shift)
+    assert merged['name'].tolist()[:3] == ['Pagi', 'Siang', 'Pagi'] and pd.isna(merged['name'].iloc[3])
+    assert merged['masuk_post_time'].tolist()[:3] == [
+        pd.Timestamp('2025-01-02 07:30'), pd.Timestamp('2025-01-03 12:00'), pd.Timestamp('2025-01-02 07:30')]
+    assert pd.isna(merged['masuk_post_time'].iloc[3])
+    assert merged['pulang_pre_time'].iloc[1] == pd.Timestamp('2025-01-03 20:00')
+    assert merged['jam_masuk'].iloc[0] == pd.Timestamp('2025-01-01 07:30')
+
+    inner = merge_rencana_shift(df_rencana, df_shift, how='inner')
+    assert inner['id_x'].tolist() == [10, 11, 12]
+
+
+@pytest.mark.parametrize('backend', ['pandas', 'arrow'])
+def test_run_rekap_streamed_matches_in_memory(tmp_path, monkeypatch, backend):
+    from sqlalchemy import create_engine
+    from app import readers, rekap
+
+    if backend == 'arrow':
+        pytest.importorskip('pyarrow')
+    # approver_status and catatan are all NULL: the arrow reader must not hand them over as null[pyarrow]
+    monkeypatch.setattr(readers, 'READER_BACKEND', backend)
+
+    remote = create_engine(f"sqlite:///{tmp_path / 'remote.db'}")
+    days = pd.date_range('2025-03-03', periods=5, freq='D')
+    karyawan = [3, 5, 8, 13, 21]
+    pd.DataFrame({'id': karyawan + [34], 'instansi_id': [7] * 5 + [9], 'nip': [str(k) for k in karyawan + [34]]}) \
+        .to_sql('presensi_karyawan', remote, index=False)
+    pd.DataFrame({'id': [1], 'masuk_post_time': ['07:30:00'], 'pulang_pre_time': ['16:00:00']}) \
+        .to_sql('presensi_shift', remote, index=False)
+    pd.DataFrame({
+        'id': range(1, 31),
+        'karyawan_id': [k for k in karyawan + [34] for _ in days],
+        'instansi_id': [7] * 25 + [9] * 5,
+        'shift_id': 1,
+        'tanggal_masuk': [d.strftime('%Y-%m-%d') for _ in range(6) for d in days],
+    }).to_sql('presensi_rencana_shift', remote, index=False)
+    kirim = []
+    for i, k in enumerate(karyawan):
+        for j, d in enumerate(days[: 5 - i]):
+            kirim.append((k, 'M', d + pd.Timedelta(hours=7, minutes=10 * j)))
+            kirim.append((k, 'P', d + pd.Timedelta(hours=15 + j)))
+    pd.DataFrame({
+        'id': range(1, len(kirim) + 1),
+        'karyawan_id': [k for k, _, _ in kirim],
+        'instansi_id': 7,
+        'jenis': [j for _, j, _ in kirim],
+        'tanggal_masuk': [t.strftime('%Y-%m-%d %H:%M:%S') for _, _, t in kirim],
+        'tanggal_kirim': [t.strftime('%Y-%m-%d %H:%M:%S') for _, _, t in kirim],
+        'approver_status': None,
+        'catatan': None,
+    }).to_sql('presensi_kehadiran', remote, index=False)
+    pd.DataFrame({'id': [1], 'karyawan_id': [8], 'tanggal_mulai': ['2025-03-05'], 'tanggal_selesai': ['2025-03-06'], 'type': ['S']}) \
+        .to_sql('presensi_absen', remote, index=False)
+    remote.dispose()
+
+    saved, refreshed = [], []
+    monkeypatch.setattr(rekap, 'simpan_rekap_bulanan', lambda df, refresh=True: saved.append(df['karyawan_id'].tolist()))
+    monkeypatch.setattr(rekap, 'refresh_rekap_bulanan', lambda df: refreshed.append(df['karyawan_id'].tolist()))
+    connections = []
+    source_connection = rekap._source_connection
+    monkeypatch.setattr(rekap, '_source_connection', lambda *a: connections.append(a) or source_connection(*a))
+    url = f"sqlite:///{tmp_path / 'remote.db'}"
+
+    full = rekap.run_rekap(7, 3, 2025, remote_url=url, stream=False)
+    assert saved == [karyawan] and refreshed == []
+    saved.clear()
+    streamed = rekap.run_rekap(7, 3, 2025, remote_url=url, stream=True, stream_batch=2)
+    assert saved == [[3, 5], [8, 13], [21]]
+    # rekap_versi, rollup, running totals and cubes are refreshed once, for every batch
+    assert refreshed == [karyawan]
+    pd.testing.assert_frame_equal(streamed, full)
+    assert streamed.set_index('karyawan_id').loc[8, 'izin_sakit'] == 2
+
+    # above the threshold the pre-fetch count switches streaming on
+    saved.clear()
+    rekap.run_rekap(7, 3, 2025, remote_url=url, stream_threshold=29, stream_batch=3)
+    assert saved == [[3, 5, 8], [13, 21]]
+    saved.clear()
+    rekap.run_rekap(7, 3, 2025, remote_url=url, stream_threshold=30, stream_batch=3)
+    assert saved == [karyawan]
+    # the count and the in-memory fetch share one source connection
+    assert len(connections) == 4
+
+    # kirim_kembar sees karyawan of different batches from the compact carry-over
+    from app import anomali
+
+    scanned = []
+    monkeypatch.setattr(anomali, 'simpan_anomali', lambda conn, flags, *a, **k: scanned.append(flags))
+    for options in ({'stream': False}, {'stream': True, 'stream_batch': 2}):
+        rekap.run_rekap(7, 3, 2025, remote_url=url, scan_anomali=True, **options)
+    kembar = [f[f['jenis_anomali'] == 'kirim_kembar'].sort_values(['waktu', 'karyawan_id']).reset_index(drop=True) for f in scanned]
+    assert len(kembar[0]) > 0 and set(kembar[0]['karyawan_id']) == set(karyawan)
+    pd.testing.assert_frame_equal(kembar[1], kembar[0], check_dtype=False)
+
+
+def test_rekap_falls_back_only_on_missing_column(tmp_path):
+    from sqlalchemy import create_engine
+    from app import rekap
+
+    url = f"sqlite:///{tmp_path / 'remote.db'}"
+    remote = create_engine(url)
+    pd.DataFrame({'id': [1], 'karyawan_id': [3], 'tanggal_masuk': ['2025-03-03 07:00:00']}).to_sql('presensi_kehadiran', remote, index=False)
+    with remote.connect() as conn:
+        # a source without instansi_id is read whole ...
+        with pytest.raises(rekap._QUERY_ERRORS) as error:
+            rekap._count_kehadiran(conn, 7, '2025-03-01', '2025-03-31')
+        assert rekap._missing_column(error.value)
+        # ... other errors (here a missing table) are raised
+        with pytest.raises(rekap._QUERY_ERRORS) as error:
+            rekap._fetch_tables(conn, url, 7, '2025-03-01', '2025-03-31')
+        assert not rekap._missing_column(error.value)
+    remote.dispose()